@@ -1,7 +1,24 @@
 from aiocrawler.crawler import AioCrawler
+from aiocrawler.request import Request
+from aiocrawler.executors import offload
+from aiocrawler.throttle import AimdController
+from aiocrawler.stats import CrawlStats
+from aiocrawler.resolver import CachingResolver
+from aiocrawler.pipeline import ItemPipeline, JsonLinesSink, CsvSink, \
+    SqliteSink
+from aiocrawler.checkpoint import Checkpoint
+from aiocrawler.schema import Schema, Field
+from aiocrawler.selectors import XPath, Css, JsonPath
+from aiocrawler.links import LinkExtractor
+from aiocrawler.profiles import HeaderProfilePool
+from aiocrawler.proxies import ProxyPool
 from aiocrawler import responses
 
 
 __version__ = '0.0.2-dev'
 
-__all__ = [AioCrawler] + responses.__all__
+__all__ = [AioCrawler, Request, offload, AimdController,
+           CrawlStats, CachingResolver, ItemPipeline, JsonLinesSink, CsvSink,
+           SqliteSink, Checkpoint, Schema, Field, XPath, Css,
+           JsonPath, LinkExtractor, HeaderProfilePool,
+           ProxyPool] + responses.__all__
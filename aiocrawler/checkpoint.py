@@ -0,0 +1,298 @@
+import os
+import pickle
+import struct
+import sys
+import threading
+import zlib
+from array import array
+from collections import Counter
+from pathlib import Path
+from aiocrawler.request import Request
+from aiocrawler.exceptions import CheckpointError
+from aiocrawler.constants import CHECKPOINT_COMPACT_RECORDS
+
+# log records: a request queued, finished, or given up on.
+RECORD_QUEUED = 'q'
+RECORD_DONE = 'd'
+RECORD_FAILED = 'f'
+
+SNAPSHOT_FILE = 'snapshot'
+LOG_FILE = 'log'
+# 8 bytes length of the compressed pending and failed requests and host
+# request counts, then the seen fingerprints as little-endian uint64.
+_SNAPSHOT_HEADER = struct.Struct('>Q')
+
+
+def _fingerprints_bytes(fingerprints):
+    if sys.byteorder == 'big':
+        fingerprints = array('Q', fingerprints)
+        fingerprints.byteswap()
+    return fingerprints.tobytes()
+
+
+def _fingerprints(data):
+    fingerprints = array('Q')
+    fingerprints.frombytes(data)
+    if sys.byteorder == 'big':
+        fingerprints.byteswap()
+    return fingerprints
+
+
+class CheckpointState(object):
+    __slots__ = ('pending', 'failed', 'seen', 'hosts')
+
+    def __init__(self, pending, failed, seen, hosts):
+        # fingerprint -> serialized Request.
+        self.pending = pending
+        self.failed = failed
+        self.seen = seen
+        # requests admitted per host, against the host budgets.
+        self.hosts = hosts
+
+    @classmethod
+    def empty(cls):
+        return cls({}, {}, array('Q'), Counter())
+
+
+class Checkpoint(object):
+    """Crash-safe record of the crawl state in directory path.
+
+    Queued, finished and failed requests are appended to a log, flushed
+    every few seconds. The log is compacted into a snapshot of the pending
+    and failed requests and of the seen fingerprints once it holds
+    compact_records records, and when the crawl ends. A torn record at the
+    end of the log(crash while writing) is ignored.
+
+    save() does the same as flush() without blocking the event loop, the
+    pickling, compression and fsync run in an executor.
+    """
+
+    def __init__(self, path, compact_records=CHECKPOINT_COMPACT_RECORDS):
+        self.path = Path(path)
+        self.compact_records = compact_records
+        self._state = None
+        self._records = []
+        self._log = None
+        self._log_records = 0
+        # fingerprints given up on since they were taken from the frontier.
+        self._failing = set()
+        # file writes run in an executor thread as well as in close().
+        self._write_lock = threading.Lock()
+        self._closed = False
+
+    def _snapshot_path(self):
+        return str(self.path / SNAPSHOT_FILE)
+
+    def _log_path(self):
+        return str(self.path / LOG_FILE)
+
+    def _read_snapshot(self):
+        try:
+            with open(self._snapshot_path(), 'rb') as fd:
+                data = fd.read()
+        except FileNotFoundError:
+            return CheckpointState.empty()
+        length, = _SNAPSHOT_HEADER.unpack_from(data)
+        requests_end = _SNAPSHOT_HEADER.size + length
+        pending, failed, hosts = pickle.loads(zlib.decompress(
+            data[_SNAPSHOT_HEADER.size:requests_end]))
+        return CheckpointState(
+            pending, failed, _fingerprints(data[requests_end:]), hosts)
+
+    def _replay_log(self, state):
+        try:
+            fd = open(self._log_path(), 'rb')
+        except FileNotFoundError:
+            return
+        with fd:
+            while True:
+                try:
+                    kind, payload = pickle.load(fd)
+                except EOFError:
+                    break
+                except (pickle.UnpicklingError, ValueError, TypeError):
+                    # torn record, open() rewrites the log without it.
+                    break
+                self._apply(state, kind, payload)
+
+    @staticmethod
+    def _apply(state, kind, payload):
+        if kind == RECORD_QUEUED:
+            fingerprint, data, host = payload
+            state.pending[fingerprint] = data
+            if host is not None:
+                state.seen.append(fingerprint)
+                state.hosts[host] += 1
+        elif kind == RECORD_DONE:
+            state.pending.pop(payload, None)
+            state.failed.pop(payload, None)
+        elif kind == RECORD_FAILED:
+            fingerprint, data = payload
+            state.pending.pop(fingerprint, None)
+            state.failed[fingerprint] = data
+
+    def open(self, resume=True):
+        """Load the last checkpoint(a fresh one unless resume), return its
+        state.
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        if resume:
+            self._state = self._read_snapshot()
+            self._replay_log(self._state)
+        else:
+            self._state = CheckpointState.empty()
+        self._closed = False
+        # start over from a compact snapshot and an empty log.
+        self.compact()
+        return self._state
+
+    def _append(self, kind, payload):
+        self._records.append((kind, payload))
+
+    def queued(self, request, seen=True):
+        """A request entered the frontier, seen: for the first time(it
+        counts against the budget of its host then).
+        """
+        fingerprint = request.fingerprint()
+        data = request.to_dict()
+        self._state.pending[fingerprint] = data
+        host = None
+        if seen:
+            host = request.host
+            self._state.seen.append(fingerprint)
+            self._state.hosts[host] += 1
+        self._append(RECORD_QUEUED, (fingerprint, data, host))
+
+    def failed(self, request):
+        fingerprint = request.fingerprint()
+        data = request.to_dict()
+        self._failing.add(fingerprint)
+        self._state.pending.pop(fingerprint, None)
+        self._state.failed[fingerprint] = data
+        self._append(RECORD_FAILED, (fingerprint, data))
+
+    def done(self, request):
+        """The request will not be retried(again)."""
+        fingerprint = request.fingerprint()
+        if fingerprint in self._failing:
+            self._failing.discard(fingerprint)
+            return
+        self._state.pending.pop(fingerprint, None)
+        self._state.failed.pop(fingerprint, None)
+        self._append(RECORD_DONE, fingerprint)
+
+    def flush(self):
+        """Append the buffered records to the log, compact it when it has
+        grown too long.
+        """
+        records, self._records = self._records, []
+        unpicklable = self._write_log(records) if records else ()
+        self._forget(unpicklable)
+        if self._log_records >= self.compact_records:
+            self.compact()
+        self._check(unpicklable)
+
+    async def save(self, loop):
+        """flush() in the default executor of loop."""
+        records, self._records = self._records, []
+        unpicklable = ()
+        if records:
+            unpicklable = await loop.run_in_executor(
+                None, self._write_log, records)
+        self._forget(unpicklable)
+        if self._log_records >= self.compact_records:
+            # records from now on go to the log which follows it.
+            await loop.run_in_executor(
+                None, self._write_snapshot, self._copy_state())
+        self._check(unpicklable)
+
+    def _forget(self, records):
+        # or every snapshot would fail on them.
+        for _, payload in records:
+            self._state.pending.pop(payload[0], None)
+            self._state.failed.pop(payload[0], None)
+
+    @staticmethod
+    def _check(records):
+        if records:
+            raise CheckpointError(
+                "{} requests left out of the checkpoint, their kwargs do "
+                "not pickle: {}".format(len(records), ", ".join(
+                    payload[1]['url'] for _, payload in records[:3])))
+
+    def compact(self):
+        """Write the whole state as a new snapshot and empty the log."""
+        self._records = []
+        self._write_snapshot(self._state)
+
+    def _copy_state(self):
+        # cheap copies on the loop, a thread must not iterate live dicts.
+        state = self._state
+        return CheckpointState(dict(state.pending), dict(state.failed),
+                               array('Q', state.seen), Counter(state.hosts))
+
+    def _write_log(self, records):
+        """Append records to the log, return the ones which do not
+        pickle.
+        """
+        chunks, unpicklable = [], []
+        for record in records:
+            try:
+                chunks.append(pickle.dumps(record, pickle.HIGHEST_PROTOCOL))
+            except Exception:
+                unpicklable.append(record)
+        data = b"".join(chunks)
+        with self._write_lock:
+            # close() has compacted everything already.
+            if self._closed:
+                return unpicklable
+            if self._log is None:
+                self._log = open(self._log_path(), 'ab')
+            self._log.write(data)
+            self._log.flush()
+            os.fsync(self._log.fileno())
+            self._log_records += len(chunks)
+        return unpicklable
+
+    def _write_snapshot(self, state):
+        requests = zlib.compress(pickle.dumps(
+            (state.pending, state.failed, state.hosts),
+            pickle.HIGHEST_PROTOCOL))
+        seen = _fingerprints_bytes(state.seen)
+        with self._write_lock:
+            if self._closed:
+                return
+            tmp_path = self._snapshot_path() + '.tmp'
+            with open(tmp_path, 'wb') as fd:
+                fd.write(_SNAPSHOT_HEADER.pack(len(requests)))
+                fd.write(requests)
+                fd.write(seen)
+                fd.flush()
+                os.fsync(fd.fileno())
+            os.replace(tmp_path, self._snapshot_path())
+            if self._log is not None:
+                self._log.close()
+            # the snapshot has all of it now.
+            self._log = open(self._log_path(), 'wb')
+            self._log_records = 0
+
+    def close(self):
+        if self._state is None:
+            return
+        error = None
+        try:
+            self.flush()
+        except CheckpointError as e:
+            # they are left out, the rest is saved.
+            error = e
+        self.compact()
+        with self._write_lock:
+            self._closed = True
+            self._log.close()
+            self._log = None
+        if error is not None:
+            raise error
+
+    @staticmethod
+    def requests(data, parsers):
+        return [Request.from_dict(item, parsers) for item in data.values()]
@@ -0,0 +1,67 @@
+import click
+
+
+def _split(value, cast=str):
+    return tuple(cast(item) for item in value.split(',') if item)
+
+
+@click.group()
+def main():
+    """AioCrawler command line."""
+
+
+@main.command()
+@click.option('--concurrency', '-c', default='10,50,100',
+              help="Comma separated concurrency levels to sweep.")
+@click.option('--modes', default='get,download', help="get and/or download.")
+@click.option('--parsers', default='html,json,xml,stream',
+              help="Parsers of the get mode.")
+@click.option('--backends', default='memory',
+              help="Queue backends: memory and/or redis.")
+@click.option('--requests', '-n', default=1000,
+              help="Requests per scenario.")
+@click.option('--latency', default=0.0, help="Server latency(seconds).")
+@click.option('--size', default=10240, help="Page size(bytes).")
+@click.option('--error-rate', default=0.0, help="Share of 503 responses.")
+@click.option('--file-size', default=10 << 20,
+              help="Size of the downloaded files(bytes).")
+@click.option('--redis', default='localhost:6379',
+              help="host:port of the redis backend.")
+@click.option('--output', '-o', default=None, type=click.Path(),
+              help="Save the results as json.")
+@click.option('--compare', default=None, type=click.Path(exists=True),
+              help="Json results of a previous run to compare with.")
+def bench(concurrency, modes, parsers, backends, requests, latency, size,
+          error_rate, file_size, redis, output, compare):
+    """Benchmark the crawler against a local http server."""
+    try:
+        from benchmarks import runner
+    except ImportError as e:
+        # only a missing benchmarks package, not an error inside it.
+        if e.name != 'benchmarks':
+            raise
+        raise click.ClickException(
+            "The benchmarks are not installed, run from a source checkout.")
+    for name, values, known in (('mode', modes, runner.MODES),
+                                ('parser', parsers, runner.PARSERS),
+                                ('backend', backends, runner.BACKENDS)):
+        unknown = set(_split(values)) - set(known)
+        if unknown:
+            raise click.BadParameter("Unknown {}: {}".format(
+                name, ", ".join(sorted(unknown))))
+    host, _, port = redis.partition(':')
+    scenarios = list(runner.scenarios(
+        _split(concurrency, int), _split(modes), _split(parsers),
+        _split(backends), requests, file_size,
+        redis={'host': host, 'port': int(port or 6379)}))
+    report = runner.run(scenarios, latency=latency, size=size,
+                        error_rate=error_rate, echo=click.echo)
+    if output:
+        runner.save(report, output)
+    if compare:
+        for line in runner.compare(report, runner.load(compare)):
+            click.echo(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,11 +3,64 @@ import os
 
 # aio download buffer chunk size: 500kb
 DOWNLOAD_CHUNK_SIZE = 512000
+# segmented downloads use ranges of at least 4MB.
+DOWNLOAD_MIN_SEGMENT_SIZE = 4 << 20
+# progress of a download is saved at most once a second, and when a
+# segment ends or fails.
+DOWNLOAD_STATE_INTERVAL = 1.0
+
+# streaming responses parse the body in chunks of 64kb.
+STREAM_CHUNK_SIZE = 65536
 
 DEFAULT_TIMEOUT = 20
 DEFAULT_CONCURRENCY = 20
 DEFAULT_MAX_TRIES = 3
 
+# Failed requests are retried in min(max, base * 2**tries) seconds, with
+# full jitter, on connection errors and these statuses('5xx': any 5xx).
+DEFAULT_RETRY_BACKOFF = 1
+DEFAULT_RETRY_BACKOFF_MAX = 60
+RETRY_STATUS_CODES = ('5xx', 408, 429)
+
+# Politeness: max in-flight requests per host and the min delay(seconds)
+# between two request starts on the same host.
+DEFAULT_CONCURRENCY_PER_HOST = 8
+DEFAULT_HOST_DELAY = 0
+
+# Url sources are expanded lazily while the frontier holds fewer requests
+# than this, at most FRONTIER_FILL_BATCH of them per get().
+DEFAULT_MAX_FRONTIER_SIZE = 10000
+FRONTIER_FILL_BATCH = 100
+
+# Adaptive concurrency: limits are judged on the last 50 requests(10 at
+# least), decreased at most once per second, hosts paused for at most 10
+# minutes by Retry-After. The limits of hosts not requested for 5 minutes
+# are dropped.
+AIMD_LATENCY_WINDOW = 50
+AIMD_MIN_SAMPLES = 10
+AIMD_COOLDOWN = 1
+AIMD_HOST_IDLE = 300
+MAX_RETRY_AFTER = 600
+
+# DNS answers are cached 5 minutes(failures 10 seconds), up to 65536 hosts.
+# At most 32 prefetch lookups run at once, 1000 wait.
+DEFAULT_DNS_CACHE_TTL = 300
+DNS_NEGATIVE_CACHE_TTL = 10
+DNS_CACHE_MAX_SIZE = 65536
+DNS_PREFETCH_CONCURRENCY = 32
+DNS_PREFETCH_PENDING = 1000
+
+# Item sinks write batches of 1000 items, or what they have after a second,
+# and block the parsers while 10000 items wait.
+DEFAULT_SINK_BATCH_SIZE = 1000
+DEFAULT_SINK_FLUSH_INTERVAL = 1
+DEFAULT_SINK_MAX_BUFFER = 10000
+
+# Stats histograms keep 2**5 buckets per power of two(~3% error), and are
+# summarized by these quantiles.
+HISTOGRAM_SUB_BUCKET_BITS = 5
+STATS_QUANTILES = (0.5, 0.9, 0.99)
+
 WORKING_DIR = os.getcwd()
 
 
@@ -25,11 +78,99 @@ AIOHTTP_AUTO_HEADERS = ("User-Agent", "Content-Type")
 
 # if response.status not in the set, drop the response.
 NORMAL_STATUS_CODES = (200, 201)
+STATUS_NOT_MODIFIED = 304
+# statuses telling the server is overloaded or rate limiting.
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+# http cache: evict the oldest entries beyond 1GB or 7 days.
+DEFAULT_HTTP_CACHE_MAX_SIZE = 1 << 30
+DEFAULT_HTTP_CACHE_MAX_AGE = 7 * 24 * 3600
 
+# response charsets are sniffed from the first KB of the body, guessed from
+# its first 64KB at worst, and learned for up to 10000 hosts.
+CHARSET_SNIFF_SIZE = 1024
+CHARSET_DETECT_SIZE = 65536
+CHARSET_CACHE_MAX_SIZE = 10000
+
+# compiled xpaths and translated css rules kept for reuse.
+SELECTOR_CACHE_SIZE = 1024
+
+# links to files of these extensions are not followed.
+IGNORED_EXTENSIONS = frozenset((
+    # images
+    'bmp', 'gif', 'ico', 'jpeg', 'jpg', 'png', 'svg', 'tif', 'tiff', 'webp',
+    # audio and video
+    'aac', 'avi', 'flac', 'flv', 'm4a', 'm4v', 'mkv', 'mov', 'mp3', 'mp4',
+    'mpeg', 'mpg', 'ogg', 'wav', 'webm', 'wma', 'wmv',
+    # documents
+    'doc', 'docx', 'odp', 'ods', 'odt', 'pdf', 'ppt', 'pptx', 'ps', 'xls',
+    'xlsx',
+    # archives and binaries
+    '7z', 'apk', 'bin', 'bz2', 'deb', 'dmg', 'exe', 'gz', 'iso', 'jar',
+    'msi', 'rar', 'rpm', 'tar', 'tgz', 'xz', 'zip',
+    # assets
+    'css', 'eot', 'js', 'otf', 'ttf', 'woff', 'woff2',
+))
+
+# header profiles generated by a HeaderProfilePool.
+DEFAULT_HEADER_PROFILES = 100
+
+# proxy pools: 10 requests in flight per proxy. Latency and error rate are
+# moving averages(weight 0.2 for the last request), an error rate of 10%
+# doubles the score. 3 failures in a row quarantine a proxy 30s, doubled
+# after each quarantine in a row, up to 30 minutes. Acquiring draws 4
+# proxies at most before scanning them, and waits 1s at most between two
+# looks when none is usable. A crawler request finding every proxy busy
+# goes back to the frontier for 50ms.
+DEFAULT_PROXY_CONCURRENCY = 10
+PROXY_EWMA_ALPHA = 0.2
+PROXY_ERROR_PENALTY = 10
+PROXY_MAX_FAILURES = 3
+PROXY_QUARANTINE = 30
+PROXY_QUARANTINE_MAX = 1800
+PROXY_DRAWS = 4
+PROXY_IDLE_WAKE = 1
+PROXY_BUSY_WAIT = 0.05
+# statuses blamed on the proxy: authentication and gateway errors. The
+# 403/429/503 of a site go through retry_statuses and throttling.
+PROXY_ERROR_STATUSES = (407, 502, 504)
+
+# robots.txt rules are cached for a day(5 minutes when it can not be
+# read), for up to 10000 sites. At most 500KB of it are read, Crawl-delay
+# is capped to a minute.
+ROBOTS_CACHE_TTL = 24 * 3600
+ROBOTS_ERROR_TTL = 300
+ROBOTS_CACHE_MAX_SIZE = 10000
+ROBOTS_MAX_SIZE = 500 << 10
+MAX_CRAWL_DELAY = 60
+
+# crawl checkpoints: the log is flushed every 5 seconds and compacted into
+# a snapshot every 100000 records.
+DEFAULT_CHECKPOINT_INTERVAL = 5
+CHECKPOINT_COMPACT_RECORDS = 100000
 
 # sleep for 0.3s when aioredis queue raise QueueFull.
 QUEUE_BLOCK_SLEEP_INTERVAL = 0.3
 
+# max items sent to redis in one command.
+REDIS_BATCH_SIZE = 1000
+
+# max requests taken from a shard's inbox per get().
+SHARD_INBOX_BATCH = 100
+
 # Connection pool size.
 AIOREDIS_POOL_MIN_SIZE = 1
 AIOREDIS_POOL_MAX_SIZE = 5
+
+# Shared(redis) frontier: requests leased from redis go back to the queue
+# if they are not acked within this many seconds(worker crashed).
+DEFAULT_LEASE_TIMEOUT = 300
+# leases held by a node are renewed this many times per lease timeout.
+LEASE_RENEWALS = 3
+# max requests leased from redis but not started yet on one node.
+DEFAULT_REDIS_PREFETCH = 50
+
+# log_queue: at most 10000 records wait for the logging thread, the next
+# ones are dropped rather than blocking the loop.
+LOG_QUEUE_SIZE = 10000
@@ -1,18 +1,40 @@
 import asyncio
 import async_timeout
 import aiohttp
-import aiofiles
+import functools
 import inspect
 import os
+import random
+import threading
 from datetime import datetime
 from urllib import parse as urlparse
 from pathlib import Path
-from aiocrawler.responses import wrap_response
-from aiocrawler.logger import create_logger
-from aiocrawler.constants import DOWNLOAD_CHUNK_SIZE, WORKING_DIR, \
+from aiocrawler.responses import wrap_response, StreamResponse
+from aiocrawler.logger import create_logger, close_logger
+from aiocrawler.scheduler import HostScheduler, get_host_key, ORDER_DFS
+from aiocrawler.request import Request
+from aiocrawler.profiles import HeaderProfilePool
+from aiocrawler.proxies import ProxyPool
+from aiocrawler.dupefilter import MemorySeenStore
+from aiocrawler.sharding import ShardedScheduler, run_processes
+from aiocrawler.executors import create_executor, call_parser
+from aiocrawler.httpcache import HttpCache
+from aiocrawler.checkpoint import Checkpoint
+from aiocrawler.robots import RobotsCache
+from aiocrawler.sitemaps import SitemapUrls
+from aiocrawler.downloads import FileDownload, parse_checksum
+from aiocrawler.exceptions import DownloadError, DownloadStatusError
+from aiocrawler.throttle import parse_retry_after
+from aiocrawler.stats import PHASE_TRANSFER, PHASE_PARSE, PHASE_TOTAL
+from aiocrawler.constants import WORKING_DIR, \
     METHOD_DELETE, METHOD_GET, METHOD_HEAD, METHOD_OPTIONS, METHOD_PATCH, \
     METHOD_POST, METHOD_PUT, DEFAULT_TIMEOUT, DEFAULT_CONCURRENCY, \
-    DEFAULT_MAX_TRIES, AIOHTTP_AUTO_HEADERS, NORMAL_STATUS_CODES
+    DEFAULT_MAX_TRIES, AIOHTTP_AUTO_HEADERS, NORMAL_STATUS_CODES, \
+    STATUS_NOT_MODIFIED, \
+    DEFAULT_CONCURRENCY_PER_HOST, DEFAULT_HOST_DELAY, \
+    DEFAULT_MAX_FRONTIER_SIZE, DEFAULT_RETRY_BACKOFF, \
+    DEFAULT_RETRY_BACKOFF_MAX, RETRY_STATUS_CODES, MAX_RETRY_AFTER, \
+    DEFAULT_CHECKPOINT_INTERVAL, ROBOTS_MAX_SIZE, PROXY_ERROR_STATUSES
 
 try:
     import uvloop as async_loop
@@ -23,34 +45,306 @@ except ImportError:
 class AioCrawler(object):
     name = None
     concurrency = DEFAULT_CONCURRENCY
+    concurrency_per_host = DEFAULT_CONCURRENCY_PER_HOST
+    host_delay = DEFAULT_HOST_DELAY
+    max_frontier_size = DEFAULT_MAX_FRONTIER_SIZE
+    # order of the requests of a host: 'dfs', 'bfs' or 'best'(highest
+    # Request.priority first, see follow()).
+    frontier_order = ORDER_DFS
+    # links deeper than max_depth are not followed, at most host_budget
+    # requests are made per host key(per domain with a domain host_key).
+    max_depth = None
+    host_budget = None
+    # obey robots.txt: disallowed requests are dropped, Crawl-delay is the
+    # delay of the host. robots_user_agent is the product token of the
+    # crawler in robots.txt, None for the '*' rules only.
+    robots = False
+    robots_user_agent = None
+    # AioRedisQueue connection kwargs(host, port, db, password...), when set
+    # the frontier is shared in redis by every crawler with the same name,
+    # see run(resume=True).
+    redis = None
+    # seen-store class(or instance) of request fingerprints, None disables
+    # deduplication.
+    seen_store = MemorySeenStore
+    # run sync parsers in a 'thread' or 'process' pool instead of the loop,
+    # see also aiocrawler.executors.offload for a per-parser setting.
+    parse_executor = None
+    parse_workers = None
+    # AimdController class(or instance) adapting the global and per-host
+    # concurrency at runtime, concurrency is then only the starting point.
+    concurrency_controller = None
+    # CrawlStats class(or instance) timing every request phase per host,
+    # snapshots go to on_stats every stats_interval seconds and prometheus
+    # text is served on stats_address, a (host, port) tuple.
+    stats = None
+    stats_interval = None
+    stats_address = None
+    # aiohttp.TCPConnector kwargs(limit, limit_per_host, keepalive_timeout,
+    # ttl_dns_cache, family, local_addr, ssl...) or a connector instance.
+    connector = None
+    # CachingResolver class(or instance): DNS answers cached by the crawler
+    # and prefetched for the hosts entering the frontier.
+    dns_cache = None
+    # an existing ClientSession to share, the crawler does not close it.
+    session = None
+    # ItemPipeline the items(dicts) returned or yielded by parsers go to.
+    item_pipeline = None
+    # on-disk HTTP cache directory(or HttpCache instance), GET responses
+    # are stored and revalidated with If-None-Match/If-Modified-Since.
+    http_cache = None
+    # directory(or Checkpoint instance) where the pending requests, the
+    # seen fingerprints and the failed requests are saved every
+    # checkpoint_interval seconds, see run(resume=True).
+    checkpoint = None
+    checkpoint_interval = DEFAULT_CHECKPOINT_INTERVAL
     timeout = DEFAULT_TIMEOUT
     max_tries = DEFAULT_MAX_TRIES
+    # retries wait in the scheduler, with exponential backoff and jitter.
+    retry_backoff = DEFAULT_RETRY_BACKOFF
+    retry_backoff_max = DEFAULT_RETRY_BACKOFF_MAX
+    # statuses worth a retry, ints or classes like '5xx'.
+    retry_statuses = RETRY_STATUS_CODES
+    # a dict, a factory called for each request, or a HeaderProfilePool
+    # (profiles built once, sticky per host...).
     headers = None
+    # proxy urls(or a ProxyPool instance) handed out per request by health,
+    # a request failed through a proxy is retried through another one.
+    # A proxy= passed to get(), post()... is used as is.
+    proxies = None
     loop = None
     logger = None
     debug = False
+    # log_queue formats and writes the records in a thread, off the loop.
+    # log_json writes them as json lines with their fields(url, status,
+    # tries...), to stdout if True, else to that file path. log_sample
+    # (event -> fraction kept) and log_rate(event -> records per second)
+    # thin out events: 'response', 'retry', 'cache', 'download', 'robots'.
+    log_queue = False
+    log_json = None
+    log_sample = None
+    log_rate = None
 
-    _failed_urls = set()
-    _seen_urls = set()
+    # (shard, shards, inboxes, pending) in a run(processes=N) child.
+    _shard = None
+    # set by run().
+    _resume = False
+    _failed_only = False
 
     def __init__(self, **kwargs):
+        # the worker processes of run(processes=N) are built from them.
+        self._init_kwargs = kwargs
+        # before the logger, which they may configure.
+        self.__dict__.update(kwargs)
         self.name = getattr(self, 'name') or self.__class__.__name__
 
         self.loop = getattr(self, 'loop') or async_loop.new_event_loop()
         asyncio.set_event_loop(self.loop)
 
-        self.ac_session = aiohttp.ClientSession(loop=self.loop)
+        self.logger = getattr(self, 'logger') or create_logger(self)
 
-        # Lifo Queue for Stashing all tasks to be done.
-        self._tasks_que = asyncio.LifoQueue(loop=self.loop)
+        self._stats = self.stats
+        if callable(self._stats):
+            self._stats = self._stats()
+        if self._stats is not None:
+            self._stats.bind(self)
+        self._resolver = self.dns_cache
+        if callable(self._resolver):
+            self._resolver = self._resolver(loop=self.loop)
+        self.ac_session = self._create_session()
+        self._robots = None
+        if self.robots:
+            self._robots = RobotsCache(
+                self._fetch_robots, self.robots_user_agent, loop=self.loop)
 
-        self.logger = getattr(self, 'logger') or create_logger(self)
+        self._success_count = 0
+        self._failed_urls = set()
+        self._executors = {}
+        self._loop_thread = threading.current_thread()
+        self._proxies = self.proxies
+        if isinstance(self._proxies, (str, list, tuple)):
+            self._proxies = ProxyPool(self._proxies)
+        self._http_cache = self.http_cache
+        if isinstance(self._http_cache, (str, Path)):
+            self._http_cache = HttpCache(self._http_cache)
+        seen_store = self.seen_store
+        if callable(seen_store):
+            seen_store = seen_store()
+        self._checkpoint = self.checkpoint
+        if isinstance(self._checkpoint, (str, Path)):
+            path = Path(self._checkpoint)
+            if self._shard is not None:
+                path = path / "shard-{}".format(self._shard[0])
+            self._checkpoint = Checkpoint(path)
+        # parsers already warned about, see _checkpoint_queued.
+        self._unrestorable_parsers = set()
+        if self._checkpoint is not None and self.redis is not None:
+            raise ValueError("the redis frontier is persistent already, "
+                             "checkpoint is for in-process crawls")
 
-        self.__dict__.update(kwargs)
+        # Per-host queues for stashing all tasks to be done.
+        self._tasks_que = self._create_scheduler(
+            concurrency_per_host=self.concurrency_per_host,
+            delay=self.host_delay, max_size=self.max_frontier_size,
+            host_key=self.host_key, seen=seen_store,
+            order=self.frontier_order, max_depth=self.max_depth,
+            host_budget=self.host_budget,
+            on_new_host=self._on_new_host,
+            on_queued=self._checkpoint and self._checkpoint_queued,
+            admit=self._robots and self._robots_admit,
+            loop=self.loop
+        )
+        controller = self.concurrency_controller
+        if callable(controller):
+            controller = controller()
+        if controller is not None:
+            controller.bind(self._tasks_que, self.concurrency,
+                            self.concurrency_per_host)
+        self._controller = controller
+
+    def _create_session(self):
+        if self.session is not None:
+            return self.session
+        session_kwargs = {}
+        if self._stats is not None:
+            trace_config = self._stats.trace_config()
+            if trace_config is not None:
+                session_kwargs['trace_configs'] = [trace_config]
+        connector = self.connector
+        if connector is None and self._resolver is not None:
+            connector = {}
+        if isinstance(connector, dict):
+            connector = dict(connector)
+            if self._resolver is not None:
+                # the resolver caches already.
+                connector.setdefault('resolver', self._resolver)
+                connector.setdefault('use_dns_cache', False)
+            connector = aiohttp.TCPConnector(loop=self.loop, **connector)
+        if connector is not None:
+            session_kwargs['connector'] = connector
+        if isinstance(self.headers, HeaderProfilePool) and \
+                self.headers.cookies:
+            # cookies are kept per profile, not shared by the session.
+            session_kwargs['cookie_jar'] = aiohttp.DummyCookieJar(
+                loop=self.loop)
+        return aiohttp.ClientSession(loop=self.loop, **session_kwargs)
+
+    def _close_session(self):
+        if self.session is None:
+            self.ac_session.close()
+
+    def _on_new_host(self, url):
+        # DNS answer and robots.txt are ready by the time it is fetched.
+        if self._resolver is not None:
+            self._resolver.prefetch(url, getattr(
+                self.ac_session.connector, 'family', 0))
+        if self._robots is not None:
+            self._robots.prefetch(url)
+
+    async def _side_get(self, url):
+        """GET url outside the frontier(robots.txt, sitemaps) with the
+        header profile, and through a proxy of the pool, of the crawled
+        pages. Raise ClientError(a proxy error status too) or TimeoutError.
+        """
+        kwargs = self._update_kwargs_headers(url)
+        if self._stats is not None:
+            kwargs['trace_request_ctx'] = self.host_key(url)
+        proxy = None
+        if self._proxies is not None:
+            proxy = await self._proxies.acquire()
+            kwargs["proxy"] = proxy.url
+        start_at = self.loop.time()
+        try:
+            with async_timeout.timeout(self.timeout):
+                response = await self.ac_session.get(url, **kwargs)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if proxy is not None:
+                self._proxies.failure(proxy)
+            raise
+        finally:
+            # the body is read out of the proxy's slot.
+            if proxy is not None:
+                self._proxies.release(proxy)
+        if proxy is not None:
+            if response.status in PROXY_ERROR_STATUSES:
+                self._proxies.failure(proxy)
+                response.release()
+                raise aiohttp.ClientError("Proxy {} answered {}".format(
+                    proxy.url, response.status))
+            self._proxies.success(proxy, self.loop.time() - start_at)
+        if isinstance(self.headers, HeaderProfilePool) and \
+                self.headers.cookies:
+            self.headers.update_cookies(url, response)
+        return response
+
+    async def _fetch_robots(self, url):
+        try:
+            with async_timeout.timeout(self.timeout):
+                response = await self._side_get(url)
+                try:
+                    body = b""
+                    while len(body) < ROBOTS_MAX_SIZE:
+                        chunk = await response.content.read(
+                            ROBOTS_MAX_SIZE - len(body))
+                        if not chunk:
+                            break
+                        body += chunk
+                finally:
+                    response.release()
+            if self._stats is not None:
+                self._stats.received(self.host_key(url), len(body))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.logger.debug(
+                "[ROBOTS] %s [%s]", url, e.__class__.__name__,
+                extra={'event': 'robots', 'url': url})
+            return None, ""
+        return response.status, body.decode('utf-8', errors='replace')
+
+    def _robots_admit(self, request):
+        # unknown yet: checked again by the worker.
+        rules = self._robots.cached(request.url)
+        if rules is None or rules.allowed(request.url):
+            return True
+        self.logger.debug(
+            "[%s] %s [Disallowed]", request.method, request.url,
+            extra={'event': 'robots', 'method': request.method,
+                   'url': request.url})
+        return False
+
+    async def _robots_allow(self, request, this_request_url):
+        rules = await self._robots.rules(request.url)
+        if rules.crawl_delay is not None:
+            self._tasks_que.set_host_delay(
+                request.host, max(rules.crawl_delay, self.host_delay))
+        if rules.allowed(this_request_url):
+            return True
+        self.logger.info(
+            "[%s] %s [Disallowed]", request.method, this_request_url,
+            extra={'event': 'robots', 'method': request.method,
+                   'url': this_request_url})
+        return False
+
+    def _create_scheduler(self, **kwargs):
+        if self._shard is not None:
+            return ShardedScheduler(*self._shard, parsers=self, **kwargs)
+        if self.redis is None:
+            return HostScheduler(**kwargs)
+        # queues import the crawler module, import them lazily.
+        from aiocrawler.queues import AioRedisQueue, RedisScheduler
+        queue = AioRedisQueue(self.name, loop=self.loop, **self.redis)
+        return RedisScheduler(queue, parsers=self, logger=self.logger,
+                              **kwargs)
 
     def on_start(self):
         raise NotImplementedError()
 
+    @staticmethod
+    def host_key(url):
+        """Politeness key of the url, override to group by registered
+        domain instead of host.
+        """
+        return get_host_key(url)
+
     @staticmethod
     def get_request_url(url, params):
         if params is None:
@@ -61,9 +355,16 @@ class AioCrawler(object):
         url_parts[4] = urlparse.urlencode(query)
         return urlparse.urlunparse(url_parts)
 
-    def _update_kwargs_headers(self, **kwargs):
+    def _update_kwargs_headers(self, url=None, **kwargs):
         headers = kwargs.get("headers") or self.headers
-        if callable(headers):
+        if isinstance(headers, HeaderProfilePool):
+            kwargs["skip_auto_headers"] = AIOHTTP_AUTO_HEADERS
+            # the url picks the profile of its host or session.
+            kwargs["headers"] = headers(url)
+            if headers.cookies and url is not None and \
+                    "cookies" not in kwargs:
+                kwargs["cookies"] = headers.request_cookies(url)
+        elif callable(headers):
             # avoid aiohttp autogenerates headers
             kwargs["skip_auto_headers"] = AIOHTTP_AUTO_HEADERS
             kwargs["headers"] = headers()
@@ -71,173 +372,642 @@ class AioCrawler(object):
             kwargs["headers"] = headers
         return kwargs
 
-    async def _request(self, url, parser=None, sleep=None,
-                       method=None, file=None, **kwargs):
-        # If url is list, set, or tuple.Then Split the tasks
+    def _schedule(self, url, method=None, parser=None, **kwargs):
+        # parsers running in a thread pool schedule through the loop.
+        if threading.current_thread() is not self._loop_thread:
+            self.loop.call_soon_threadsafe(functools.partial(
+                self._schedule, url, method=method, parser=parser, **kwargs))
+            return
+        # Request options(sleep, file, stream...) are not aiohttp kwargs.
+        # sleep is the min delay before the next request to the same host,
+        # it is waited out by the scheduler, never inside a worker.
+        options = {name: kwargs.pop(name) for name, _ in Request.OPTIONS
+                   if name in kwargs}
+        request = Request(method, url, parser=parser, kwargs=kwargs,
+                          **options)
+        # If url is list, set, generator or async iterable, expand it
+        # lazily while the frontier has room.
         if not isinstance(url, str):
-            if hasattr(url, "__iter__"):
-                for _url in url:
-                    self._tasks_que.put_nowait(self._request(
-                        _url, sleep=sleep, method=method, file=file,
-                        parser=parser, **kwargs
-                    ))
-                return
+            if hasattr(url, "__iter__") or hasattr(url, "__aiter__"):
+                request.url = None
+                return self._tasks_que.add_source(url, request)
             else:
-                url = str(url)
+                request.url = str(url)
+        self._tasks_que.put_nowait(request)
+
+    async def _request(self, request):
+        parser, kwargs = request.parser, request.kwargs
+        this_request_url = self.get_request_url(
+            request.url, kwargs.get('params'))
 
+        if self._robots is not None and \
+                not await self._robots_allow(request, this_request_url):
+            return
+
+        kwargs = self._update_kwargs_headers(this_request_url, **kwargs)
+        if self._stats is not None:
+            # the trace callbacks file the timings under the host.
+            kwargs['trace_request_ctx'] = request.host
+
+        proxy = None
+        if self._proxies is not None and "proxy" not in kwargs:
+            proxy = self._proxies.acquire_nowait(request.failed_proxy)
+            if proxy is None:
+                # wait in the frontier, not holding the slots of its host
+                # and of the crawl. Not a try.
+                self._tasks_que.put_later(
+                    request, self._proxies.wait_time())
+                return True
+            kwargs["proxy"] = proxy.url
+        try:
+            if parser == self._download:
+                return await parser(request, kwargs, this_request_url, proxy)
+            return await self._fetch(request, kwargs, this_request_url, proxy)
+        finally:
+            if proxy is not None:
+                self._proxies.release(proxy)
+
+    async def _fetch(self, request, kwargs, this_request_url, proxy=None):
+        url, parser, method, file = request.url, request.parser, \
+            request.method, request.file
         http_method_request = getattr(self.ac_session, method.lower())
-        this_request_url = self.get_request_url(url, kwargs.get('params'))
+        cache, cached = self._http_cache, None
+        if cache is not None and method == METHOD_GET and file is None \
+                and request.stream is None:
+            cached = await cache.get(request.fingerprint())
+            if cache.offline:
+                if cached is None:
+                    return self.logger.info(
+                        "[%s] %s [NotCached]", method, this_request_url,
+                        extra={'event': 'cache', 'method': method,
+                               'url': this_request_url, 'cached': False})
+                self._success_count += 1
+                self.logger.info(
+                    "[%s] %s [Cached]", method, this_request_url,
+                    extra={'event': 'cache', 'method': method,
+                           'url': this_request_url, 'cached': True})
+                if parser is not None:
+                    await self._parse(request, cached.response())
+                return
+            if cached is not None:
+                kwargs["headers"] = dict(
+                    kwargs.get("headers") or {}, **cached.validators())
+        else:
+            cache = None
 
-        kwargs = self._update_kwargs_headers(**kwargs)
+        # a failed try is retried later, see _retry.
+        start_at = self.loop.time()
+        try:
+            with async_timeout.timeout(self.timeout):
+                response = await http_method_request(url, **kwargs)
+        except aiohttp.ClientError:
+            self._observe(request)
+            self._proxy_failed(request, proxy)
+            return self._retry(request, this_request_url, "ClientError")
+        except asyncio.TimeoutError:
+            self._observe(request)
+            self._proxy_failed(request, proxy)
+            return self._retry(request, this_request_url, "TimeoutError")
 
-        # try max_tries if fail
-        for try_count in range(1, self.max_tries+1):
-            try:
-                with async_timeout.timeout(self.timeout):
-                    response = await http_method_request(url, **kwargs)
-                    self._seen_urls.add(this_request_url)
-                break
-            except aiohttp.ClientError:
-                self.logger.debug("[{}] {} [ClientError][Try:{}]".format(
-                    method, this_request_url, try_count)
-                )
-            except asyncio.TimeoutError:
-                self.logger.debug("[{}] {} [TimeoutError][Try:{}]".format(
-                    method, this_request_url, try_count)
-                )
-            await asyncio.sleep(sleep or 0)
-        else:  # still fail
-            self._failed_urls.add(this_request_url)
-            return self.logger.error("[{}] {} [Failure][Try:{}]".format(
-                method, this_request_url, self.max_tries)
-            )
-
-        self.logger.info("[{}] {} [{} {}]".format(
-            method, this_request_url, response.status, response.reason)
-        )
+        elapsed = self.loop.time() - start_at
+        self._observe(request, elapsed, response)
+        proxy_failed = self._proxy_answered(
+            request, proxy, response.status, elapsed)
+        profiles = request.kwargs.get("headers") or self.headers
+        if isinstance(profiles, HeaderProfilePool) and profiles.cookies:
+            profiles.update_cookies(this_request_url, response)
+        self.logger.info(
+            "[%s] %s [%s %s]", method, this_request_url, response.status,
+            response.reason,
+            extra={'event': 'response', 'method': method,
+                   'url': this_request_url, 'host': request.host,
+                   'status': response.status, 'reason': response.reason,
+                   'tries': request.tries, 'elapsed': elapsed})
 
-        if response.status not in NORMAL_STATUS_CODES:
-            return
+        if self._retryable(response.status) or proxy_failed:
+            retry_after = parse_retry_after(
+                response.headers.get('Retry-After'))
+            response.release()
+            return self._retry(request, this_request_url, response.status,
+                               retry_after)
+        # the final answer, not a try to retry.
+        self._success_count += 1
 
-        if sleep is not None:
-            await asyncio.sleep(sleep)
+        if response.status == STATUS_NOT_MODIFIED and cached is not None:
+            # still fresh, parse the cached body.
+            response.release()
+            cache.touch(request.fingerprint())
+            response = cached.response()
+        elif response.status not in NORMAL_STATUS_CODES:
+            return
+        elif cache is not None:
+            await cache.store(
+                request.fingerprint(), response, await response.read())
 
         if parser is None:
             return
-        if parser is self._download:
-            await parser(response, file)
-            return self.logger.info("[DOWNLOAD]:{}".format(file))
 
+        if request.stream is not None:
+            # records are parsed while the body is downloading.
+            stream_response = StreamResponse(
+                response, request.stream, request.stream_tag,
+                on_chunk=self._byte_counter(request.host))
+            stream_response.request = request
+            try:
+                # a coroutine, an async generator or a plain function.
+                result = parser(stream_response)
+                if inspect.isawaitable(result):
+                    result = await result
+                return await self._handle_result(result, request)
+            finally:
+                response.release()
+
+        await self._parse(request, response)
+        if self._stats is not None:
+            self._stats.record(
+                request.host, PHASE_TOTAL, self.loop.time() - start_at)
+
+    async def _parse(self, request, response):
+        parser = request.parser
+        transfer_at = self.loop.time()
         response = await wrap_response(response)
+        response.request = request
+        parse_at = self.loop.time()
 
         if inspect.iscoroutinefunction(parser) or \
                 inspect.isawaitable(parser):
-            return await parser(response)
+            result = await parser(response)
         else:
-            return parser(response)
+            executor = getattr(parser, 'parse_executor', self.parse_executor)
+            if executor is None:
+                result = call_parser(parser, response)
+            else:
+                result = await self.loop.run_in_executor(
+                    self._get_executor(executor), call_parser,
+                    parser, response)
+        if self._stats is not None:
+            self._stats.record(
+                request.host, PHASE_TRANSFER, parse_at - transfer_at)
+            self._stats.record(
+                request.host, PHASE_PARSE, self.loop.time() - parse_at)
+        await self._handle_result(result, request)
+
+    def _byte_counter(self, host):
+        # bodies read from the content stream, the traces miss them.
+        if self._stats is not None:
+            return functools.partial(self._stats.received, host)
+
+    def _retryable(self, status):
+        return status in self.retry_statuses or \
+            "{}xx".format(status // 100) in self.retry_statuses
+
+    def _retry(self, request, this_request_url, reason, retry_after=None):
+        """Hand a failed request back to the scheduler, to retry after an
+        exponential backoff with full jitter(at least retry_after), unless
+        its tries are exhausted. Return True if it will be retried.
+        """
+        request.tries += 1
+        max_tries = request.max_tries or self.max_tries
+        if request.tries >= max_tries:
+            if self._stats is not None:
+                self._stats.failure(request.host)
+            self._failed(request, this_request_url)
+            return self.logger.error(
+                "[%s] %s [Failure][Try:%s]", request.method,
+                this_request_url, request.tries,
+                extra={'event': 'failure', 'method': request.method,
+                       'url': this_request_url, 'host': request.host,
+                       'reason': reason, 'tries': request.tries})
+        if self._stats is not None:
+            self._stats.retry(request.host)
+        self.logger.debug(
+            "[%s] %s [%s][Try:%s]", request.method, this_request_url, reason,
+            request.tries,
+            extra={'event': 'retry', 'method': request.method,
+                   'url': this_request_url, 'host': request.host,
+                   'reason': reason, 'tries': request.tries})
+        delay = random.uniform(0, min(
+            self.retry_backoff * 2 ** (request.tries - 1),
+            self.retry_backoff_max))
+        if retry_after:
+            delay = max(delay, min(retry_after, MAX_RETRY_AFTER))
+        self._tasks_que.put_later(request, delay)
+        return True
+
+    def _proxy_answered(self, request, proxy, status, latency):
+        """Report an answer through proxy to the pool, return whether it
+        is the proxy's failure.
+        """
+        if proxy is None:
+            return False
+        if status in PROXY_ERROR_STATUSES:
+            self._proxy_failed(request, proxy)
+            return True
+        self._proxies.success(proxy, latency)
+        return False
+
+    def _proxy_failed(self, request, proxy):
+        if proxy is not None:
+            self._proxies.failure(proxy)
+            # the next try goes through another proxy.
+            request.failed_proxy = proxy.url
+
+    def _failed(self, request, this_request_url):
+        self._failed_urls.add(this_request_url)
+        if self._checkpoint is not None:
+            # replayed by run(failed_only=True).
+            self._checkpoint.failed(request)
+
+    def _observe(self, request, latency=None, response=None):
+        """Feed the outcome of a request(latency None: failed) to the
+        concurrency controller.
+        """
+        if self._controller is None:
+            return
+        status = retry_after = None
+        if response is not None:
+            status = response.status
+            retry_after = response.headers.get('Retry-After')
+        self._controller.observe(request.host, latency, status, retry_after)
+
+    def _get_executor(self, kind):
+        executor = self._executors.get(kind)
+        if executor is None:
+            executor = self._executors[kind] = create_executor(
+                kind, self.parse_workers)
+        return executor
+
+    async def _handle_result(self, result, parent=None):
+        """Schedule the Requests a parser returned or yielded(one level
+        deeper than parent by default), send the items(dicts) to the item
+        pipeline. Async generators and iterators are consumed too.
+        """
+        if result is None:
+            return
+        if isinstance(result, (Request, dict)):
+            result = (result,)
+        elif hasattr(result, '__aiter__'):
+            async for each in result:
+                await self._handle_one(each, parent)
+            return
+        elif isinstance(result, (str, bytes)) or \
+                not hasattr(result, '__iter__'):
+            return
+        for each in result:
+            await self._handle_one(each, parent)
+
+    async def _handle_one(self, result, parent):
+        if isinstance(result, dict):
+            if self.item_pipeline is not None:
+                # waits while the sinks are behind.
+                await self.item_pipeline.put(result)
+            return
+        if not isinstance(result, Request):
+            return
+        # parsers run in a process pool reference their parser by name.
+        if isinstance(result.parser, str):
+            result.parser = getattr(self, result.parser)
+        if result.depth is None and parent is not None:
+            result.depth = (parent.depth or 0) + 1
+        self._tasks_que.put_nowait(result)
 
     # real download method
-    @staticmethod
-    async def _download(response, file):
-        async with aiofiles.open(file, 'wb') as fd:
-            while True:
-                chunk = await response.content.read(DOWNLOAD_CHUNK_SIZE)
-                if not chunk:
-                    break
-                await fd.write(chunk)
-                await fd.flush()
+    async def _download(self, request, kwargs, this_request_url,
+                        proxy=None):
+        def retryable(status):
+            # failures of the proxy are retried through another one.
+            return self._retryable(status) or \
+                proxy is not None and status in PROXY_ERROR_STATUSES
+
+        download = FileDownload(
+            self.ac_session, request.url, request.file, kwargs,
+            size=request.size, checksum=request.checksum,
+            segments=request.segments, timeout=self.timeout,
+            retryable=retryable, on_chunk=self._byte_counter(request.host),
+            loop=self.loop
+        )
+        try:
+            downloaded = await download.run()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # backed off like the other requests, from where it stopped.
+            self._proxy_failed(request, proxy)
+            return self._retry(request, this_request_url,
+                               e.__class__.__name__)
+        except DownloadStatusError as e:
+            self._proxy_answered(request, proxy, e.status, download.latency)
+            # the .part file is resumed by the next try.
+            return self._retry(request, this_request_url, e.status,
+                               e.retry_after)
+        except DownloadError as e:
+            self._failed(request, this_request_url)
+            return self.logger.error(
+                "[%s] %s [Failure][%s]", request.method, this_request_url, e,
+                extra={'event': 'failure', 'method': request.method,
+                       'url': this_request_url, 'host': request.host,
+                       'reason': str(e), 'file': request.file})
+        if download.latency is not None:
+            self._proxy_answered(request, proxy, None, download.latency)
+        self._success_count += 1
+        if not downloaded:
+            return self.logger.info(
+                "[DOWNLOAD][Complete]:%s", request.file,
+                extra={'event': 'download', 'url': this_request_url,
+                       'file': request.file, 'complete': True})
+        self.logger.info(
+            "[DOWNLOAD]:%s", request.file,
+            extra={'event': 'download', 'url': this_request_url,
+                   'file': request.file, 'complete': False})
 
     def download(self, url, save_dir=WORKING_DIR, headers=None, filename=None,
-                 params=None, sleep=None, allow_redirects=True, **kwargs):
+                 params=None, sleep=None, allow_redirects=True, size=None,
+                 checksum=None, segments=None, **kwargs):
+        """Download url into save_dir/filename, resuming a previous partial
+        download. size and checksum('sha256:<hex>') check the file, segments
+        fetches it as that many byte ranges in parallel.
+        """
+        if checksum is not None:
+            parse_checksum(checksum)
         # recursively mkdir, ignore error when directory exists
         if not os.path.exists(save_dir):
             path = Path(save_dir)
             path.mkdir(parents=True, exist_ok=True)
         file = os.path.join(save_dir, filename)
 
-        self._tasks_que.put_nowait(self._request(
+        self._schedule(
             url, sleep=sleep, params=params, method=METHOD_GET,
             headers=headers, file=file, parser=self._download,
-            allow_redirects=allow_redirects, **kwargs
-        ))
+            allow_redirects=allow_redirects, size=size, checksum=checksum,
+            segments=segments, **kwargs
+        )
+
+    def sitemap(self, urls, parser=None, since=None, until=None,
+                headers=None, sleep=None, **kwargs):
+        """GET the pages listed by sitemaps(indexes, gzipped or not, or
+        the robots.txt listing them), streamed into the frontier as it has
+        room. since and until(dates or datetimes) filter them by lastmod.
+        """
+        self.get(SitemapUrls(self._side_get, urls, since=since,
+                             until=until, max_tries=self.max_tries,
+                             timeout=self.timeout, logger=self.logger),
+                 parser=parser, headers=headers, sleep=sleep, **kwargs)
 
     def get(self, urls, params=None, parser=None, headers=None,
             sleep=None, allow_redirects=True, **kwargs):
-        self._tasks_que.put_nowait(self._request(
+        self._schedule(
             urls, parser=parser, sleep=sleep, method=METHOD_GET,
             params=params, headers=headers, allow_redirects=allow_redirects,
             **kwargs
-        ))
+        )
 
     def post(self, urls, data=None, json=None, parser=None, headers=None,
              sleep=None, allow_redirects=True, **kwargs):
-        self._tasks_que.put_nowait(self._request(
+        self._schedule(
             urls, parser=parser, sleep=sleep, method=METHOD_POST,
             headers=headers, data=data, json=json,
             allow_redirects=allow_redirects, **kwargs
-        ))
+        )
 
     def patch(self, urls, data=None, json=None, parser=None, headers=None,
               sleep=None, allow_redirects=True, **kwargs):
-        self._tasks_que.put_nowait(self._request(
+        self._schedule(
             urls, parser=parser, sleep=sleep, method=METHOD_PATCH,
             headers=headers, data=data, json=json,
             allow_redirects=allow_redirects, **kwargs
-        ))
+        )
 
     def put(self, urls, data=None, json=None, parser=None,
             sleep=None, allow_redirects=True, **kwargs):
-        self._tasks_que.put_nowait(self._request(
+        self._schedule(
             urls, parser=parser, sleep=sleep, method=METHOD_PUT, data=data,
             json=json, allow_redirects=allow_redirects, **kwargs
-        ))
+        )
 
     def head(self, urls, parser=None, sleep=None, headers=None,
              allow_redirects=True, **kwargs):
-        self._tasks_que.put_nowait(self._request(
+        self._schedule(
             urls, parser=parser, sleep=sleep, method=METHOD_HEAD,
             headers=headers, allow_redirects=allow_redirects, **kwargs
-        ))
+        )
 
     def delete(self, urls, parser=None, sleep=None, headers=None,
                allow_redirects=True, **kwargs):
-        self._tasks_que.put_nowait(self._request(
+        self._schedule(
             urls, parser=parser, sleep=sleep, method=METHOD_DELETE,
             headers=headers, allow_redirects=allow_redirects, **kwargs
-        ))
+        )
 
     def options(self, urls, parser=None, sleep=None, headers=None,
                 allow_redirects=True, **kwargs):
-        self._tasks_que.put_nowait(self._request(
+        self._schedule(
             urls, parser=parser, sleep=sleep, method=METHOD_OPTIONS,
             headers=headers, allow_redirects=allow_redirects, **kwargs
-        ))
+        )
+
+    def follow(self, response, urls=None, parser=None, priority=0,
+               method=METHOD_GET, **kwargs):
+        """Request urls(by default response.links()) one level deeper than
+        response. priority ranks them in a 'best' frontier, a number or a
+        function of the url(a score).
+        """
+        if urls is None:
+            urls = response.links()
+        parent = response.request
+        depth = (parent.depth or 0) + 1 if parent is not None else None
+        for url in urls:
+            self._schedule(
+                url, method=method, parser=parser, depth=depth,
+                priority=priority(url) if callable(priority) else priority,
+                **kwargs)
 
     async def workers(self):
         while True:
-            task = await self._tasks_que.get()
-            await task
-            self._tasks_que.task_done()
+            request = await self._tasks_que.get()
+            retried = False
+            try:
+                retried = await self._request(request)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # a bug in a parser or a sink fails this request only.
+                self._failed(request, request.url)
+                self.logger.error(
+                    "[%s] %s [Error][%s]", request.method, request.url,
+                    e.__class__.__name__, exc_info=True,
+                    extra={'event': 'failure', 'method': request.method,
+                           'url': request.url, 'host': request.host,
+                           'reason': repr(e)})
+            finally:
+                self._tasks_que.task_done(request)
+                if self._checkpoint is not None and not retried:
+                    self._checkpoint.done(request)
 
     async def work(self):
-        if inspect.iscoroutinefunction(self.on_start):
-            await self.on_start()
-        else:
-            self.on_start()
+        self._loop_thread = threading.current_thread()
+        if self.item_pipeline is not None:
+            self.item_pipeline.start(self.loop)
+        if self.redis is not None and not self._resume:
+            # a new crawl, not the leftovers of the last one.
+            await self._tasks_que.reset()
+        if self._restore_checkpoint():
+            if inspect.iscoroutinefunction(self.on_start):
+                await self.on_start()
+            else:
+                self.on_start()
+        self._tasks_que.seeded()
 
+        # the controller caps the requests in flight below the workers, the
+        # extra ones wait in get() until a request in flight is released.
+        concurrency = self.concurrency
+        if self._controller is not None:
+            concurrency = max(concurrency, self._controller.max_concurrency)
         workers = [
             asyncio.Task(self.workers(), loop=self.loop)
-            for _ in range(self.concurrency)
+            for _ in range(concurrency)
         ]
 
+        reporter = server = checkpointer = None
+        if self._checkpoint is not None:
+            checkpointer = asyncio.ensure_future(
+                self._save_checkpoint(), loop=self.loop)
+        if self._stats is not None:
+            if self.stats_interval:
+                reporter = asyncio.ensure_future(
+                    self._report_stats(), loop=self.loop)
+            if self.stats_address:
+                server = await self._stats.serve(*self.stats_address)
+
         await self._tasks_que.join()
         for worker in workers:
             worker.cancel()
+        if reporter is not None:
+            reporter.cancel()
+        if checkpointer is not None:
+            checkpointer.cancel()
+        if server is not None:
+            server.close()
+        if self._stats is not None:
+            self.on_stats(self._stats.snapshot())
+
+    def _restore_checkpoint(self):
+        """Open the checkpoint, requeue what the last crawl left pending(or
+        only its failed requests), return whether on_start has to run.
+        """
+        checkpoint = self._checkpoint
+        if checkpoint is None:
+            return True
+        state = checkpoint.open(resume=self._resume)
+        if not self._resume:
+            return True
+        if self._failed_only:
+            requests = checkpoint.requests(state.failed, self)
+            for request in requests:
+                request.tries = 0
+                checkpoint.queued(request, seen=False)
+            self._tasks_que.restore(requests, state.seen, state.hosts)
+            return False
+        self._tasks_que.restore(
+            checkpoint.requests(state.pending, self), state.seen,
+            state.hosts)
+        self.logger.info(
+            "%s Resumed, Pending:%s, Seen:%s", self.name, len(state.pending),
+            len(state.seen))
+        # seeds seen already are dropped again by the seen-store.
+        return True
+
+    def _checkpoint_queued(self, request):
+        parser = request.parser
+        # parsers are saved by name and looked up on the crawler again.
+        if parser is not None and not isinstance(parser, str):
+            name = getattr(parser, '__name__', None)
+            if (name is None or getattr(self, name, None) != parser) and \
+                    repr(parser) not in self._unrestorable_parsers:
+                self._unrestorable_parsers.add(repr(parser))
+                self.logger.warning(
+                    "%s Parser %r is not a method of the crawler, its "
+                    "requests can not be resumed from the checkpoint",
+                    self.name, parser, extra={'event': 'checkpoint'})
+        self._checkpoint.queued(request)
+
+    async def _save_checkpoint(self):
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            try:
+                await self._checkpoint.save(self.loop)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # the next save has the records which this one failed.
+                self.logger.error("%s Checkpoint failed", self.name,
+                                  exc_info=True,
+                                  extra={'event': 'checkpoint'})
 
-    def run(self):
+    async def _report_stats(self):
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            self.on_stats(self._stats.snapshot())
+
+    def on_stats(self, snapshot):
+        """Periodic CrawlStats.snapshot(), override to export it."""
+        gauges = snapshot['gauges']
+        self.logger.info(
+            "[STATS] Responses:%s (%.1f/s), Bytes:%s, Retries:%s, "
+            "Failures:%s, InFlight:%s, Queued:%s",
+            snapshot.get('responses', 0), snapshot['responses_per_second'],
+            snapshot.get('bytes', 0), snapshot.get('retries', 0),
+            snapshot.get('failures', 0), gauges.get('requests_in_flight'),
+            gauges.get('queue_size'), extra={'event': 'stats'})
+
+    def _run_processes(self, processes):
         start_at = datetime.now()
-        self.logger.info('{} Started, Concurrency:{}'.format(
-            self.name, self.concurrency))
+        self.logger.info('%s Started, Processes:%s, Concurrency:%s',
+                         self.name, processes, self.concurrency)
+        if self.redis is not None:
+            if not self._resume:
+                # cleared once here, the workers all join the new crawl.
+                self.loop.run_until_complete(self._tasks_que.reset())
+                self._resume = True
+            self.loop.run_until_complete(self._tasks_que.close())
+        # the worker processes own their loop and session.
+        self._close_session()
+        self.loop.close()
+        shard_results = run_processes(
+            self, processes, resume=self._resume,
+            failed_only=self._failed_only)
+        for shard_result in shard_results:
+            self._success_count += shard_result['success']
+            self._failed_urls.update(shard_result['failed'])
+            if self._stats is not None and shard_result['stats'] is not None:
+                self._stats.merge(shard_result['stats'])
+        if self._stats is not None:
+            self.on_stats(self._stats.snapshot())
+        end_at = datetime.now()
+        self.logger.info(
+            '%s Finished in %s seconds.Success:%s, Failure:%s',
+            self.name, (end_at-start_at).total_seconds(),
+            self._success_count, len(self._failed_urls))
+        close_logger(self.logger)
+
+    def run(self, processes=None, resume=False, failed_only=False):
+        """Crawl until the frontier is exhausted. With processes, run that
+        many worker processes, each with its own event loop.
+
+        With a checkpoint, resume continues the last crawl where it stopped:
+        its pending requests are queued again and on_start only adds the
+        seeds it has not seen. failed_only retries the requests it failed
+        instead, without calling on_start.
+
+        With a redis frontier, resume joins(or continues) the crawl shared
+        under the crawler name. Without it, the shared frontier, seen-set
+        and leases of that name are deleted first: start the first node
+        without resume and the other nodes with resume=True.
+        """
+        self._resume = resume or failed_only
+        self._failed_only = failed_only
+        if processes and processes > 1:
+            return self._run_processes(processes)
+        start_at = datetime.now()
+        self.logger.info('%s Started, Concurrency:%s',
+                         self.name, self.concurrency)
         try:
             self.loop.run_until_complete(self.work())
         except KeyboardInterrupt:
@@ -248,13 +1018,42 @@ class AioCrawler(object):
         finally:
             end_at = datetime.now()
             self.logger.info(
-                '{} Finished in {} seconds.'
-                'Success:{}, Failure:{}'.format(
-                    self.name, (end_at-start_at).total_seconds(),
-                    len(self._seen_urls), len(self._failed_urls))
-            )
-            self.ac_session.close()
-            self.loop.close()
+                '%s Finished in %s seconds.Success:%s, Failure:%s',
+                self.name, (end_at-start_at).total_seconds(),
+                self._success_count, len(self._failed_urls))
+            try:
+                self._close()
+            finally:
+                close_logger(self.logger)
+
+    def _close(self):
+        """Release what the crawl opened, every step even if one fails,
+        then raise the first error.
+        """
+        run = self.loop.run_until_complete
+        steps = []
+        if self.item_pipeline is not None:
+            # write what the sinks still buffer.
+            steps.append(lambda: run(self.item_pipeline.close()))
+        steps.append(self._close_session)
+        if self._resolver is not None:
+            steps.append(lambda: run(self._resolver.close()))
+        steps.append(lambda: run(self._tasks_que.close()))
+        if self._checkpoint is not None:
+            steps.append(self._checkpoint.close)
+        steps.extend(executor.shutdown
+                     for executor in self._executors.values())
+        steps.append(self.loop.close)
+        error = None
+        for step in steps:
+            try:
+                step()
+            except Exception as e:
+                self.logger.error("%s Close failed", self.name,
+                                  exc_info=True)
+                error = error or e
+        if error is not None:
+            raise error
 
     def __call__(self, *args, **kwargs):
         self.run()
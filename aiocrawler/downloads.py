@@ -0,0 +1,344 @@
+import asyncio
+import async_timeout
+import aiofiles
+import aiohttp
+import hashlib
+import json
+import os
+import re
+from email.utils import parsedate_to_datetime
+from aiocrawler.exceptions import DownloadError, DownloadStatusError
+from aiocrawler.throttle import parse_retry_after
+from aiocrawler.constants import DOWNLOAD_CHUNK_SIZE, \
+    DOWNLOAD_MIN_SEGMENT_SIZE, DOWNLOAD_STATE_INTERVAL, METHOD_GET, \
+    METHOD_HEAD
+
+
+PART_SUFFIX = '.part'
+# validators and progress of the segments of a .part file.
+STATE_SUFFIX = '.part.json'
+
+STATUS_PARTIAL_CONTENT = 206
+STATUS_RANGE_NOT_SATISFIABLE = 416
+
+_CONTENT_RANGE = re.compile(r'^\s*bytes\s+(\d+)-(\d+)/(\d+|\*)\s*$', re.I)
+
+
+def parse_checksum(checksum):
+    """'sha256:<hex>' -> ('sha256', '<hex>'), any hashlib algorithm."""
+    algorithm, _, digest = checksum.partition(':')
+    if not digest or algorithm not in hashlib.algorithms_available:
+        raise ValueError("Invalid checksum: {}".format(checksum))
+    return algorithm, digest.lower()
+
+
+def file_digest(path, algorithm):
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as fd:
+        for chunk in iter(lambda: fd.read(DOWNLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_content_range(value):
+    """(start, end, total or None) of a 'bytes start-end/total' header,
+    None if it does not parse.
+    """
+    match = _CONTENT_RANGE.match(value or '')
+    if match is None:
+        return None
+    start, end, total = match.groups()
+    return int(start), int(end), None if total == '*' else int(total)
+
+
+def _http_date(value):
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class _RangesIgnored(Exception):
+    """The server answered a range with the whole body, or with another
+    range.
+    """
+    pass
+
+
+class FileDownload(object):
+    """Download of url into file, resumable across retries and runs.
+
+    The body is written to file.part, its validators(ETag/Last-Modified)
+    and the progress of every segment to file.part.json: an interrupted
+    download resumes with Range/If-Range, and starts over if the remote
+    file changed meanwhile. Finished files get the remote Last-Modified as
+    mtime, a file of the expected size(or checksum) or of the same size and
+    mtime as the remote one is not downloaded again.
+
+    With segments > 1, servers sending Accept-Ranges are downloaded as that
+    many byte ranges in parallel, each on its own connection.
+
+    Statuses for which retryable(status) is true raise DownloadStatusError,
+    connection errors and timeouts are raised as they are: the caller
+    retries them later, from where the download stopped. on_chunk is called
+    with the size of every chunk received.
+    """
+
+    def __init__(self, session, url, file, kwargs, size=None, checksum=None,
+                 segments=None, timeout=None, retryable=None, on_chunk=None,
+                 loop=None):
+        self._session = session
+        self.url = url
+        self.file = file
+        self._kwargs = dict(kwargs)
+        self._headers = dict(self._kwargs.pop('headers', None) or {})
+        self.size = size
+        self.checksum = checksum and parse_checksum(checksum)
+        self.segments = segments or 1
+        self._timeout = timeout
+        self._retryable = retryable
+        self._on_chunk = on_chunk
+        self._loop = loop or asyncio.get_event_loop()
+        self._part = file + PART_SUFFIX
+        self._state_file = file + STATE_SUFFIX
+        self._state = None
+        self._saved_at = 0
+        # seconds until the first response, None before it.
+        self.latency = None
+
+    async def run(self):
+        """True once file is downloaded, False if it was already complete.
+        Raise DownloadError on failure, DownloadStatusError, ClientError or
+        TimeoutError to be retried.
+        """
+        if os.path.exists(self.file) and await self._is_complete():
+            return False
+        try:
+            await self._fetch()
+        except _RangesIgnored:
+            # download it in one piece then.
+            self._reset()
+            self.segments = 1
+            await self._fetch()
+        await self._verify()
+        os.replace(self._part, self.file)
+        last_modified = _http_date(self._state['last_modified'])
+        if last_modified is not None:
+            os.utime(self.file, (last_modified, last_modified))
+        self._remove(self._state_file)
+        return True
+
+    async def _request(self, method, headers=None):
+        headers = dict(self._headers, **headers or {})
+        # lengths and ranges are offsets in the file, not in a gzipped body
+        # aiohttp would decode.
+        headers['Accept-Encoding'] = 'identity'
+        start_at = self._loop.time()
+        with async_timeout.timeout(self._timeout):
+            response = await self._session.request(
+                method, self.url, headers=headers, **self._kwargs)
+        if self.latency is None:
+            self.latency = self._loop.time() - start_at
+        return response
+
+    async def _probe(self):
+        """Length, validators and range support of the remote file."""
+        response = await self._request(METHOD_HEAD)
+        response.release()
+        if response.status != 200:
+            return {}
+        headers = response.headers
+        length = headers.get('Content-Length')
+        return {
+            'length': int(length) if length is not None else None,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'ranges': headers.get('Accept-Ranges', '').lower() == 'bytes',
+        }
+
+    async def _is_complete(self):
+        local_size = os.path.getsize(self.file)
+        if self.checksum is not None:
+            return (self.size is None or local_size == self.size) and \
+                await self._checksum_ok(self.file)
+        if self.size is not None:
+            return local_size == self.size
+        remote = await self._probe()
+        if remote.get('length') != local_size:
+            return False
+        last_modified = _http_date(remote['last_modified'])
+        return last_modified is None or \
+            last_modified == os.path.getmtime(self.file)
+
+    async def _checksum_ok(self, path):
+        algorithm, digest = self.checksum
+        return digest == await self._loop.run_in_executor(
+            None, file_digest, path, algorithm)
+
+    def _load_state(self):
+        if not os.path.exists(self._part):
+            return None
+        try:
+            with open(self._state_file) as fd:
+                return json.load(fd)
+        except (OSError, ValueError):
+            return None
+
+    def _save_state(self):
+        self._saved_at = self._loop.time()
+        tmp_file = self._state_file + '.tmp'
+        with open(tmp_file, 'w') as fd:
+            json.dump(self._state, fd)
+        os.replace(tmp_file, self._state_file)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _reset(self):
+        self._state = None
+        self._remove(self._part)
+        self._remove(self._state_file)
+
+    async def _plan(self):
+        remote = {}
+        if self.segments > 1:
+            remote = await self._probe()
+        state = {
+            'etag': remote.get('etag'),
+            'last_modified': remote.get('last_modified'),
+            'length': remote.get('length'),
+            # [start, end(inclusive, None up to EOF), next byte, done]
+            'segments': [[0, None, 0, False]],
+        }
+        length = remote.get('length')
+        count = self.segments
+        if remote.get('ranges') and length and count > 1:
+            count = min(count, max(1, length // DOWNLOAD_MIN_SEGMENT_SIZE))
+            step = -(-length // count)
+            state['segments'] = [
+                [start, min(start + step, length) - 1, start, False]
+                for start in range(0, length, step)
+            ]
+        with open(self._part, 'wb') as fd:
+            if len(state['segments']) > 1:
+                fd.truncate(length)
+        return state
+
+    async def _fetch(self):
+        if self._state is None:
+            self._state = self._load_state() or await self._plan()
+            self._save_state()
+        tasks = [
+            asyncio.ensure_future(self._fetch_segment(segment),
+                                  loop=self._loop)
+            for segment in self._state['segments'] if not segment[3]
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if self._state is not None:
+                # the next try resumes from here.
+                self._save_state()
+            raise
+
+    async def _fetch_segment(self, segment):
+        state = self._state
+        start, end, position, _ = segment
+        headers = {}
+        if position > 0 or end is not None:
+            headers['Range'] = 'bytes={}-{}'.format(
+                position, '' if end is None else end)
+            validator = state['etag'] or state['last_modified']
+            if validator:
+                # a changed file is sent whole instead of the range.
+                headers['If-Range'] = validator
+        response = await self._request(METHOD_GET, headers)
+        try:
+            if response.status == STATUS_PARTIAL_CONTENT:
+                self._check_range(response, position, end)
+            elif response.status == 200:
+                if end is not None:
+                    raise _RangesIgnored()
+                position = segment[2] = 0
+                state['etag'] = response.headers.get('ETag')
+                state['last_modified'] = response.headers.get(
+                    'Last-Modified')
+                length = response.headers.get('Content-Length')
+                state['length'] = int(length) if length is not None \
+                    else None
+            elif response.status == STATUS_RANGE_NOT_SATISFIABLE \
+                    and end is None and position > 0:
+                # the part was complete already.
+                segment[3] = True
+                return self._save_state()
+            elif self._retryable is not None and \
+                    self._retryable(response.status):
+                raise DownloadStatusError(response.status, parse_retry_after(
+                    response.headers.get('Retry-After')))
+            else:
+                raise DownloadError("Unexpected status {} {}".format(
+                    response.status, response.reason))
+            if end is None:
+                # drop whatever follows the resume point.
+                os.truncate(self._part, position)
+            async with aiofiles.open(self._part, 'r+b') as fd:
+                await fd.seek(position)
+                while end is None or position <= end:
+                    with async_timeout.timeout(self._timeout):
+                        chunk = await response.content.read(
+                            DOWNLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if self._on_chunk is not None:
+                        self._on_chunk(len(chunk))
+                    if end is not None:
+                        chunk = chunk[:end + 1 - position]
+                    await fd.write(chunk)
+                    await fd.flush()
+                    position = segment[2] = position + len(chunk)
+                    if self._loop.time() - self._saved_at >= \
+                            DOWNLOAD_STATE_INTERVAL:
+                        self._save_state()
+            if end is not None and position <= end:
+                raise aiohttp.ClientError(
+                    "Segment {}-{} cut at {}".format(start, end, position))
+            segment[3] = True
+            self._save_state()
+        finally:
+            response.release()
+
+    def _check_range(self, response, position, end):
+        content_range = parse_content_range(
+            response.headers.get('Content-Range'))
+        if content_range is None:
+            raise _RangesIgnored()
+        start, last, total = content_range
+        length = self._state['length']
+        # shifted, or cut short of the range without reaching the end of
+        # the file, or of another file.
+        if start != position or \
+                end is not None and last < end and \
+                (total is None or last + 1 < total) or \
+                total is not None and length is not None and \
+                total != length:
+            raise _RangesIgnored()
+
+    async def _verify(self):
+        expected = self.size if self.size is not None \
+            else self._state['length']
+        if expected is not None and os.path.getsize(self._part) != expected:
+            size = os.path.getsize(self._part)
+            self._reset()
+            raise DownloadError("Got {} bytes, expected {}".format(
+                size, expected))
+        if self.checksum is not None and \
+                not await self._checksum_ok(self._part):
+            self._reset()
+            raise DownloadError("Checksum mismatch")
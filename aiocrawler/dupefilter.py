@@ -0,0 +1,225 @@
+import hashlib
+import math
+from array import array
+from urllib import parse as urlparse
+
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Lua: SADD every fingerprint, return 1 for the new ones and 0 otherwise.
+ADD_MANY_SCRIPT = """
+local added = {}
+for i, fingerprint in ipairs(ARGV) do
+    added[i] = redis.call('SADD', KEYS[1], fingerprint)
+end
+return added
+"""
+
+
+def canonicalize_url(url, params=None):
+    """Normalize scheme, host and default port, sort the query (merged with
+    params) and drop the fragment, so equivalent urls compare equal. A url
+    which does not parse is returned as it is.
+    """
+    try:
+        parts = urlparse.urlsplit(str(url))
+        port = parts.port
+    except ValueError:
+        # malformed port or ipv6 host: the request fails when it is sent.
+        return str(url)
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or "").lower()
+    if port and port != DEFAULT_PORTS.get(scheme):
+        netloc = "{}:{}".format(netloc, port)
+    if "@" in parts.netloc:
+        netloc = "{}@{}".format(parts.netloc.rsplit("@", 1)[0], netloc)
+    query = urlparse.parse_qsl(parts.query, keep_blank_values=True)
+    if params:
+        query.extend((str(k), str(v)) for k, v in params.items())
+    return urlparse.urlunsplit((
+        scheme, netloc, parts.path or "/", urlparse.urlencode(sorted(query)),
+        ""
+    ))
+
+
+def _body_bytes(body):
+    # form fields in any order are the same form.
+    if isinstance(body, dict):
+        body = list(body.items())
+    if isinstance(body, (list, tuple)):
+        try:
+            return urlparse.urlencode(sorted(
+                (str(key), str(value)) for key, value in body)).encode()
+        except (TypeError, ValueError):
+            return None
+    if isinstance(body, str):
+        return body.encode()
+    if isinstance(body, (bytes, bytearray)):
+        return bytes(body)
+    # FormData, files or generators can not be read without consuming
+    # them.
+    return None
+
+
+def request_fingerprint(method, url, params=None, body=None, file=None):
+    """64-bit fingerprint of the canonical request. file is the target of
+    a download: the same url downloaded to two files is two requests.
+    Bodies other than str, bytes, dicts and lists of pairs are left out.
+    """
+    digest = hashlib.sha1("{} {}\n".format(
+        (method or "").upper(), canonicalize_url(url, params)).encode())
+    body = _body_bytes(body)
+    if body:
+        digest.update(body)
+    if file is not None:
+        digest.update("\nfile:{}".format(file).encode())
+    return int.from_bytes(digest.digest()[:8], 'big')
+
+
+class MemorySeenStore(object):
+    """Exact set of 64-bit fingerprints.
+
+    Open addressing over a flat array of unsigned 64-bit ints, which costs
+    about 12-24 bytes per fingerprint instead of a python str or int in a
+    set.
+    """
+    MAX_LOAD = 0.7
+
+    def __init__(self, capacity=1024):
+        size = 16
+        while size * self.MAX_LOAD < capacity:
+            size <<= 1
+        self._table = array('Q', [0]) * size
+        self._mask = size - 1
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def _lookup(self, fingerprint):
+        # 0 marks an empty bucket.
+        fingerprint = fingerprint or 1
+        table, mask = self._table, self._mask
+        index = fingerprint & mask
+        while True:
+            value = table[index]
+            if value == fingerprint or value == 0:
+                return index, value == fingerprint
+            index = (index + 1) & mask
+
+    def __contains__(self, fingerprint):
+        return self._lookup(fingerprint)[1]
+
+    def add(self, fingerprint):
+        """Add the fingerprint, return False if it was already seen."""
+        index, found = self._lookup(fingerprint)
+        if found:
+            return False
+        self._table[index] = fingerprint or 1
+        self._count += 1
+        if self._count > len(self._table) * self.MAX_LOAD:
+            self._grow()
+        return True
+
+    def _grow(self):
+        old_table = self._table
+        self._table = array('Q', [0]) * (len(old_table) * 2)
+        self._mask = len(self._table) - 1
+        for value in old_table:
+            if value:
+                self._table[self._lookup(value)[0]] = value
+
+
+class _BloomFilter(object):
+    __slots__ = ('bits', 'num_bits', 'num_hashes', 'capacity', 'count')
+
+    def __init__(self, capacity, error_rate):
+        self.num_bits = int(math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, int(round(
+            self.num_bits / capacity * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.capacity = capacity
+        self.count = 0
+
+    def positions(self, fingerprint):
+        # double hashing on the two halves of the fingerprint.
+        h1, h2 = fingerprint & 0xffffffff, (fingerprint >> 32) | 1
+        num_bits = self.num_bits
+        return [(h1 + i * h2) % num_bits for i in range(self.num_hashes)]
+
+    def __contains__(self, fingerprint):
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7))
+                   for p in self.positions(fingerprint))
+
+    def add(self, fingerprint):
+        bits = self.bits
+        for p in self.positions(fingerprint):
+            bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+
+class BloomSeenStore(object):
+    """Scalable bloom filter of fingerprints, a few bits per fingerprint.
+
+    The first filter has an error rate of error_rate * (1 - tightening), a
+    full filter is followed by one growth times bigger with its error rate
+    times tightening, so the overall false positive rate stays below
+    error_rate. A false positive drops a request which was never fetched.
+    """
+
+    def __init__(self, capacity=1000000, error_rate=0.001, growth=2,
+                 tightening=0.5):
+        self._growth = growth
+        self._tightening = tightening
+        # the error rates of the filters sum up to error_rate at most.
+        self._error_rate = error_rate * (1 - tightening)
+        self._filters = [_BloomFilter(capacity, self._error_rate)]
+
+    def __len__(self):
+        return sum(bloom.count for bloom in self._filters)
+
+    def __contains__(self, fingerprint):
+        return any(fingerprint in bloom for bloom in self._filters)
+
+    def add(self, fingerprint):
+        if fingerprint in self:
+            return False
+        bloom = self._filters[-1]
+        if bloom.count >= bloom.capacity:
+            self._error_rate *= self._tightening
+            bloom = _BloomFilter(
+                bloom.capacity * self._growth, self._error_rate)
+            self._filters.append(bloom)
+        bloom.add(fingerprint)
+        return True
+
+
+class RedisSeenStore(object):
+    """Redis set of fingerprints, shared by every node of a crawl.
+
+    redis is anything with an async execute(command, *args), such as an
+    AioRedisQueue.
+    """
+
+    def __init__(self, redis, key):
+        self._redis = redis
+        self.key = key
+
+    async def size(self):
+        return await self._redis.execute("SCARD", self.key)
+
+    async def contains(self, fingerprint):
+        return bool(await self._redis.execute(
+            "SISMEMBER", self.key, fingerprint))
+
+    async def add_many(self, fingerprints):
+        """Add fingerprints in one round-trip, return a list of booleans,
+        True for the ones not seen before.
+        """
+        if not fingerprints:
+            return []
+        added = await self._redis.execute(
+            "EVAL", ADD_MANY_SCRIPT, 1, self.key, *fingerprints)
+        return [bool(flag) for flag in added]
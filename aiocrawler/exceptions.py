@@ -14,3 +14,32 @@ class QueueFull(Exception):
     object which is full.
     """
     pass
+
+
+class DownloadError(Exception):
+    """Exception raised when a file download fails or is corrupted."""
+    pass
+
+
+class DownloadStatusError(DownloadError):
+    """Raised when a download gets a status worth a retry(5xx...), the
+    partial file is kept for the next try.
+    """
+
+    def __init__(self, status, retry_after=None):
+        super(DownloadStatusError, self).__init__(
+            "Status {}".format(status))
+        self.status = status
+        self.retry_after = retry_after
+
+
+class CheckpointError(Exception):
+    """Raised when requests can not be saved to the checkpoint(their kwargs
+    do not pickle), they are left out of it.
+    """
+    pass
+
+
+class DropItem(Exception):
+    """Raised by an item pipeline stage to drop the item."""
+    pass
@@ -0,0 +1,41 @@
+import inspect
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+EXECUTOR_THREAD = 'thread'
+EXECUTOR_PROCESS = 'process'
+
+EXECUTOR_TYPES = {
+    EXECUTOR_THREAD: ThreadPoolExecutor,
+    EXECUTOR_PROCESS: ProcessPoolExecutor,
+}
+
+
+def offload(executor=EXECUTOR_THREAD):
+    """Run the decorated sync parser in the crawler's thread or process pool
+    instead of the event loop, whatever AioCrawler.parse_executor is.
+
+    A process pool parser must be picklable(a function or staticmethod),
+    it returns its follow-up Requests instead of calling self.get().
+    """
+    if executor not in EXECUTOR_TYPES:
+        raise ValueError("Unknown parse executor: {}".format(executor))
+
+    def decorator(parser):
+        parser.parse_executor = executor
+        return parser
+    return decorator
+
+
+def create_executor(kind, max_workers=None):
+    return EXECUTOR_TYPES[kind](max_workers=max_workers)
+
+
+def call_parser(parser, response):
+    """Executor entry point: the tree is built lazily inside the parser,
+    generators are consumed here, not back on the loop.
+    """
+    result = parser(response)
+    if inspect.isgenerator(result):
+        result = list(result)
+    return result
@@ -0,0 +1,193 @@
+import aiofiles
+import asyncio
+import json
+import os
+import struct
+import tempfile
+import time
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from aiocrawler.responses.cached import CachedResponse
+from aiocrawler.constants import DEFAULT_HTTP_CACHE_MAX_SIZE, \
+    DEFAULT_HTTP_CACHE_MAX_AGE
+
+
+CACHE_POLICY_REVALIDATE = 'revalidate'
+CACHE_POLICY_OFFLINE = 'cache-only'
+
+# 4 bytes big-endian length of the json meta, the meta, the zlib body.
+_META_LENGTH = struct.Struct('>I')
+
+# describe the body on the wire, not the decoded body which is stored.
+_WIRE_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding')
+_TMP_SUFFIX = '.tmp'
+
+
+class CacheEntry(object):
+    __slots__ = ('meta', 'body')
+
+    def __init__(self, meta, body):
+        self.meta = meta
+        self.body = body
+
+    def validators(self):
+        """Conditional request headers revalidating this entry."""
+        headers = {}
+        if self.meta.get('etag'):
+            headers['If-None-Match'] = self.meta['etag']
+        if self.meta.get('last_modified'):
+            headers['If-Modified-Since'] = self.meta['last_modified']
+        return headers
+
+    def response(self):
+        meta = self.meta
+        return CachedResponse(
+            meta['method'], meta['url'], meta['status'], meta['reason'],
+            meta['headers'], self.body)
+
+
+class HttpCache(object):
+    """On-disk cache of responses keyed by request fingerprint.
+
+    Bodies are stored decoded and zlib compressed(in the default executor).
+    Entries older than max_age seconds are
+    dropped, the oldest entries are evicted once the cache grows beyond
+    max_size bytes. With the 'revalidate' policy cached entries are
+    refetched with If-None-Match/If-Modified-Since and served again on a
+    304, with 'cache-only' the network is never used.
+    """
+
+    def __init__(self, path, policy=CACHE_POLICY_REVALIDATE,
+                 max_size=DEFAULT_HTTP_CACHE_MAX_SIZE,
+                 max_age=DEFAULT_HTTP_CACHE_MAX_AGE):
+        if policy not in (CACHE_POLICY_REVALIDATE, CACHE_POLICY_OFFLINE):
+            raise ValueError("Unknown cache policy: {}".format(policy))
+        self._path = Path(path)
+        self._path.mkdir(parents=True, exist_ok=True)
+        self.policy = policy
+        self._max_size = max_size
+        self._max_age = max_age
+        # fingerprint -> (size, stored at), oldest first.
+        self._index = OrderedDict()
+        self._size = 0
+        self._load_index()
+
+    @property
+    def offline(self):
+        return self.policy == CACHE_POLICY_OFFLINE
+
+    def _entry_path(self, fingerprint):
+        name = "{:016x}".format(fingerprint)
+        return self._path / name[:2] / name
+
+    def _load_index(self):
+        entries = []
+        for directory in self._path.iterdir():
+            if not directory.is_dir():
+                continue
+            for file in directory.iterdir():
+                if file.name.endswith(_TMP_SUFFIX):
+                    # left by an interrupted store.
+                    self._unlink(str(file))
+                    continue
+                try:
+                    fingerprint = int(file.name, 16)
+                except ValueError:
+                    continue
+                stat = file.stat()
+                entries.append((stat.st_mtime, fingerprint, stat.st_size))
+        for stored_at, fingerprint, size in sorted(entries):
+            self._index[fingerprint] = (size, stored_at)
+            self._size += size
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _remove(self, fingerprint):
+        size, _ = self._index.pop(fingerprint)
+        self._size -= size
+        self._unlink(str(self._entry_path(fingerprint)))
+
+    def _evict(self):
+        expire_before = time.time() - self._max_age if self._max_age else 0
+        while self._index:
+            fingerprint, (_, stored_at) = next(iter(self._index.items()))
+            if self._size <= self._max_size and stored_at >= expire_before:
+                break
+            self._remove(fingerprint)
+
+    async def get(self, fingerprint):
+        entry = self._index.get(fingerprint)
+        if entry is None:
+            return None
+        if self._max_age and entry[1] < time.time() - self._max_age:
+            self._remove(fingerprint)
+            return None
+        try:
+            async with aiofiles.open(
+                    str(self._entry_path(fingerprint)), 'rb') as fd:
+                data = await fd.read()
+            meta_length, = _META_LENGTH.unpack_from(data)
+            meta_end = _META_LENGTH.size + meta_length
+            meta = json.loads(data[_META_LENGTH.size:meta_end].decode())
+            body = await asyncio.get_event_loop().run_in_executor(
+                None, zlib.decompress, data[meta_end:])
+        except (OSError, ValueError, zlib.error):
+            self._remove(fingerprint)
+            return None
+        return CacheEntry(meta, body)
+
+    async def store(self, fingerprint, response, body):
+        headers = response.headers
+        stored_headers = [
+            (name, value) for name, value in headers.items()
+            if name.lower() not in _WIRE_HEADERS
+        ]
+        stored_headers.append(('Content-Length', str(len(body))))
+        meta = json.dumps({
+            'method': response.method,
+            'url': str(response.url),
+            'status': response.status,
+            'reason': response.reason,
+            'headers': stored_headers,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+        }).encode()
+        compressed = await asyncio.get_event_loop().run_in_executor(
+            None, zlib.compress, body)
+        data = b"".join((_META_LENGTH.pack(len(meta)), meta, compressed))
+        path = self._entry_path(fingerprint)
+        path.parent.mkdir(exist_ok=True)
+        # write aside then rename, readers never see a partial entry. One
+        # file per write, concurrent stores of an entry do not mix.
+        fd, tmp_path = tempfile.mkstemp(
+            suffix=_TMP_SUFFIX, dir=str(path.parent))
+        os.close(fd)
+        try:
+            async with aiofiles.open(tmp_path, 'wb') as fd:
+                await fd.write(data)
+            os.replace(tmp_path, str(path))
+        except BaseException:
+            self._unlink(tmp_path)
+            raise
+        if fingerprint in self._index:
+            self._size -= self._index.pop(fingerprint)[0]
+        self._index[fingerprint] = (len(data), time.time())
+        self._size += len(data)
+        self._evict()
+
+    def touch(self, fingerprint):
+        """Mark an entry as freshly validated(after a 304)."""
+        entry = self._index.pop(fingerprint, None)
+        if entry is None:
+            return
+        self._index[fingerprint] = (entry[0], time.time())
+        try:
+            os.utime(str(self._entry_path(fingerprint)))
+        except OSError:
+            pass
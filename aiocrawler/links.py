@@ -0,0 +1,120 @@
+import posixpath
+import re
+from urllib import parse as urlparse
+from aiocrawler.dupefilter import canonicalize_url
+from aiocrawler.selectors import compile_xpath
+from aiocrawler.constants import IGNORED_EXTENSIONS
+
+LINK_SCHEMES = ('http', 'https')
+
+
+def _patterns(patterns):
+    if isinstance(patterns, str):
+        patterns = (patterns,)
+    return tuple(re.compile(pattern) for pattern in patterns or ())
+
+
+def _domains(domains):
+    if isinstance(domains, str):
+        domains = (domains,)
+    return tuple(domain.lower().lstrip('.') for domain in domains or ())
+
+
+def _in_domains(host, domains):
+    return any(host == domain or host.endswith('.' + domain)
+               for domain in domains)
+
+
+class LinkExtractor(object):
+    """Absolute urls of the links of a html page, in document order and
+    without duplicates.
+
+    Links are resolved against the page url(or its <base href>), and
+    canonicalized unless canonicalize is False(the fragment is dropped
+    anyway). Only http(s) links are kept, and the ones which:
+    - match a regex of allow(if any), and none of deny,
+    - are on one of domains(subdomains included, if any) and on none of
+      deny_domains,
+    - do not end with an extension of deny_extensions(images, archives...).
+
+    tags and attrs name the attributes holding links, restrict_xpaths
+    limits the search to the nodes they select. Invalid urls(malformed
+    port or ipv6 host) are skipped.
+    """
+
+    def __init__(self, allow=(), deny=(), domains=(), deny_domains=(),
+                 deny_extensions=IGNORED_EXTENSIONS, tags=('a', 'area'),
+                 attrs=('href',), restrict_xpaths=(), canonicalize=True):
+        self.allow = _patterns(allow)
+        self.deny = _patterns(deny)
+        self.domains = _domains(domains)
+        self.deny_domains = _domains(deny_domains)
+        self.deny_extensions = frozenset(
+            extension.lower().lstrip('.') for extension in deny_extensions)
+        self.canonicalize = canonicalize
+        self._links = compile_xpath(" | ".join(
+            "descendant-or-self::{}/@{}".format(tag, attr)
+            for tag in tags for attr in attrs))
+        if isinstance(restrict_xpaths, str):
+            restrict_xpaths = (restrict_xpaths,)
+        self._restrict = tuple(
+            compile_xpath(path) for path in restrict_xpaths)
+        self._base = compile_xpath('//base/@href')
+
+    def _allowed(self, url, parts):
+        host = (parts.hostname or "").lower()
+        if not host:
+            return False
+        if self.domains and not _in_domains(host, self.domains):
+            return False
+        if self.deny_domains and _in_domains(host, self.deny_domains):
+            return False
+        extension = posixpath.splitext(parts.path)[1][1:].lower()
+        if extension and extension in self.deny_extensions:
+            return False
+        if self.allow and not any(
+                pattern.search(url) for pattern in self.allow):
+            return False
+        return not any(pattern.search(url) for pattern in self.deny)
+
+    def extract(self, response):
+        root = response.etree
+        if root is None:
+            return []
+        base_url = str(response.url)
+        base = self._base(root)
+        if base:
+            try:
+                base_url = urlparse.urljoin(base_url, base[0].strip())
+            except ValueError:
+                # an invalid <base href> is ignored.
+                pass
+        nodes = [node for path in self._restrict for node in path(root)] \
+            if self._restrict else (root,)
+        links, seen = [], set()
+        for node in nodes:
+            for href in self._links(node):
+                href = href.strip()
+                if not href or href.startswith('#'):
+                    continue
+                try:
+                    url = urlparse.urljoin(base_url, href)
+                    parts = urlparse.urlsplit(url)
+                    # raises on a malformed port.
+                    parts.port
+                except ValueError:
+                    continue
+                if parts.scheme not in LINK_SCHEMES:
+                    continue
+                if self.canonicalize:
+                    url = canonicalize_url(url)
+                else:
+                    url = urlparse.urldefrag(url)[0]
+                if url in seen:
+                    continue
+                seen.add(url)
+                if self._allowed(url, parts):
+                    links.append(url)
+        return links
+
+    __call__ = extract
@@ -1,5 +1,16 @@
+import json
 import logging
+import logging.handlers
+import queue
+import random
 import sys
+from collections import Counter
+from aiocrawler.constants import LOG_QUEUE_SIZE
+
+# attributes every LogRecord has, the others come from extra.
+_RECORD_ATTRS = frozenset(
+    logging.LogRecord('', logging.INFO, '', 0, '', (), None).__dict__) | \
+    frozenset(('message', 'asctime'))
 
 
 def has_level_handler(logger):
@@ -25,17 +36,168 @@ default_handler.setFormatter(logging.Formatter(
 ))
 
 
+class JsonFormatter(logging.Formatter):
+    """One json object per record: time, level, logger, message and the
+    fields passed as extra(event, method, url, status...).
+    """
+
+    def format(self, record):
+        data = {
+            'time': record.created,
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for name, value in record.__dict__.items():
+            if name not in _RECORD_ATTRS:
+                data[name] = value
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Thins out the records of an event(their extra 'event' field): sample
+    maps an event to the fraction of its records kept, rate to the most of
+    them kept per second. Warnings and errors are always kept.
+    """
+
+    def __init__(self, sample=None, rate=None):
+        super(SamplingFilter, self).__init__()
+        self.sample = dict(sample or {})
+        self.rate = dict(rate or {})
+        # event -> [second, records kept in it]
+        self._windows = {}
+        self.dropped = Counter()
+
+    def filter(self, record):
+        event = getattr(record, 'event', None)
+        if event is None or record.levelno >= logging.WARNING:
+            return True
+        fraction = self.sample.get(event)
+        if fraction is not None and random.random() >= fraction:
+            self.dropped[event] += 1
+            return False
+        limit = self.rate.get(event)
+        if limit is not None:
+            second = int(record.created)
+            window = self._windows.get(event)
+            if window is None or window[0] != second:
+                window = self._windows[event] = [second, 0]
+            if window[1] >= limit:
+                self.dropped[event] += 1
+                return False
+            window[1] += 1
+        return True
+
+
+class _QueueListener(logging.handlers.QueueListener):
+
+    def enqueue_sentinel(self):
+        # the queue may be full, wait for the thread to make room.
+        self.queue.put(self._sentinel)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """Hands the records to a thread which formats and writes them with
+    handlers, so that a slow stdout or file never blocks the event loop.
+
+    The queue is bounded: records which do not fit are dropped and counted.
+    """
+
+    def __init__(self, handlers, max_size=LOG_QUEUE_SIZE):
+        super(QueueHandler, self).__init__(queue.Queue(max_size))
+        self.handlers = list(handlers)
+        self.max_size = max_size
+        self.listener = None
+        self.dropped = 0
+
+    def start(self):
+        if self.listener is not None and self.listener.running:
+            return
+        # a forked process inherits the queue but not the thread.
+        self.queue = queue.Queue(self.max_size)
+        self.listener = _QueueListener(
+            self.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+        """Write the queued records and stop the thread."""
+        if self.listener is not None and self.listener.running:
+            self.listener.stop()
+
+    def prepare(self, record):
+        # formatted by the thread, the arguments are not copied.
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _json_handler(log_json):
+    if log_json is True:
+        handler = logging.StreamHandler(sys.stdout)
+    else:
+        handler = logging.FileHandler(log_json, encoding='utf-8')
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+
 def create_logger(instance):
     """Get the AioCrawl's instance logger and configure it.
     When the instance.debug is enabled, set the logger level to
     logging.DEBUG` if it is not set.
+
+    instance.log_json writes json lines(to stdout when True, else to that
+    file path) instead of text, instance.log_queue moves the formatting and
+    writing to a thread, instance.log_sample and instance.log_rate thin out
+    events, see SamplingFilter.
     """
     logger = logging.getLogger(instance.__class__.__name__)
 
     if instance.debug and logger.level == logging.NOTSET:
         logger.setLevel(logging.DEBUG)
 
-    if not has_level_handler(logger):
+    log_json = getattr(instance, 'log_json', None)
+    queued = [handler for handler in logger.handlers
+              if isinstance(handler, QueueHandler)]
+    if queued:
+        # configured by a previous instance.
+        queued[0].start()
+    elif log_json and not any(isinstance(handler.formatter, JsonFormatter)
+                              for handler in logger.handlers):
+        logger.addHandler(_json_handler(log_json))
+    elif not has_level_handler(logger):
         logger.addHandler(default_handler)
 
+    if getattr(instance, 'log_queue', False) and not queued and \
+            logger.handlers:
+        handler = QueueHandler(logger.handlers)
+        for moved in handler.handlers:
+            logger.removeHandler(moved)
+        logger.addHandler(handler)
+        handler.start()
+
+    for old in [log_filter for log_filter in logger.filters
+                if isinstance(log_filter, SamplingFilter)]:
+        logger.removeFilter(old)
+    sample = getattr(instance, 'log_sample', None)
+    rate = getattr(instance, 'log_rate', None)
+    if sample or rate:
+        logger.addFilter(SamplingFilter(sample, rate))
+
     return logger
+
+
+def close_logger(logger):
+    """Write the records still queued by the thread of a log_queue logger."""
+    for handler in logger.handlers:
+        if isinstance(handler, QueueHandler):
+            handler.stop()
@@ -0,0 +1,255 @@
+import asyncio
+import csv
+import inspect
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from aiocrawler.exceptions import DropItem
+from aiocrawler.constants import DEFAULT_SINK_BATCH_SIZE, \
+    DEFAULT_SINK_FLUSH_INTERVAL, DEFAULT_SINK_MAX_BUFFER
+
+
+class Sink(object):
+    """Destination of items, written in batches off the event loop.
+
+    Items are buffered and handed to write_batch() in a dedicated thread
+    once batch_size of them are buffered, or every flush_interval seconds.
+    put() blocks while max_buffer items are waiting, which slows the
+    parsers down to the speed of the sink.
+
+    Subclasses implement open(), write_batch(items) and close(), all run
+    in the sink's thread.
+    """
+
+    def __init__(self, batch_size=DEFAULT_SINK_BATCH_SIZE,
+                 flush_interval=DEFAULT_SINK_FLUSH_INTERVAL,
+                 max_buffer=DEFAULT_SINK_MAX_BUFFER):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max(max_buffer, batch_size)
+        self._buffer = []
+        # items handed to the thread and not written yet.
+        self._writing = 0
+        self._loop = None
+        self._executor = None
+        self._writer = None
+        self._batch_ready = None
+        self._room = None
+        self._closing = False
+        self._stopped = False
+
+    def _full(self):
+        return len(self._buffer) + self._writing >= self.max_buffer
+
+    def start(self, loop):
+        self._loop = loop
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._batch_ready = asyncio.Event()
+        self._room = asyncio.Condition()
+        self._closing = self._stopped = False
+        self._writer = asyncio.ensure_future(self._write_loop(), loop=loop)
+
+    async def put(self, item):
+        if self._full() and not self._stopped:
+            async with self._room:
+                await self._room.wait_for(
+                    lambda: self._stopped or not self._full())
+        if self._stopped:
+            # the error is raised by aclose().
+            raise RuntimeError("{} stopped writing".format(
+                self.__class__.__name__))
+        self._buffer.append(item)
+        if len(self._buffer) >= self.batch_size:
+            self._batch_ready.set()
+
+    async def _write_loop(self):
+        try:
+            await self._loop.run_in_executor(self._executor, self.open)
+            while not self._closing or self._buffer:
+                if len(self._buffer) < self.batch_size and \
+                        not self._closing:
+                    try:
+                        await asyncio.wait_for(
+                            self._batch_ready.wait(), self.flush_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                self._batch_ready.clear()
+                batch, self._buffer = self._buffer, []
+                if not batch:
+                    continue
+                self._writing = len(batch)
+                try:
+                    await self._loop.run_in_executor(
+                        self._executor, self.write_batch, batch)
+                finally:
+                    self._writing = 0
+                    async with self._room:
+                        self._room.notify_all()
+        finally:
+            self._stopped = True
+            async with self._room:
+                self._room.notify_all()
+            await self._loop.run_in_executor(self._executor, self.close)
+
+    async def aclose(self):
+        """Write the buffered items and close the sink."""
+        if self._writer is None:
+            return
+        self._closing = True
+        self._batch_ready.set()
+        try:
+            await self._writer
+        finally:
+            self._writer = None
+            self._executor.shutdown()
+
+    def open(self):
+        pass
+
+    def write_batch(self, items):
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class JsonLinesSink(Sink):
+    """Append items to path, one json document per line."""
+
+    def __init__(self, path, encoding='utf-8', **kwargs):
+        super(JsonLinesSink, self).__init__(**kwargs)
+        self.path = path
+        self.encoding = encoding
+        self._file = None
+
+    def open(self):
+        self._file = open(self.path, 'a', encoding=self.encoding)
+
+    def write_batch(self, items):
+        self._file.write("".join(
+            json.dumps(item, ensure_ascii=False, default=str) + "\n"
+            for item in items))
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class CsvSink(Sink):
+    """Append items to a csv file, fieldnames default to the keys of the
+    first item, the header is written to new files only.
+    """
+
+    def __init__(self, path, fieldnames=None, encoding='utf-8', **kwargs):
+        super(CsvSink, self).__init__(**kwargs)
+        self.path = path
+        self.fieldnames = fieldnames
+        self.encoding = encoding
+        self._file = None
+        self._csv_writer = None
+
+    def open(self):
+        self._file = open(self.path, 'a', encoding=self.encoding, newline='')
+
+    def write_batch(self, items):
+        if self._csv_writer is None:
+            fieldnames = self.fieldnames or list(items[0])
+            self._csv_writer = csv.DictWriter(
+                self._file, fieldnames, extrasaction='ignore')
+            if not self._file.tell():
+                self._csv_writer.writeheader()
+        self._csv_writer.writerows(items)
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class SqliteSink(Sink):
+    """Bulk insert items into table, one transaction per batch. The table
+    is created from the keys of the first item unless it exists.
+    """
+
+    def __init__(self, path, table, columns=None, **kwargs):
+        super(SqliteSink, self).__init__(**kwargs)
+        self.path = path
+        self.table = table
+        self.columns = columns
+        self._connection = None
+        self._insert = None
+
+    @staticmethod
+    def _quote(name):
+        return '"{}"'.format(str(name).replace('"', '""'))
+
+    def open(self):
+        # opened in the sink's thread, sqlite connections stay there.
+        self._connection = sqlite3.connect(self.path)
+
+    def _prepare(self, item):
+        columns = self.columns or list(item)
+        quoted = ", ".join(self._quote(column) for column in columns)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS {} ({})".format(
+            self._quote(self.table), quoted))
+        self._insert = "INSERT INTO {} ({}) VALUES ({})".format(
+            self._quote(self.table), quoted, ", ".join("?" * len(columns)))
+        self.columns = columns
+
+    @staticmethod
+    def _value(value):
+        if value is None or isinstance(value, (int, float, str, bytes)):
+            return value
+        return json.dumps(value, ensure_ascii=False, default=str)
+
+    def write_batch(self, items):
+        if self._insert is None:
+            self._prepare(items[0])
+        with self._connection:
+            self._connection.executemany(self._insert, (
+                [self._value(item.get(column)) for column in self.columns]
+                for item in items))
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+
+
+class ItemPipeline(object):
+    """Items(dicts) returned or yielded by the parsers go through stages,
+    then to every sink.
+
+    A stage is a function or coroutine function of the item returning the
+    item to pass on(possibly a new one), None or raising DropItem to drop
+    it: validation, cleaning, enrichment...
+    """
+
+    def __init__(self, stages=(), sinks=()):
+        self.stages = list(stages)
+        self.sinks = list(sinks)
+        self.dropped = 0
+        self.processed = 0
+
+    def start(self, loop):
+        for sink in self.sinks:
+            sink.start(loop)
+
+    async def put(self, item):
+        for stage in self.stages:
+            try:
+                item = stage(item)
+                if inspect.isawaitable(item):
+                    item = await item
+            except DropItem:
+                item = None
+            if item is None:
+                self.dropped += 1
+                return
+        self.processed += 1
+        for sink in self.sinks:
+            await sink.put(item)
+
+    async def close(self):
+        for sink in self.sinks:
+            await sink.aclose()
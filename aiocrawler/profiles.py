@@ -0,0 +1,99 @@
+import json
+import zlib
+from urllib import parse as urlparse
+import aiohttp
+from yarl import URL
+from aiocrawler.request import random_navigator_headers
+from aiocrawler.constants import DEFAULT_HEADER_PROFILES
+
+STICKY_HOST = 'host'
+
+
+class HeaderProfile(object):
+    """Headers of one browser identity, and its cookie jar."""
+
+    __slots__ = ('headers', '_cookie_jar')
+
+    def __init__(self, headers):
+        self.headers = headers
+        self._cookie_jar = None
+
+    def cookie_jar(self):
+        # built on first use, in the crawler's loop.
+        if self._cookie_jar is None:
+            self._cookie_jar = aiohttp.CookieJar(unsafe=True)
+        return self._cookie_jar
+
+
+class HeaderProfilePool(object):
+    """Header profiles built once, size of them by factory or the header
+    dicts of profiles, and handed out in turn: a request costs an index.
+
+    With sticky, the requests of a key always get the same profile: sticky
+    is 'host', or a function of the url returning a key(an account, a
+    session...). With cookies, each profile keeps its cookie jar, so that a
+    site sees the cookies and headers of one browser; it needs sticky.
+
+    Set it as the crawler's headers, or the headers of get(), post()...
+    """
+
+    def __init__(self, profiles=None, size=DEFAULT_HEADER_PROFILES,
+                 factory=random_navigator_headers, sticky=None,
+                 cookies=False):
+        if cookies and sticky is None:
+            raise ValueError("Cookie jars per profile need sticky profiles")
+        if profiles is None:
+            profiles = [factory() for _ in range(size)]
+        if not profiles:
+            raise ValueError("No header profiles")
+        self.profiles = [HeaderProfile(dict(headers)) for headers in profiles]
+        self.sticky = sticky
+        self.cookies = cookies
+        self._next = 0
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """Pool of the header dicts of a json lines file, see save()."""
+        with open(path, encoding='utf-8') as f:
+            profiles = [json.loads(line) for line in f if line.strip()]
+        return cls(profiles, **kwargs)
+
+    def save(self, path):
+        """Write the headers of the profiles, one json object per line, to
+        crawl again with the same identities.
+        """
+        with open(path, 'w', encoding='utf-8') as f:
+            for profile in self.profiles:
+                f.write(json.dumps(profile.headers) + "\n")
+
+    def __len__(self):
+        return len(self.profiles)
+
+    def profile(self, url=None):
+        if self.sticky is None or url is None:
+            index = self._next
+            self._next = (index + 1) % len(self.profiles)
+            return self.profiles[index]
+        if self.sticky == STICKY_HOST:
+            key = urlparse.urlsplit(str(url)).netloc.lower()
+        else:
+            key = self.sticky(url)
+        # stable across runs and processes, unlike hash().
+        index = zlib.crc32(str(key).encode('utf-8')) % len(self.profiles)
+        return self.profiles[index]
+
+    def __call__(self, url=None):
+        # shared, not copied: aiohttp does not modify the headers it sends.
+        return self.profile(url).headers
+
+    def request_cookies(self, url):
+        """Cookies the profile of url sends to it."""
+        return self.profile(url).cookie_jar().filter_cookies(URL(url))
+
+    def update_cookies(self, url, response):
+        """Keep the cookies set by response(and its redirects) in the jar
+        of the profile of url, the url requested.
+        """
+        cookie_jar = self.profile(url).cookie_jar()
+        for each in tuple(response.history) + (response,):
+            cookie_jar.update_cookies(each.cookies, each.url)
@@ -0,0 +1,174 @@
+import asyncio
+import random
+import time
+from aiocrawler.constants import DEFAULT_PROXY_CONCURRENCY, \
+    PROXY_EWMA_ALPHA, PROXY_ERROR_PENALTY, PROXY_MAX_FAILURES, \
+    PROXY_QUARANTINE, PROXY_QUARANTINE_MAX, PROXY_DRAWS, PROXY_IDLE_WAKE, \
+    PROXY_BUSY_WAIT
+
+
+class Proxy(object):
+    """Health of one proxy: moving averages of its latency and error rate,
+    requests in flight, and quarantine.
+    """
+    __slots__ = ('url', 'active', 'latency', 'error_rate', 'failures',
+                 'strikes', 'quarantined_until', 'next_at', 'requests',
+                 'errors')
+
+    def __init__(self, url):
+        self.url = url
+        self.active = 0
+        # untried proxies look fast, so that they get tried.
+        self.latency = 0.0
+        self.error_rate = 0.0
+        # failures in a row, and quarantines in a row.
+        self.failures = 0
+        self.strikes = 0
+        self.quarantined_until = 0
+        # earliest start of its next request, under a rate cap.
+        self.next_at = 0
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def score(self):
+        """Lower is better: latency, inflated by errors and load."""
+        return (self.latency + 0.1) * \
+            (1 + PROXY_ERROR_PENALTY * self.error_rate) * (1 + self.active)
+
+    def __repr__(self):
+        return "<Proxy {} score:{:.3f}>".format(self.url, self.score)
+
+
+class ProxyPool(object):
+    """Proxies handed out per request, healthiest first.
+
+    acquire() picks the better scored of two usable proxies drawn at
+    random(all of them are scanned when few are usable). A proxy is usable
+    with less than concurrency requests in flight, at most rate requests
+    per second(None: no cap), and out of quarantine. After max_failures
+    failures in a row it is quarantined quarantine seconds, twice as long
+    after each quarantine in a row, up to quarantine_max.
+    """
+
+    def __init__(self, proxies, concurrency=DEFAULT_PROXY_CONCURRENCY,
+                 rate=None, max_failures=PROXY_MAX_FAILURES,
+                 quarantine=PROXY_QUARANTINE,
+                 quarantine_max=PROXY_QUARANTINE_MAX):
+        if isinstance(proxies, str):
+            proxies = (proxies,)
+        self.proxies = [Proxy(url) for url in dict.fromkeys(proxies)]
+        if not self.proxies:
+            raise ValueError("No proxies")
+        self.concurrency = concurrency
+        self.rate = rate
+        self.max_failures = max_failures
+        self.quarantine = quarantine
+        self.quarantine_max = quarantine_max
+        # set when a proxy gets usable again, made in the running loop.
+        self._freed = None
+
+    def __len__(self):
+        return len(self.proxies)
+
+    @property
+    def healthy(self):
+        """Proxies out of quarantine."""
+        now = time.monotonic()
+        return [proxy for proxy in self.proxies
+                if proxy.quarantined_until <= now]
+
+    def _usable(self, proxy, now, exclude):
+        return proxy.active < self.concurrency and \
+            proxy.quarantined_until <= now and proxy.next_at <= now and \
+            proxy.url != exclude
+
+    def _pick(self, now, exclude):
+        # power of two choices: close to the best, in O(1).
+        best = None
+        for _ in range(PROXY_DRAWS):
+            proxy = random.choice(self.proxies)
+            if self._usable(proxy, now, exclude):
+                if best is None:
+                    best = proxy
+                elif proxy is not best:
+                    return min(best, proxy, key=lambda each: each.score)
+        if best is not None:
+            return best
+        usable = [proxy for proxy in self.proxies
+                  if self._usable(proxy, now, exclude)]
+        return min(usable, key=lambda each: each.score) if usable else None
+
+    def _wake_in(self, now):
+        # until the next quarantine or rate cap ends, None if the proxies
+        # out of them are all at their concurrency cap.
+        waits = [max(proxy.quarantined_until, proxy.next_at) - now
+                 for proxy in self.proxies
+                 if proxy.active < self.concurrency]
+        waits = [wait for wait in waits if wait > 0]
+        return min(waits) if waits else None
+
+    def wait_time(self):
+        """Seconds before a proxy may be usable again."""
+        wait = self._wake_in(time.monotonic())
+        if any(proxy.active >= self.concurrency for proxy in self.proxies):
+            # one of them may be released any time.
+            return PROXY_BUSY_WAIT if wait is None else \
+                min(wait, PROXY_BUSY_WAIT)
+        return PROXY_BUSY_WAIT if wait is None else wait
+
+    def acquire_nowait(self, exclude=None):
+        """Proxy for a request, released by release(), or None if none is
+        usable now. exclude is the url of a proxy to avoid(it just failed
+        the request) if the others are not all quarantined.
+        """
+        now = time.monotonic()
+        proxy = self._pick(now, exclude)
+        if proxy is None and exclude is not None and not any(
+                each.quarantined_until <= now for each in self.proxies
+                if each.url != exclude):
+            # the others are down: better the same one than none.
+            proxy = self._pick(now, None)
+        if proxy is not None:
+            proxy.active += 1
+            proxy.requests += 1
+            if self.rate:
+                proxy.next_at = max(proxy.next_at, now) + 1.0 / self.rate
+        return proxy
+
+    async def acquire(self, exclude=None):
+        """Like acquire_nowait(), waiting for a usable proxy."""
+        while True:
+            proxy = self.acquire_nowait(exclude)
+            if proxy is not None:
+                return proxy
+            if self._freed is None:
+                self._freed = asyncio.Event()
+            self._freed.clear()
+            wait = self._wake_in(time.monotonic())
+            try:
+                await asyncio.wait_for(
+                    self._freed.wait(),
+                    PROXY_IDLE_WAKE if wait is None else wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self, proxy):
+        proxy.active -= 1
+        if self._freed is not None:
+            self._freed.set()
+
+    def success(self, proxy, latency):
+        proxy.latency += PROXY_EWMA_ALPHA * (latency - proxy.latency)
+        proxy.error_rate -= PROXY_EWMA_ALPHA * proxy.error_rate
+        proxy.failures = proxy.strikes = 0
+
+    def failure(self, proxy):
+        proxy.errors += 1
+        proxy.error_rate += PROXY_EWMA_ALPHA * (1 - proxy.error_rate)
+        proxy.failures += 1
+        if proxy.failures >= self.max_failures:
+            proxy.quarantined_until = time.monotonic() + min(
+                self.quarantine * 2 ** proxy.strikes, self.quarantine_max)
+            proxy.strikes += 1
+            proxy.failures = 0
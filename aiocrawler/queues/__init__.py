@@ -1,4 +1,5 @@
 from .redis_queue import AioRedisQueue, AioRedisLifoQueue
+from .redis_scheduler import RedisScheduler
 
 
-__all__ = [AioRedisQueue, AioRedisLifoQueue]
+__all__ = [AioRedisQueue, AioRedisLifoQueue, RedisScheduler]
@@ -1,18 +1,75 @@
 import aioredis
 import asyncio
 import time
-import umsgpack
 from aiocrawler.exceptions import QueueEmpty, QueueFull
 from aiocrawler.crawler import async_loop
 from aiocrawler.constants import QUEUE_BLOCK_SLEEP_INTERVAL, \
-    AIOREDIS_POOL_MIN_SIZE, AIOREDIS_POOL_MAX_SIZE
+    AIOREDIS_POOL_MIN_SIZE, AIOREDIS_POOL_MAX_SIZE, REDIS_BATCH_SIZE
+
+try:
+    import msgpack
+
+    class _MsgpackCodec(object):
+        @staticmethod
+        def packb(obj):
+            return msgpack.packb(obj, use_bin_type=True)
+
+        @staticmethod
+        def unpackb(data):
+            return msgpack.unpackb(data, raw=False)
+
+    default_codec = _MsgpackCodec
+except ImportError:
+    import umsgpack as default_codec
+
+
+# Push ARGV[3:] unless the list would grow beyond ARGV[1] items, ARGV[2]
+# items at a time as lua unpack() is limited in size.
+BOUNDED_PUSH_SCRIPT = """
+if redis.call('LLEN', KEYS[1]) + #ARGV - 2 > tonumber(ARGV[1]) then
+    return -1
+end
+local length = 0
+local batch = tonumber(ARGV[2])
+for i = 3, #ARGV, batch do
+    length = redis.call('RPUSH', KEYS[1],
+                        unpack(ARGV, i, math.min(i + batch - 1, #ARGV)))
+end
+return length
+"""
+
+# Pop up to ARGV[1] items from the head of the list.
+POP_MANY_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], 0, ARGV[1] - 1)
+redis.call('LTRIM', KEYS[1], ARGV[1], -1)
+return items
+"""
+
+# Pop up to ARGV[1] items from the tail of the list, newest first.
+POP_MANY_LIFO_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], -ARGV[1], -1)
+redis.call('LTRIM', KEYS[1], 0, -ARGV[1] - 1)
+local popped = {}
+for i = #items, 1, -1 do
+    popped[#popped + 1] = items[i]
+end
+return popped
+"""
 
 
 class AioRedisQueue(object):
+    """Redis list backed FIFO queue.
+
+    Items are serialized with codec, any object with packb/unpackb, msgpack
+    when installed, otherwise the pure-python umsgpack.
+    """
+    _pop_command = "LPOP"
+    _block_pop_command = "BLPOP"
+    _pop_many_script = POP_MANY_SCRIPT
 
     def __init__(self, name, host="localhost", port=6379, db=0, max_size=0,
                  password=None, loop=None, timeout=None, ssl=None,
-                 encoding=None):
+                 encoding=None, codec=None):
         self._name = name
         self._host = host
         self._port = port
@@ -21,15 +78,21 @@ class AioRedisQueue(object):
         self._timeout = timeout
         self._ssl = ssl
         self._encoding = encoding
+        self._codec = codec or default_codec
         if loop is None:
             self._loop = async_loop.new_event_loop()
         else:
             self._loop = loop
         self._max_size = max_size
         self._pool = None
+        self._connect_lock = None
 
     async def connect(self):
-        with await asyncio.Lock():
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._pool:
+                return
             self._pool = await aioredis.create_pool(
                 (self._host, self._port), db=self._db, password=self._password,
                 ssl=self._ssl, encoding=self._encoding, loop=self._loop,
@@ -41,10 +104,23 @@ class AioRedisQueue(object):
             self._pool.close()
             await self._pool.wait_closed()
 
-    async def qsize(self):
+    @property
+    def name(self):
+        return self._name
+
+    def pack(self, item):
+        return self._codec.packb(item)
+
+    def unpack(self, serialized_item):
+        return self._codec.unpackb(serialized_item)
+
+    async def execute(self, command, *args):
         if not self._pool:
             await self.connect()
-        return await self._pool.execute("LLEN", self._name)
+        return await self._pool.execute(command, *args)
+
+    async def qsize(self):
+        return await self.execute("LLEN", self._name)
 
     async def empty(self):
         return await self.qsize() == 0
@@ -54,13 +130,29 @@ class AioRedisQueue(object):
             return False
         return await self.qsize() >= self._max_size
 
+    async def _push(self, serialized_items):
+        # one round-trip, the size check and the push are atomic.
+        if not self._max_size:
+            return await self.execute("RPUSH", self._name, *serialized_items)
+        length = await self.execute(
+            "EVAL", BOUNDED_PUSH_SCRIPT, 1, self._name, self._max_size,
+            REDIS_BATCH_SIZE, *serialized_items)
+        if length < 0:
+            raise QueueFull
+        return length
+
     # no wait for full, but still async
     async def put_nowait(self, item):
-        if not self._pool:
-            await self.connect()
-        if await self.full():
-            raise QueueFull
-        await self._pool.execute("RPUSH", self._name, umsgpack.packb(item))
+        await self._push((self.pack(item),))
+        return True
+
+    async def put_many(self, items):
+        """Push items in one round-trip, all of them or, if they do not
+        fit, none of them and raise QueueFull.
+        """
+        serialized_items = [self.pack(item) for item in items]
+        if serialized_items:
+            await self._push(serialized_items)
         return True
 
     async def put(self, item, block=True, timeout=None):
@@ -83,39 +175,33 @@ class AioRedisQueue(object):
                     raise
 
     async def _get(self):
-        if not self._pool:
-            await self.connect()
-        return await self._pool.execute("LPOP", self._name)
+        return await self.execute(self._pop_command, self._name)
 
     async def get_nowait(self):
-        if not self._pool:
-            await self.connect()
         serialized_item = await self._get()
         if serialized_item is None:
             raise QueueEmpty
-        return umsgpack.unpackb(serialized_item)
+        return self.unpack(serialized_item)
+
+    async def get_many(self, count):
+        """Pop up to count items in one round-trip, [] if empty."""
+        serialized_items = await self.execute(
+            "EVAL", self._pop_many_script, 1, self._name, count)
+        return [self.unpack(item) for item in serialized_items]
 
     async def get(self, block=True, timeout=None):
         if not block:
             return await self.get_nowait()
         timeout = timeout or self._timeout
-        start_time = time.time()
-
-        while True:
-            try:
-                return await self.get_nowait()
-            except QueueEmpty:
-                if not timeout:
-                    await asyncio.sleep(QUEUE_BLOCK_SLEEP_INTERVAL)
-                    continue
-                lasted = time.time() - start_time
-                if lasted < timeout:
-                    await asyncio.sleep(min(timeout, timeout-lasted))
-                else:  # timeout
-                    raise
+        # blocks on the server, timeout 0 blocks forever.
+        popped = await self.execute(
+            self._block_pop_command, self._name, timeout or 0)
+        if popped is None:
+            raise QueueEmpty
+        return self.unpack(popped[1])
 
 
 class AioRedisLifoQueue(AioRedisQueue):
-
-    async def _get(self):
-        return self._pool.execute("RPOP", self._name)
+    _pop_command = "RPOP"
+    _block_pop_command = "BRPOP"
+    _pop_many_script = POP_MANY_LIFO_SCRIPT
@@ -0,0 +1,246 @@
+import asyncio
+import time
+from collections import deque
+from aiocrawler.request import Request
+from aiocrawler.dupefilter import RedisSeenStore
+from aiocrawler.scheduler import HostScheduler
+from aiocrawler.constants import QUEUE_BLOCK_SLEEP_INTERVAL, \
+    DEFAULT_LEASE_TIMEOUT, DEFAULT_REDIS_PREFETCH, REDIS_BATCH_SIZE, \
+    LEASE_RENEWALS
+
+
+# ARGV is fingerprint, item pairs: push the items not seen yet.
+DEDUP_PUSH_SCRIPT = """
+local pushed = 0
+for i = 1, #ARGV, 2 do
+    if redis.call('SADD', KEYS[2], ARGV[i]) == 1 then
+        redis.call('RPUSH', KEYS[1], ARGV[i + 1])
+        pushed = pushed + 1
+    end
+end
+return pushed
+"""
+
+# Pop up to ARGV[2] items from the pending list and lease them until ARGV[1].
+LEASE_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], 0, ARGV[2] - 1)
+redis.call('LTRIM', KEYS[1], ARGV[2], -1)
+for _, item in ipairs(items) do
+    redis.call('ZADD', KEYS[2], ARGV[1], item)
+end
+return items
+"""
+
+# Push every lease which expired before ARGV[1] back to the pending list.
+REQUEUE_SCRIPT = """
+local items = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for _, item in ipairs(items) do
+    redis.call('RPUSH', KEYS[1], item)
+    redis.call('ZREM', KEYS[2], item)
+end
+return #items
+"""
+
+
+class RedisScheduler(HostScheduler):
+    """HostScheduler whose frontier and seen-set live in redis, so several
+    crawler processes can share one crawl.
+
+    New requests are deduplicated against the local seen-store first, then
+    against the shared RedisSeenStore, and pushed to the AioRedisQueue as
+    serialized Request dicts. Every node leases requests into its local
+    per-host queues and acks them once done. A node renews the leases it
+    holds(queued, running or waiting for a retry) while it runs, leases
+    which are not renewed or acked in lease_timeout seconds(the node died)
+    are requeued. Batches which redis fails to take are logged to logger
+    and pushed again.
+
+    The frontier, seen-set and leases stay in redis after the crawl, see
+    reset().
+    """
+
+    def __init__(self, queue, parsers, lease_timeout=DEFAULT_LEASE_TIMEOUT,
+                 prefetch=DEFAULT_REDIS_PREFETCH, logger=None, **kwargs):
+        super(RedisScheduler, self).__init__(**kwargs)
+        self.logger = logger
+        self._queue = queue
+        self._parsers = parsers
+        self._lease_timeout = lease_timeout
+        self._prefetch = prefetch
+        self._leases_key = "{}:leases".format(queue.name)
+        self._shared_seen = RedisSeenStore(
+            queue, "{}:seen".format(queue.name))
+        # (fingerprint, serialized request) pairs not pushed yet.
+        self._outbox = deque()
+        self._flusher = None
+        self._pulling = False
+        self._next_requeue = 0
+        # requests leased by this node and not acked yet.
+        self._leased = set()
+        self._renewer = None
+        # leased requests handed to put_later, not to ack when done.
+        self._retrying = set()
+
+    async def reset(self):
+        """Delete the frontier, seen-set and leases of the crawl, to start
+        it over.
+        """
+        await self._queue.execute(
+            "DEL", self._queue.name, self._shared_seen.key, self._leases_key)
+
+    def _log_error(self, message, *args):
+        if self.logger is not None:
+            self.logger.error("[REDIS] %s " + message, self._queue.name,
+                              *args, exc_info=True, extra={'event': 'redis'})
+
+    def put_nowait(self, request):
+        if self._too_deep(request) or \
+                self._admit is not None and not self._admit(request):
+            return False
+        if self._seen is not None and \
+                not self._seen.add(request.fingerprint()):
+            return False
+        # host budgets are spent per node.
+        if self._over_budget(request):
+            return False
+        # packed here, an unserializable request fails its caller.
+        self._outbox.append((request.fingerprint(),
+                             self._queue.pack(request.to_dict())))
+        self._unfinished += 1
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.ensure_future(
+                self._flush(), loop=self._loop)
+        return True
+
+    async def _flush(self):
+        while self._outbox:
+            batch = [self._outbox.popleft() for _ in range(
+                min(len(self._outbox), REDIS_BATCH_SIZE))]
+            args = [arg for pair in batch for arg in pair]
+            try:
+                # dedup and push the whole batch in one round-trip.
+                await self._queue.execute(
+                    "EVAL", DEDUP_PUSH_SCRIPT, 2, self._queue.name,
+                    self._shared_seen.key, *args)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self._log_error("Push of %s requests failed", len(batch))
+                # pushed again, in order, before the newer requests.
+                self._outbox.extendleft(reversed(batch))
+                await asyncio.sleep(QUEUE_BLOCK_SLEEP_INTERVAL)
+                continue
+            for _ in batch:
+                self._finish_one()
+
+    async def _fill(self):
+        await super(RedisScheduler, self)._fill()
+        if self._pulling:
+            return
+        self._pulling = True
+        try:
+            await self._requeue_expired()
+            count = self._prefetch - self._size
+            if count <= 0:
+                return
+            leased = await self._queue.execute(
+                "EVAL", LEASE_SCRIPT, 2, self._queue.name, self._leases_key,
+                time.time() + self._lease_timeout, count)
+            for raw in leased:
+                request = Request.from_dict(
+                    self._queue.unpack(raw), self._parsers)
+                request.lease = raw
+                self._leased.add(request)
+                self._put(request)
+            if self._leased and self._renewer is None:
+                self._renewer = asyncio.ensure_future(
+                    self._renew_leases(), loop=self._loop)
+        finally:
+            self._pulling = False
+
+    async def _renew_leases(self):
+        interval = self._lease_timeout / LEASE_RENEWALS
+        while True:
+            await asyncio.sleep(interval)
+            if not self._leased:
+                continue
+            deadline = time.time() + self._lease_timeout
+            args = []
+            for request in self._leased:
+                args.append(deadline)
+                args.append(request.lease)
+            try:
+                # XX: acked leases are not added back.
+                await self._queue.execute(
+                    "ZADD", self._leases_key, "XX", *args)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self._log_error("Renewal of %s leases failed",
+                                len(self._leased))
+
+    async def _requeue_expired(self):
+        now = time.time()
+        if now < self._next_requeue:
+            return
+        self._next_requeue = now + QUEUE_BLOCK_SLEEP_INTERVAL
+        await self._queue.execute(
+            "EVAL", REQUEUE_SCRIPT, 2, self._queue.name,
+            self._leases_key, now)
+
+    def _next_wakeup(self):
+        # poll redis for requests pushed by other nodes.
+        wakeup = super(RedisScheduler, self)._next_wakeup()
+        if self._saturated():
+            return None
+        if wakeup is None:
+            return QUEUE_BLOCK_SLEEP_INTERVAL
+        return min(wakeup, QUEUE_BLOCK_SLEEP_INTERVAL)
+
+    def put_later(self, request, delay):
+        super(RedisScheduler, self).put_later(request, delay)
+        if request.lease is not None:
+            # still leased, and renewed, until its last try.
+            self._retrying.add(request)
+
+    def task_done(self, request):
+        self._release(request)
+        if request in self._retrying:
+            # acked after its last try.
+            self._retrying.discard(request)
+            return self._finish_one()
+        self._leased.discard(request)
+        asyncio.ensure_future(self._ack(request), loop=self._loop)
+
+    async def _ack(self, request):
+        try:
+            # follow-up requests must be in redis before the ack, or the
+            # crawl could look finished to the other nodes.
+            if self._flusher is not None and not self._flusher.done():
+                await self._flusher
+            await self._queue.execute(
+                "ZREM", self._leases_key, request.lease)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # the lease expires and the request is fetched again.
+            self._log_error("Ack of %s failed", request.url)
+        finally:
+            self._finish_one()
+
+    async def _remote_idle(self):
+        await self._requeue_expired()
+        return not await self._queue.qsize() and \
+            not await self._queue.execute("ZCARD", self._leases_key)
+
+    async def join(self):
+        while True:
+            await super(RedisScheduler, self).join()
+            if await self._remote_idle():
+                return
+            await asyncio.sleep(QUEUE_BLOCK_SLEEP_INTERVAL)
+
+    async def close(self):
+        if self._renewer is not None:
+            self._renewer.cancel()
+        await self._queue.close()
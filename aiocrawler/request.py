@@ -1,5 +1,7 @@
+import json
 from user_agent import generate_user_agent, generate_navigator, \
     generate_navigator_js
+from aiocrawler.dupefilter import request_fingerprint
 
 
 # Factory Mode
@@ -25,3 +27,94 @@ def random_user_agent(*args):
         'User-Agent': generate_user_agent()
     }
 
+
+class Request(object):
+    """A pending request in the frontier."""
+    # optional fields and their defaults, serialized and copied by replace()
+    OPTIONS = (
+        ('sleep', None),
+        ('file', None),
+        # download() integrity checks and parallel byte-range segments.
+        ('size', None),
+        ('checksum', None),
+        ('segments', None),
+        # retry budget(None: the crawler's max_tries) and attempts so far.
+        ('max_tries', None),
+        ('tries', 0),
+        # 'xml', 'json' or 'ndjson': hand a StreamResponse to the parser.
+        ('stream', None),
+        ('stream_tag', None),
+        # links followed from the seeds(None: a seed), and the rank in a
+        # best-first frontier, higher first.
+        ('depth', None),
+        ('priority', 0),
+        # url of the proxy of the last failed try, avoided by the next.
+        ('failed_proxy', None),
+    )
+    __slots__ = ('method', 'url', 'parser', 'kwargs', 'host', 'lease',
+                 '_fingerprint') + tuple(name for name, _ in OPTIONS)
+
+    def __init__(self, method, url, parser=None, kwargs=None, **options):
+        self.method = method
+        self.url = url
+        self.parser = parser
+        self.kwargs = kwargs or {}
+        for name, default in self.OPTIONS:
+            setattr(self, name, options.pop(name, default))
+        if options:
+            raise TypeError("Unexpected Request options: {}".format(
+                ", ".join(options)))
+        self.host = None
+        # serialized form leased from a shared frontier, acked when done.
+        self.lease = None
+        self._fingerprint = None
+
+    def _options(self):
+        return {name: getattr(self, name) for name, _ in self.OPTIONS}
+
+    def replace(self, url):
+        """Copy of this request for another url, sources are expanded
+        from a url-less template request this way.
+        """
+        return Request(self.method, url, parser=self.parser,
+                       kwargs=self.kwargs, **self._options())
+
+    def fingerprint(self):
+        """64-bit fingerprint of method, canonical url, body and download
+        target.
+        """
+        if self._fingerprint is None:
+            body = self.kwargs.get('data')
+            if self.kwargs.get('json') is not None:
+                body = json.dumps(self.kwargs['json'], sort_keys=True)
+            self._fingerprint = request_fingerprint(
+                self.method, self.url, params=self.kwargs.get('params'),
+                body=body, file=self.file)
+        return self._fingerprint
+
+    def to_dict(self):
+        """Serializable form, the parser is referenced by name."""
+        data = self._options()
+        data.update(
+            method=self.method,
+            url=self.url,
+            parser=getattr(self.parser, '__name__', self.parser),
+            kwargs=self.kwargs,
+        )
+        return data
+
+    @classmethod
+    def from_dict(cls, data, parsers):
+        """Rebuild a request, parser names are looked up on parsers,
+        usually the crawler instance.
+        """
+        parser = data['parser']
+        if parser is not None:
+            parser = getattr(parsers, parser)
+        options = {name: data[name] for name, _ in cls.OPTIONS
+                   if name in data}
+        return cls(data['method'], data['url'], parser=parser,
+                   kwargs=data['kwargs'], **options)
+
+    def __repr__(self):
+        return "<Request [{}] {}>".format(self.method, self.url)
@@ -0,0 +1,137 @@
+import asyncio
+import ipaddress
+import itertools
+import socket
+import time
+from urllib import parse as urlparse
+from aiohttp.abc import AbstractResolver
+from aiohttp.resolver import AsyncResolver, DefaultResolver
+from aiocrawler.constants import DEFAULT_DNS_CACHE_TTL, \
+    DNS_NEGATIVE_CACHE_TTL, DNS_CACHE_MAX_SIZE, DNS_PREFETCH_CONCURRENCY, \
+    DNS_PREFETCH_PENDING
+
+try:
+    import aiodns
+except ImportError:
+    aiodns = None
+
+_BaseResolver = DefaultResolver if aiodns is None else AsyncResolver
+
+
+class CachingResolver(AbstractResolver):
+    """aiohttp resolver caching the answers of an underlying resolver(the
+    aiodns based one when aiodns is installed) for ttl seconds.
+
+    Concurrent lookups of a host share one query, failures are cached for
+    a few seconds. With prefetch, the crawler resolves the hosts of new
+    frontier requests in the background, before they are fetched(with the
+    family of its connector, 0 for any by default).
+    """
+
+    def __init__(self, ttl=DEFAULT_DNS_CACHE_TTL, prefetch=True,
+                 resolver=None, loop=None):
+        self._loop = loop or asyncio.get_event_loop()
+        self._resolver = resolver or _BaseResolver(loop=self._loop)
+        self.ttl = ttl
+        self.prefetch_enabled = prefetch
+        # (host, family) -> (expires at, addresses or the lookup error)
+        self._cache = {}
+        self._pending = {}
+        self._prefetching = 0
+        self._prefetch_semaphore = asyncio.Semaphore(
+            DNS_PREFETCH_CONCURRENCY)
+        self.hits = 0
+        self.misses = 0
+        self.prefetches = 0
+
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        key = (host, family)
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            addresses = entry[1]
+        else:
+            self.misses += 1
+            addresses = await self._lookup(key)
+        if isinstance(addresses, Exception):
+            raise addresses
+        # cached with port 0, the same answer serves http and https.
+        return [dict(address, port=port) for address in addresses]
+
+    def _start(self, key, query):
+        future = self._pending[key] = asyncio.ensure_future(
+            query, loop=self._loop)
+        future.add_done_callback(lambda _: self._pending.pop(key, None))
+        return future
+
+    async def _lookup(self, key):
+        future = self._pending.get(key)
+        if future is None:
+            future = self._start(key, self._query(key))
+        return await asyncio.shield(future)
+
+    async def _prefetch(self, key):
+        try:
+            async with self._prefetch_semaphore:
+                return await self._query(key)
+        finally:
+            self._prefetching -= 1
+
+    async def _query(self, key):
+        host, family = key
+        try:
+            addresses = await self._resolver.resolve(host, 0, family)
+            ttl = self.ttl
+        except OSError as e:
+            addresses, ttl = e, DNS_NEGATIVE_CACHE_TTL
+        now = time.monotonic()
+        if len(self._cache) >= DNS_CACHE_MAX_SIZE:
+            self._prune(now)
+        self._cache.pop(key, None)
+        self._cache[key] = (now + ttl, addresses)
+        return addresses
+
+    def _prune(self, now):
+        for key, (expires_at, _) in list(self._cache.items()):
+            if expires_at <= now:
+                del self._cache[key]
+        # still full: drop the oldest answers.
+        excess = len(self._cache) - DNS_CACHE_MAX_SIZE // 2
+        for key in list(itertools.islice(self._cache, max(excess, 0))):
+            del self._cache[key]
+
+    def prefetch(self, url, family=0):
+        """Resolve the host of url in the background, unless it is cached
+        or too many prefetches are pending already.
+        """
+        if not self.prefetch_enabled or \
+                self._prefetching >= DNS_PREFETCH_PENDING:
+            return
+        host = urlparse.urlsplit(str(url)).hostname
+        if not host:
+            return
+        try:
+            ipaddress.ip_address(host)
+            return
+        except ValueError:
+            pass
+        key = (host, family)
+        entry = self._cache.get(key)
+        if key in self._pending or \
+                entry is not None and entry[0] > time.monotonic():
+            return
+        self._prefetching += 1
+        self.prefetches += 1
+        # lookups of the host meanwhile wait for this one.
+        self._start(key, self._prefetch(key))
+
+    def stats(self):
+        return {
+            'dns_cache_hits': self.hits,
+            'dns_cache_misses': self.misses,
+            'dns_prefetches': self.prefetches,
+            'dns_cache_size': len(self._cache),
+        }
+
+    async def close(self):
+        await self._resolver.close()
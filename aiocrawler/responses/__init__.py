@@ -1,8 +1,9 @@
 from .responses import JsonResponse, HtmlResponse, XmlResponse
+from .stream import StreamResponse
 from .wrap import ResponseTypes
 
 
-__all__ = [JsonResponse, HtmlResponse, XmlResponse]
+__all__ = [JsonResponse, HtmlResponse, XmlResponse, StreamResponse]
 
 
 async def wrap_response(response):
@@ -0,0 +1,51 @@
+from http.cookies import SimpleCookie
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+
+
+class CachedResponse(object):
+    """Stand-in for an aiohttp ClientResponse, rebuilt from a cached body
+    and headers, which wrap_response() accepts like a real one.
+    """
+
+    def __init__(self, method, url, status, reason, headers, body):
+        self.method = method
+        self._url = URL(url)
+        self._request_info = None
+        self.status = status
+        self.reason = reason
+        self.cookies = SimpleCookie()
+        self.headers = CIMultiDictProxy(CIMultiDict(headers))
+        self.raw_headers = tuple(
+            (name.encode(), value.encode()) for name, value in headers)
+        self._body = body
+        content_type = self.headers.get('Content-Type', '')
+        self.content_type, _, params = content_type.partition(';')
+        self.content_type = self.content_type.strip().lower()
+        self.charset = None
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'charset':
+                self.charset = value.strip().strip('"\'') or None
+
+    @property
+    def url(self):
+        return self._url
+
+    @property
+    def content(self):
+        return None
+
+    @property
+    def request_info(self):
+        return self._request_info
+
+    async def read(self):
+        return self._body
+
+    async def text(self, encoding=None, errors='replace'):
+        return self._body.decode(
+            encoding or self.charset or 'utf-8', errors=errors)
+
+    def release(self):
+        pass
@@ -0,0 +1,131 @@
+import codecs
+import re
+from collections import OrderedDict
+from urllib import parse as urlparse
+from aiocrawler.constants import CHARSET_SNIFF_SIZE, CHARSET_DETECT_SIZE, \
+    CHARSET_CACHE_MAX_SIZE
+
+try:
+    import cchardet as chardet
+except ImportError:
+    try:
+        import chardet
+    except ImportError:
+        chardet = None
+
+
+_NON_ASCII = re.compile(rb'[\x80-\xff]')
+
+_BOMS = (
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+# <meta charset="..."> or <meta http-equiv=... content="...; charset=...">,
+# and <?xml ... encoding="..."?>.
+_META_CHARSET = re.compile(
+    br'<meta[^>]+charset\s*=\s*["\']?\s*([a-zA-Z0-9_.:-]+)', re.I)
+_XML_ENCODING = re.compile(
+    br'^\s*<\?xml[^>]+encoding\s*=\s*["\']([a-zA-Z0-9_.:-]+)', re.I)
+
+# host -> charset of its last pages, least recently used first.
+_host_charsets = OrderedDict()
+
+
+def normalize(charset):
+    """Python codec name of charset, None if it is unknown."""
+    if not charset:
+        return None
+    try:
+        return codecs.lookup(charset.strip().strip('"\'')).name
+    except LookupError:
+        return None
+
+
+def sniff(body):
+    """Charset given by the BOM, or by a meta tag or xml declaration in the
+    first KB of body.
+    """
+    charset = bom_charset(body)
+    if charset is not None:
+        return charset
+    head = body[:CHARSET_SNIFF_SIZE]
+    match = _XML_ENCODING.search(head) or _META_CHARSET.search(head)
+    if match is None:
+        return None
+    charset = normalize(match.group(1).decode('ascii'))
+    # utf-16 pages have a BOM, the declaration was not decoded as utf-16.
+    if charset is not None and charset.startswith('utf-16'):
+        return 'utf-8'
+    return charset
+
+
+def _host(url):
+    return urlparse.urlsplit(str(url)).hostname
+
+
+def learn(url, charset):
+    host = _host(url)
+    if host is None:
+        return
+    _host_charsets.pop(host, None)
+    _host_charsets[host] = charset
+    if len(_host_charsets) > CHARSET_CACHE_MAX_SIZE:
+        _host_charsets.popitem(last=False)
+
+
+def learned(url):
+    return _host_charsets.get(_host(url))
+
+
+def detect(body):
+    """Charset of a body without any declaration: utf-8 if it decodes,
+    else the guess of chardet(on the first 64KB) when it is installed.
+    """
+    try:
+        codecs.decode(body, 'utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    if chardet is not None:
+        guess = chardet.detect(body[:CHARSET_DETECT_SIZE])
+        charset = normalize(guess.get('encoding'))
+        if charset is not None:
+            return charset
+    return 'cp1252'
+
+
+def bom_charset(body):
+    for bom, charset in _BOMS:
+        if body.startswith(bom):
+            return charset
+    return None
+
+
+def json_charset(header_charset, body):
+    """Charset of a json body: from the Content-Type header or the BOM,
+    else utf-8 as json is utf-8. Pages of the host have nothing to do with
+    it.
+    """
+    return normalize(header_charset) or bom_charset(body) or 'utf-8'
+
+
+def body_charset(url, header_charset, body):
+    """Charset to decode body with: from the Content-Type header, the BOM
+    or a meta tag, the one learned from other pages of the host, or
+    detected at last(and learned, unless the body is ascii).
+    """
+    charset = normalize(header_charset) or sniff(body)
+    if charset is not None:
+        learn(url, charset)
+        return charset
+    charset = learned(url)
+    if charset is None:
+        charset = detect(body)
+        # any charset reads an ascii page, it tells nothing of the host.
+        if _NON_ASCII.search(body) is not None:
+            learn(url, charset)
+    return charset
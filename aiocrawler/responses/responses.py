@@ -1,6 +1,11 @@
+import threading
 from lxml import etree
+from multidict import CIMultiDict
 from pyquery import PyQuery
 from aiocrawler.exceptions import JsonDecodeError
+from aiocrawler.selectors import compile_xpath, css_to_xpath
+from aiocrawler.links import LinkExtractor
+from .charset import body_charset, json_charset
 
 try:
     from ujson import loads as json_loads
@@ -10,78 +15,202 @@ except ImportError:
     # PY35 only support str not bytes.
     if sys.version_info[:2] == (3, 5):
         def json_loads(data):
-            return json.loads(data.decode())
+            if isinstance(data, bytes):
+                data = data.decode()
+            return json.loads(data)
     else:
         json_loads = json.loads
 
+# json is read from the bytes as they are in these charsets.
+_JSON_BYTES_CHARSETS = ('utf-8', 'ascii')
 
-class _BaseResponse(object):
+# lxml parsers by charset, building them is not free. Per thread: a parser
+# parses one document at a time, the thread pool parsers would wait.
+_local = threading.local()
+
+
+def _html_parser(charset):
+    parsers = getattr(_local, 'html_parsers', None)
+    if parsers is None:
+        parsers = _local.html_parsers = {}
+    parser = parsers.get(charset)
+    if parser is None:
+        parser = parsers[charset] = etree.HTMLParser(encoding=charset)
+    return parser
+
+
+class _DetachedResponse(object):
+    """Picklable copy of the metadata of a raw response, without its body
+    stream, sent to process pool parsers.
+    """
+
+    __slots__ = ('content_type', 'charset', 'method', 'url', 'status',
+                 'reason', 'cookies', 'headers', 'raw_headers')
+
+    content = None
+    request_info = None
 
     def __init__(self, response):
-        self.__dict__.update(
-            content_type=response.content_type,
-            charset=response.charset,
-            method=response.method,
-            content=response.content,
-            request_info=response.__dict__["_request_info"],
-            url=response.__dict__["_url"],
-            status=response.__dict__["status"],
-            cookies=response.__dict__["cookies"],
-            headers=response.__dict__["headers"],
-            raw_headers=response.__dict__["raw_headers"],
-            reason=response.reason
-        )
+        for name in self.__slots__:
+            setattr(self, name, getattr(response, name))
+        self.headers = CIMultiDict(response.headers)
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+class _BaseResponse(object):
+    """Wrapper of a raw(aiohttp or cached) response and its body bytes,
+    its attributes are read from the raw response when asked.
+    """
+
+    __slots__ = ('_response', 'body', 'type', 'request', '_charset',
+                 '_text')
+
+    def __init__(self, response, body=None):
+        self._response = response
+        self.body = body
+        # the Request it answers, set by the crawler.
+        self.request = None
+        self._charset = None
+        self._text = None
+
+    content_type = property(lambda self: self._response.content_type)
+    method = property(lambda self: self._response.method)
+    content = property(lambda self: self._response.content)
+    request_info = property(lambda self: self._response.request_info)
+    url = property(lambda self: self._response.url)
+    status = property(lambda self: self._response.status)
+    reason = property(lambda self: self._response.reason)
+    cookies = property(lambda self: self._response.cookies)
+    headers = property(lambda self: self._response.headers)
+    raw_headers = property(lambda self: self._response.raw_headers)
+
+    @property
+    def charset(self):
+        """Charset of the body: declared by the headers or the document,
+        or guessed.
+        """
+        if self._charset is None:
+            if self.body is None:
+                return self._response.charset
+            self._charset = self._body_charset()
+        return self._charset
+
+    def _body_charset(self):
+        return body_charset(self.url, self._response.charset, self.body)
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = self.body.decode(self.charset, errors='replace')
+        return self._text
+
+    def __getstate__(self):
+        # sent to process pool parsers: the body goes, parsed data is
+        # rebuilt lazily on the other side.
+        return {
+            '_response': _DetachedResponse(self._response),
+            'body': self.body,
+            'type': self.type,
+            # its parser is bound to the crawler.
+            'request': None,
+            '_charset': self._charset,
+            '_text': None,
+        }
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
 
 
 class JsonResponse(_BaseResponse):
 
-    def __init__(self, response=None):
-        super(self.__class__, self).__init__(response=response)
-        self.text = response.text
+    __slots__ = ('_json',)
+
+    def __init__(self, response=None, body=None):
+        super(JsonResponse, self).__init__(response, body)
         self.type = "json"
         self._json = None
 
+    def __getstate__(self):
+        state = super(JsonResponse, self).__getstate__()
+        state['_json'] = None
+        return state
+
+    def _body_charset(self):
+        return json_charset(self._response.charset, self.body)
+
     @property
     def json(self):
         if self._json is None:
+            data = self.body
+            if self.charset not in _JSON_BYTES_CHARSETS:
+                data = self.text
             try:
-                self._json = json_loads(self.text)
-            # ujson decode exception
+                self._json = json_loads(data)
+            # ujson decode exception, json.JSONDecodeError is a ValueError
             except (ValueError, SyntaxError) as e:
                 raise JsonDecodeError(e)
-            # json decode exception
-            except json.JSONDecodeError as e:
-                raise JsonDecodeError(e)
         return self._json
 
 
 class HtmlResponse(_BaseResponse):
 
-    def __init__(self, response=None):
-        super(self.__class__, self).__init__(response=response)
-        self.text = response.text
+    __slots__ = ('_etree', '_py_query_doc')
+
+    def __init__(self, response=None, body=None):
+        super(HtmlResponse, self).__init__(response, body)
         self._etree = None
         self._py_query_doc = None
         self.type = "html"
 
+    def __getstate__(self):
+        state = super(HtmlResponse, self).__getstate__()
+        state.update(_etree=None, _py_query_doc=None)
+        return state
+
     @property
     def etree(self):
         if self._etree is None:
-            self._etree = etree.HTML(self.text)
+            # parsed from the bytes, libxml2 decodes them.
+            try:
+                parser = _html_parser(self.charset)
+            except LookupError:
+                # a charset libxml2 does not know.
+                self._etree = etree.HTML(self.text)
+            else:
+                self._etree = etree.HTML(self.body, parser=parser)
         return self._etree
 
     @property
     def doc(self):
         if self._py_query_doc is None:
-            self._py_query_doc = PyQuery(self.text)
+            # shares the lxml tree instead of parsing again.
+            self._py_query_doc = PyQuery(self.etree)
         return self._py_query_doc
 
     def xpath(self, path):
-        return self.etree.xpath(path)
+        return compile_xpath(path)(self.etree)
 
     def selector(self, rule):
-        return self.doc(rule)
+        # like doc(rule), with the rule compiled once.
+        nodes = compile_xpath(css_to_xpath(rule, jquery=True))(self.etree)
+        return PyQuery(nodes, parent=self.doc)
+
+    def links(self, extractor=None, **kwargs):
+        """Absolute urls of the links of the page, filtered by extractor,
+        or a LinkExtractor of kwargs(allow, domains...).
+        """
+        if extractor is None:
+            extractor = LinkExtractor(**kwargs)
+        return extractor.extract(self)
 
 
 class XmlResponse(HtmlResponse):
-    pass
+
+    __slots__ = ()
@@ -0,0 +1,202 @@
+import codecs
+import json
+from lxml import etree
+from aiocrawler.constants import STREAM_CHUNK_SIZE
+from aiocrawler.exceptions import JsonDecodeError
+from .responses import _BaseResponse, json_loads
+
+
+STREAM_XML = 'xml'
+STREAM_JSON = 'json'
+STREAM_NDJSON = 'ndjson'
+
+
+class XmlRecords(object):
+    """Async iterator of the elements named tag, parsed incrementally from
+    the body stream.
+
+    An element is valid until the next one is requested, it is cleared
+    then, with its preceding siblings, to keep memory bounded.
+    """
+
+    def __init__(self, content, tag=None, chunk_size=STREAM_CHUNK_SIZE):
+        self._content = content
+        self._chunk_size = chunk_size
+        self._parser = etree.XMLPullParser(events=('end',), tag=tag)
+        self._events = iter(())
+        self._last = None
+        self._eof = False
+
+    def __aiter__(self):
+        return self
+
+    def _release_last(self):
+        element, self._last = self._last, None
+        element.clear()
+        parent = element.getparent()
+        if parent is not None:
+            while element.getprevious() is not None:
+                del parent[0]
+
+    async def __anext__(self):
+        if self._last is not None:
+            self._release_last()
+        while True:
+            for _, element in self._events:
+                self._last = element
+                return element
+            if self._eof:
+                raise StopAsyncIteration
+            chunk = await self._content.read(self._chunk_size)
+            if chunk:
+                self._parser.feed(chunk)
+            else:
+                self._eof = True
+                self._parser.close()
+            self._events = self._parser.read_events()
+
+
+class JsonRecords(object):
+    """Async iterator of the items of a top-level json array, or of the
+    lines of a NDJSON body, decoded incrementally from the body stream.
+    """
+
+    def __init__(self, content, ndjson=False, encoding='utf-8',
+                 chunk_size=STREAM_CHUNK_SIZE):
+        self._content = content
+        self._chunk_size = chunk_size
+        self._ndjson = ndjson
+        self._decoder = codecs.getincrementaldecoder(encoding)()
+        self._json_decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._started = ndjson
+        self._done = False
+        self._eof = False
+
+    def __aiter__(self):
+        return self
+
+    async def _read(self):
+        chunk = await self._content.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+        # drop the consumed head, then append the new text.
+        self._buffer = self._buffer[self._pos:] + self._decoder.decode(
+            chunk, final=self._eof)
+        self._pos = 0
+
+    def _skip(self, chars):
+        buffer, pos = self._buffer, self._pos
+        while pos < len(buffer) and buffer[pos] in chars:
+            pos += 1
+        self._pos = pos
+
+    def _next_line(self):
+        end = self._buffer.find("\n", self._pos)
+        if end < 0:
+            if not self._eof:
+                return None
+            end = len(self._buffer)
+        line, self._pos = self._buffer[self._pos:end], end + 1
+        return line
+
+    async def _next_ndjson(self):
+        while True:
+            line = self._next_line()
+            if line is None:
+                await self._read()
+                continue
+            if line.strip():
+                try:
+                    return json_loads(line)
+                except (ValueError, SyntaxError) as e:
+                    raise JsonDecodeError(e)
+            if self._eof and self._pos >= len(self._buffer):
+                raise StopAsyncIteration
+
+    async def _next_item(self):
+        while True:
+            self._skip(" \t\r\n" if not self._started else " \t\r\n,")
+            if self._pos >= len(self._buffer):
+                if self._eof:
+                    raise JsonDecodeError("Unterminated json array")
+                await self._read()
+                continue
+            char = self._buffer[self._pos]
+            if not self._started:
+                if char != "[":
+                    raise JsonDecodeError("Expecting a json array")
+                self._started = True
+                self._pos += 1
+                continue
+            if char == "]":
+                self._done = True
+                raise StopAsyncIteration
+            try:
+                item, end = self._json_decoder.raw_decode(
+                    self._buffer, self._pos)
+            except ValueError as e:
+                # most likely an item cut by the chunk boundary.
+                if self._eof:
+                    raise JsonDecodeError(e)
+                await self._read()
+                continue
+            # a number may be cut as well("3." of "3.25"): only trust an
+            # item once the delimiter after it has been read.
+            self._pos, item_pos = end, self._pos
+            self._skip(" \t\r\n")
+            if not self._eof and (self._pos >= len(self._buffer) or
+                                  self._buffer[self._pos] not in ",]"):
+                self._pos = item_pos
+                await self._read()
+                continue
+            return item
+
+    async def __anext__(self):
+        if self._done:
+            raise StopAsyncIteration
+        if self._ndjson:
+            return await self._next_ndjson()
+        return await self._next_item()
+
+
+class _CountedContent(object):
+    """Body stream calling on_chunk with the size of every read."""
+
+    def __init__(self, content, on_chunk):
+        self._content = content
+        self._on_chunk = on_chunk
+
+    async def read(self, size=-1):
+        chunk = await self._content.read(size)
+        self._on_chunk(len(chunk))
+        return chunk
+
+
+class StreamResponse(_BaseResponse):
+    """Response whose body is not buffered: iterate it with async for to
+    get its records while it is still downloading. on_chunk is called with
+    the size of every chunk read.
+    """
+
+    __slots__ = ('records',)
+
+    def __init__(self, response=None, stream=STREAM_JSON, tag=None,
+                 on_chunk=None):
+        super(StreamResponse, self).__init__(response=response)
+        self.type = stream
+        content = self.content
+        if on_chunk is not None:
+            content = _CountedContent(content, on_chunk)
+        if stream == STREAM_XML:
+            self.records = XmlRecords(content, tag=tag)
+        elif stream in (STREAM_JSON, STREAM_NDJSON):
+            self.records = JsonRecords(
+                content, ndjson=stream == STREAM_NDJSON,
+                encoding=self.charset or 'utf-8')
+        else:
+            raise ValueError("Unknown stream type: {}".format(stream))
+
+    def __aiter__(self):
+        return self.records
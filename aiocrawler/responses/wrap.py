@@ -1,11 +1,9 @@
 from aiohttp.client import ClientResponse as ParResponse
 from .responses import HtmlResponse, JsonResponse, XmlResponse
+from .cached import CachedResponse
 from mimetypes import guess_type
 
 
-# TODO: response encoding
-
-
 class ResponseTypes(object):
 
     CONTENT_TYPES = {
@@ -27,7 +25,7 @@ class ResponseTypes(object):
 
     @classmethod
     def lookup(cls, raw_response):
-        assert isinstance(raw_response, ParResponse)
+        assert isinstance(raw_response, (ParResponse, CachedResponse))
         try:
             return cls._lookup_mime_type(raw_response)
         except KeyError:
@@ -65,6 +63,5 @@ class ResponseTypes(object):
     @classmethod
     async def construct(cls, raw_response):
         factory_cls = cls.lookup(raw_response)
-        response = factory_cls(raw_response)
-        response.text = await response.text()
-        return response
+        # the body is decoded(or parsed from bytes) only when asked.
+        return factory_cls(raw_response, await raw_response.read())
@@ -0,0 +1,171 @@
+import asyncio
+import re
+import time
+from collections import OrderedDict
+from urllib import parse as urlparse
+from aiocrawler.constants import ROBOTS_CACHE_TTL, ROBOTS_ERROR_TTL, \
+    ROBOTS_CACHE_MAX_SIZE, MAX_CRAWL_DELAY
+
+
+def _normalize(path):
+    return urlparse.unquote(path)
+
+
+def _compile(pattern):
+    """Matcher of a robots.txt path pattern: a prefix, or a regex when it
+    has wildcards('*') or an end anchor('$').
+    """
+    if '*' not in pattern and not pattern.endswith('$'):
+        return lambda path: path.startswith(pattern)
+    anchored = pattern.endswith('$')
+    if anchored:
+        pattern = pattern[:-1]
+    regex = ".*".join(re.escape(part) for part in pattern.split('*'))
+    return re.compile(regex + (r"\Z" if anchored else "")).match
+
+
+class RobotsRules(object):
+    """Rules of a robots.txt for user_agent(a product token), the group of
+    that agent if there is one, else the '*' group.
+
+    The longest matching Allow/Disallow path wins, Allow on ties, paths
+    may hold '*' wildcards and end with '$'.
+    """
+
+    __slots__ = ('_rules', 'crawl_delay', 'sitemaps')
+
+    def __init__(self, text, user_agent=None):
+        token = (user_agent or '*').split('/')[0].strip().lower()
+        # agent -> [rules, crawl delay] of its groups, merged.
+        groups = {}
+        current, in_agents = [], False
+        self.sitemaps = []
+        for line in text.splitlines():
+            line = line.split('#', 1)[0].strip()
+            name, colon, value = line.partition(':')
+            name, value = name.strip().lower(), value.strip()
+            if not colon:
+                continue
+            if name == 'user-agent':
+                if not in_agents:
+                    current = []
+                in_agents = True
+                current.append(groups.setdefault(value.lower(), [[], None]))
+                continue
+            in_agents = False
+            if name == 'sitemap':
+                self.sitemaps.append(value)
+            elif name in ('allow', 'disallow'):
+                # an empty Disallow allows everything.
+                if value:
+                    for group in current:
+                        group[0].append((name == 'allow', value))
+            elif name == 'crawl-delay':
+                try:
+                    delay = float(value)
+                except ValueError:
+                    continue
+                for group in current:
+                    group[1] = delay
+        rules, self.crawl_delay = groups.get(token) or groups.get('*') or \
+            ([], None)
+        if self.crawl_delay is not None:
+            self.crawl_delay = min(max(self.crawl_delay, 0), MAX_CRAWL_DELAY)
+        # longest first, allow before disallow among equals.
+        self._rules = [
+            (allow, _compile(_normalize(path)))
+            for allow, path in sorted(
+                rules, key=lambda rule: (-len(rule[1]), not rule[0]))
+        ]
+
+    def allowed(self, url):
+        parts = urlparse.urlsplit(str(url))
+        path = _normalize(parts.path or '/')
+        if parts.query:
+            path = "{}?{}".format(path, parts.query)
+        if path == '/robots.txt':
+            return True
+        for allow, match in self._rules:
+            if match(path):
+                return allow
+        return True
+
+
+# rules of hosts which have no robots.txt, or which can not be read.
+ALLOW_ALL = RobotsRules("")
+
+
+def robots_url(url):
+    parts = urlparse.urlsplit(str(url))
+    return urlparse.urlunsplit((parts.scheme, parts.netloc, '/robots.txt',
+                                '', ''))
+
+
+class RobotsCache(object):
+    """robots.txt rules per origin(scheme, host and port), fetched once by
+    fetch, a coroutine function of a url returning (status, text), and
+    kept ttl seconds in a LRU cache.
+
+    Concurrent lookups of an origin share one fetch. A missing robots.txt
+    (4xx) allows everything; an unreachable one(5xx, network error, status
+    None) allows everything too, but is fetched again after a few minutes.
+    """
+
+    def __init__(self, fetch, user_agent=None, ttl=ROBOTS_CACHE_TTL,
+                 max_size=ROBOTS_CACHE_MAX_SIZE, loop=None):
+        self._fetch = fetch
+        self.user_agent = user_agent
+        self.ttl = ttl
+        self.max_size = max_size
+        self._loop = loop or asyncio.get_event_loop()
+        # robots.txt url -> (expires at, RobotsRules), oldest used first.
+        self._cache = OrderedDict()
+        self._pending = {}
+        self.fetches = 0
+
+    def cached(self, url):
+        """Rules for url if they are cached, None otherwise."""
+        key = robots_url(url)
+        entry = self._cache.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        self._cache.move_to_end(key)
+        return entry[1]
+
+    def _start(self, key):
+        future = self._pending.get(key)
+        if future is None:
+            future = self._pending[key] = asyncio.ensure_future(
+                self._load(key), loop=self._loop)
+            future.add_done_callback(lambda _: self._pending.pop(key, None))
+        return future
+
+    async def rules(self, url):
+        rules = self.cached(url)
+        if rules is not None:
+            return rules
+        return await asyncio.shield(self._start(robots_url(url)))
+
+    def prefetch(self, url):
+        """Fetch the robots.txt of url in the background."""
+        if self.cached(url) is None:
+            self._start(robots_url(url))
+
+    async def _load(self, key):
+        self.fetches += 1
+        ttl = self.ttl
+        try:
+            status, text = await self._fetch(key)
+        except (OSError, asyncio.TimeoutError):
+            status, text = None, ""
+        if status is None or status >= 500:
+            rules, ttl = ALLOW_ALL, ROBOTS_ERROR_TTL
+        elif status >= 400:
+            rules = ALLOW_ALL
+        else:
+            rules = RobotsRules(text, self.user_agent)
+        self._cache.pop(key, None)
+        self._cache[key] = (time.monotonic() + ttl, rules)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+        return rules
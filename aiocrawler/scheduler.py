@@ -0,0 +1,421 @@
+import asyncio
+import heapq
+import itertools
+from collections import deque, Counter
+from urllib import parse as urlparse
+from aiocrawler.request import Request
+from aiocrawler.constants import DEFAULT_CONCURRENCY_PER_HOST, \
+    DEFAULT_HOST_DELAY, DEFAULT_MAX_FRONTIER_SIZE, FRONTIER_FILL_BATCH
+
+
+# order of the requests of a host: last in first out(depth-first), first in
+# first out(breadth-first), or highest Request.priority first.
+ORDER_DFS = 'dfs'
+ORDER_BFS = 'bfs'
+ORDER_BEST = 'best'
+
+
+def get_host_key(url):
+    """Default politeness key: the lowercased hostname of the url."""
+    return (urlparse.urlsplit(str(url)).hostname or "").lower()
+
+
+class _FifoQueue(deque):
+    __slots__ = ()
+
+    pop = deque.popleft
+
+
+class _PriorityQueue(object):
+    """Highest priority first, first in first out among equals."""
+
+    __slots__ = ('_heap', '_seq')
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def append(self, request):
+        heapq.heappush(
+            self._heap, (-request.priority, next(self._seq), request))
+
+    def pop(self):
+        return heapq.heappop(self._heap)[2]
+
+
+QUEUE_TYPES = {
+    ORDER_DFS: deque,
+    ORDER_BFS: _FifoQueue,
+    ORDER_BEST: _PriorityQueue,
+}
+
+
+class _HostSlot(object):
+    __slots__ = ('queue', 'active', 'concurrency', 'delay', 'next_time')
+
+    def __init__(self, concurrency, delay, queue):
+        self.queue = queue
+        self.active = 0
+        self.concurrency = concurrency
+        self.delay = delay
+        # loop time before which no new request may start on this host.
+        self.next_time = 0
+
+    def idle(self, now):
+        return not self.queue and not self.active and self.next_time <= now
+
+
+class HostScheduler(object):
+    """Frontier with one queue per host.
+
+    Every host has its own concurrency cap and a minimum delay between two
+    request starts. get() hands out work round-robin across the hosts that
+    are ready, and waits (without holding any host slot) until the next
+    host becomes ready otherwise.
+
+    Url iterables and async iterables are added as sources, they are only
+    pulled while the frontier holds less than max_size requests.
+
+    Requests to retry later wait in a timer heap, out of any host slot and
+    worker, until they are due.
+
+    order sorts the requests of every host(ORDER_DFS, ORDER_BFS or
+    ORDER_BEST), hosts are served round-robin whatever it is. Requests
+    deeper than max_depth, and past the first host_budget requests of a
+    host, are dropped.
+    """
+
+    def __init__(self, concurrency_per_host=DEFAULT_CONCURRENCY_PER_HOST,
+                 delay=DEFAULT_HOST_DELAY, max_size=DEFAULT_MAX_FRONTIER_SIZE,
+                 host_key=get_host_key, seen=None, on_new_host=None,
+                 on_queued=None, admit=None, order=ORDER_DFS, max_depth=None,
+                 host_budget=None, loop=None):
+        self._loop = loop or asyncio.get_event_loop()
+        if order not in QUEUE_TYPES:
+            raise ValueError("Unknown frontier order: {}".format(order))
+        self._queue_type = QUEUE_TYPES[order]
+        self._max_depth = max_depth
+        self._host_budget = host_budget
+        # requests admitted per host, against host_budget.
+        self._host_requests = Counter()
+        self._host_key = host_key
+        # called with the url of the first request queued for a host, DNS
+        # prefetching for instance.
+        self._on_new_host = on_new_host
+        # called with every request queued for the first time, the crawl
+        # checkpoint for instance.
+        self._on_queued = on_queued
+        # returns False for requests not to queue at all, robots.txt rules
+        # for instance.
+        self._admit = admit
+        # seen-store of request fingerprints, None disables deduplication.
+        self._seen = seen
+        self._max_size = max_size
+        self._concurrency_per_host = concurrency_per_host
+        self._delay = delay
+        self._slots = {}
+        # global cap of the requests in flight, None for the worker count.
+        self._limit = None
+        self._active = 0
+        # per-host overrides, kept even while the host has no slot.
+        self._host_concurrency = {}
+        self._host_delays = {}
+        # hosts which have queued items, in round-robin order.
+        self._hosts = deque()
+        # (due loop time, sequence, request) of the delayed requests.
+        self._delayed = []
+        self._delayed_seq = itertools.count()
+        self._getters = deque()
+        # (iterator, is_async, template request) not exhausted yet.
+        self._sources = deque()
+        self._filling = False
+        self._size = 0
+        self._unfinished = 0
+        self._joiners = []
+
+    def qsize(self):
+        return self._size
+
+    def empty(self):
+        return self._size == 0
+
+    def in_flight(self):
+        return self._active
+
+    def delayed_size(self):
+        return len(self._delayed)
+
+    def _get_slot(self, host):
+        slot = self._slots.get(host)
+        if slot is None:
+            slot = self._slots[host] = _HostSlot(
+                self._host_concurrency.get(host, self._concurrency_per_host),
+                self._host_delays.get(host, self._delay),
+                self._queue_type())
+        return slot
+
+    def set_host_delay(self, host, delay):
+        self._host_delays[host] = delay
+        if host in self._slots:
+            self._slots[host].delay = delay
+
+    def set_host_concurrency(self, host, concurrency):
+        """Override the concurrency of host, None restores the default."""
+        if concurrency is None:
+            self._host_concurrency.pop(host, None)
+            concurrency = self._concurrency_per_host
+        else:
+            self._host_concurrency[host] = concurrency
+        if host in self._slots:
+            self._slots[host].concurrency = concurrency
+            self._wakeup_next()
+
+    def set_concurrency(self, limit):
+        """Cap the requests in flight on all hosts."""
+        old, self._limit = self._limit, limit
+        woken = len(self._getters) if old is None else limit - old
+        for _ in range(woken):
+            self._wakeup_next()
+
+    def pause_host(self, host, delay):
+        """Start no new request on host for delay seconds(Retry-After)."""
+        slot = self._slots.get(host)
+        if slot is not None:
+            slot.next_time = max(slot.next_time, self._loop.time() + delay)
+
+    def _too_deep(self, request):
+        return self._max_depth is not None and \
+            (request.depth or 0) > self._max_depth
+
+    def _over_budget(self, request):
+        """Whether the budget of the request's host is spent, spend one
+        request of it otherwise.
+        """
+        if self._host_budget is None:
+            return False
+        host = self._host_key(request.url)
+        if self._host_requests[host] >= self._host_budget:
+            return True
+        self._host_requests[host] += 1
+        return False
+
+    def put_nowait(self, request):
+        """Queue the request unless it was seen before(or is too deep, not
+        admitted, or its host is over budget), return whether it was
+        queued.
+        """
+        # a shallower link to the same url may come later.
+        if self._too_deep(request) or \
+                self._admit is not None and not self._admit(request):
+            return False
+        if self._seen is not None and \
+                not self._seen.add(request.fingerprint()):
+            return False
+        if self._over_budget(request):
+            return False
+        self._put(request)
+        if self._on_queued is not None:
+            self._on_queued(request)
+        return True
+
+    def restore(self, requests, fingerprints=(), hosts=None):
+        """Mark fingerprints as seen and queue requests as they are, to
+        resume a crawl. hosts maps hosts to the requests they were admitted
+        already, against host_budget.
+        """
+        if hosts:
+            self._host_requests.update(hosts)
+        if self._seen is not None:
+            for fingerprint in fingerprints:
+                self._seen.add(fingerprint)
+        for request in requests:
+            self._put(request)
+
+    def _put(self, request):
+        request.host = host = self._host_key(request.url)
+        if host not in self._slots and self._on_new_host is not None:
+            self._on_new_host(request.url)
+        slot = self._get_slot(host)
+        if not slot.queue:
+            self._hosts.append(host)
+        # LIFO inside a host, like the former global LifoQueue.
+        slot.queue.append(request)
+        self._size += 1
+        self._unfinished += 1
+        self._wakeup_next()
+
+    def put_later(self, request, delay):
+        """Queue the request again in delay seconds, without deduplication:
+        retries back off here instead of sleeping in a worker.
+        """
+        self._unfinished += 1
+        heapq.heappush(self._delayed, (
+            self._loop.time() + delay, next(self._delayed_seq), request))
+        # a waiting getter may have to wake up sooner now.
+        self._wakeup_next()
+
+    def _put_due(self):
+        now = self._loop.time()
+        delayed = self._delayed
+        while delayed and delayed[0][0] <= now:
+            request = heapq.heappop(delayed)[2]
+            self._put(request)
+            # counted by _put from now on.
+            self._finish_one()
+
+    def add_source(self, urls, template):
+        """Lazily expand an iterable or async iterable of urls (or
+        Requests) into copies of the template request.
+        """
+        if hasattr(urls, '__aiter__'):
+            self._sources.append((urls.__aiter__(), True, template))
+        else:
+            self._sources.append((iter(urls), False, template))
+        self._wakeup_next()
+
+    async def _fill(self):
+        # one filler at a time, async generators are not reentrant.
+        if self._filling or not self._sources:
+            return
+        self._filling = True
+        try:
+            pulled = 0
+            while self._sources and self._size < self._max_size and \
+                    pulled < FRONTIER_FILL_BATCH:
+                source, is_async, template = self._sources[0]
+                try:
+                    if is_async:
+                        url = await source.__anext__()
+                    else:
+                        url = next(source)
+                except (StopIteration, StopAsyncIteration):
+                    self._sources.popleft()
+                    continue
+                pulled += 1
+                if not isinstance(url, Request):
+                    url = template.replace(str(url))
+                self.put_nowait(url)
+        finally:
+            self._filling = False
+            self._maybe_finished()
+
+    def _wakeup_next(self):
+        while self._getters:
+            getter = self._getters.popleft()
+            if not getter.done():
+                getter.set_result(None)
+                break
+
+    def _saturated(self):
+        return self._limit is not None and self._active >= self._limit
+
+    def _pop_ready(self):
+        if self._saturated():
+            return None
+        now = self._loop.time()
+        for _ in range(len(self._hosts)):
+            host = self._hosts[0]
+            self._hosts.rotate(-1)
+            slot = self._slots[host]
+            if slot.active >= slot.concurrency or slot.next_time > now:
+                continue
+            request = slot.queue.pop()
+            if not slot.queue:
+                # the host was just rotated to the right end.
+                self._hosts.pop()
+            slot.active += 1
+            self._active += 1
+            # sleep may lengthen the host delay(a Crawl-delay...), never
+            # shorten it.
+            slot.next_time = now + max(slot.delay, request.sleep or 0)
+            self._size -= 1
+            return request
+        return None
+
+    def _next_wakeup(self):
+        """Seconds until the earliest delayed host becomes ready, or None
+        (woken up by put or release instead).
+        """
+        if self._saturated():
+            # nothing may start before a request in flight is released.
+            return None
+        now = self._loop.time()
+        wakeup = self._delayed[0][0] - now if self._delayed else None
+        for host in self._hosts:
+            slot = self._slots[host]
+            if slot.active >= slot.concurrency:
+                continue
+            wait = slot.next_time - now
+            if wakeup is None or wait < wakeup:
+                wakeup = wait
+        return wakeup
+
+    @staticmethod
+    def _wakeup(getter):
+        if not getter.done():
+            getter.set_result(None)
+
+    async def get(self):
+        while True:
+            if self._size < self._max_size:
+                await self._fill()
+            self._put_due()
+            request = self._pop_ready()
+            if request is not None:
+                return request
+            getter = self._loop.create_future()
+            self._getters.append(getter)
+            wakeup = self._next_wakeup()
+            handle = None
+            if wakeup is not None:
+                handle = self._loop.call_later(
+                    max(wakeup, 0), self._wakeup, getter)
+            try:
+                await getter
+            except asyncio.CancelledError:
+                # pass the wakeup on if this getter was woken up.
+                if getter.done() and not getter.cancelled():
+                    self._wakeup_next()
+                raise
+            finally:
+                if handle is not None:
+                    handle.cancel()
+
+    def task_done(self, request):
+        self._release(request)
+        self._finish_one()
+
+    def _release(self, request):
+        slot = self._slots[request.host]
+        slot.active -= 1
+        self._active -= 1
+        if slot.idle(self._loop.time()):
+            del self._slots[request.host]
+        self._wakeup_next()
+
+    def _finish_one(self):
+        self._unfinished -= 1
+        self._maybe_finished()
+
+    def _maybe_finished(self):
+        if self._unfinished or self._sources:
+            return
+        for joiner in self._joiners:
+            if not joiner.done():
+                joiner.set_result(None)
+        self._joiners = []
+
+    def seeded(self):
+        """Called once on_start has returned."""
+
+    async def join(self):
+        if self._unfinished or self._sources:
+            joiner = self._loop.create_future()
+            self._joiners.append(joiner)
+            await joiner
+
+    async def close(self):
+        pass
@@ -0,0 +1,86 @@
+from aiocrawler.responses.responses import HtmlResponse, JsonResponse
+from aiocrawler.selectors import XPath, text_of
+
+
+def _selector(selector):
+    # plain strings are xpaths.
+    if isinstance(selector, str):
+        return XPath(selector)
+    return selector
+
+
+def _root(source):
+    if isinstance(source, JsonResponse):
+        return source.json
+    if isinstance(source, HtmlResponse):
+        return source.etree
+    # an element or json data already.
+    return source
+
+
+class Field(object):
+    """A value taken by the first selector(XPath, Css, JsonPath or xpath
+    string) which matches anything, the others are fallbacks, or default.
+
+    Elements are replaced by their text content, then go through process.
+    many keeps all the values of the matching selector as a list.
+    """
+
+    __slots__ = ('selectors', 'default', 'many', 'process')
+
+    def __init__(self, *selectors, default=None, many=False, process=None):
+        if not selectors:
+            raise ValueError("Field needs at least one selector")
+        self.selectors = tuple(_selector(selector) for selector in selectors)
+        self.default = default
+        self.many = many
+        self.process = process
+
+    def extract(self, node):
+        for selector in self.selectors:
+            values = selector(node)
+            if values:
+                break
+        else:
+            if self.many and self.default is None:
+                return []
+            return self.default
+        process = self.process
+        if not self.many:
+            value = text_of(values[0])
+            return value if process is None else process(value)
+        values = [text_of(value) for value in values]
+        if process is not None:
+            values = [process(value) for value in values]
+        return values
+
+
+class Schema(object):
+    """Fields(name -> Field, selector or nested Schema) extracted from a
+    response, an element or json data in one call.
+
+    Selectors are compiled once, when the schema is defined(at module
+    level, not in the parser). With items, a selector of the item nodes of
+    a list page, extract() returns one dict per item, their fields being
+    relative to the item node.
+    """
+
+    __slots__ = ('fields', 'items')
+
+    def __init__(self, fields, items=None):
+        self.fields = tuple(
+            (name, field if isinstance(field, (Field, Schema))
+             else Field(field))
+            for name, field in fields.items())
+        self.items = None if items is None else _selector(items)
+
+    def _extract(self, node):
+        return {name: field.extract(node) for name, field in self.fields}
+
+    def extract(self, source):
+        node = _root(source)
+        if self.items is None:
+            return self._extract(node)
+        return [self._extract(item) for item in self.items(node)]
+
+    __call__ = extract
@@ -0,0 +1,111 @@
+import functools
+import re
+from lxml import etree
+from cssselect import GenericTranslator
+from pyquery.cssselectpatch import JQueryTranslator
+from aiocrawler.constants import SELECTOR_CACHE_SIZE
+
+# ::text and ::attr(name) at the end of a css rule select the text or an
+# attribute of the matched elements.
+_CSS_PSEUDO = re.compile(r'::(?:(text)|attr\(\s*([^)\s]+)\s*\))\s*$')
+
+_css_translator = GenericTranslator()
+_jquery_translator = JQueryTranslator()
+
+
+@functools.lru_cache(maxsize=SELECTOR_CACHE_SIZE)
+def compile_xpath(path):
+    """etree.XPath of path, compiled once."""
+    return etree.XPath(path, smart_strings=False)
+
+
+@functools.lru_cache(maxsize=SELECTOR_CACHE_SIZE)
+def css_to_xpath(rule, jquery=False):
+    """XPath of a css rule(pyquery's dialect with jquery), translated
+    once. ::text and ::attr(name) are supported unless jquery.
+    """
+    if jquery:
+        return _jquery_translator.css_to_xpath(
+            rule, prefix='descendant-or-self::')
+    suffix = ''
+    match = _CSS_PSEUDO.search(rule)
+    if match is not None:
+        rule = rule[:match.start()]
+        suffix = '/text()' if match.group(1) else '/@' + match.group(2)
+    return _css_translator.css_to_xpath(
+        rule, prefix='descendant-or-self::') + suffix
+
+
+def text_of(value):
+    """Text content of an element, other values are returned as they are."""
+    if isinstance(value, etree._Element):
+        return "".join(value.itertext())
+    return value
+
+
+class XPath(object):
+    """Compiled XPath, a list of nodes, strings or numbers from a node."""
+
+    __slots__ = ('path', '_compiled')
+
+    def __init__(self, path):
+        self.path = path
+        self._compiled = compile_xpath(path)
+
+    def __call__(self, node):
+        result = self._compiled(node)
+        if isinstance(result, list):
+            return result
+        # count(), string()...
+        return [result]
+
+    def __repr__(self):
+        return "XPath({!r})".format(self.path)
+
+
+class Css(XPath):
+    """Css rule, translated to a compiled XPath once."""
+
+    __slots__ = ('rule',)
+
+    def __init__(self, rule):
+        super(Css, self).__init__(css_to_xpath(rule))
+        self.rule = rule
+
+    def __repr__(self):
+        return "Css({!r})".format(self.rule)
+
+
+class JsonPath(object):
+    """Dotted path into json data: 'data.items.*.title', '*' selects every
+    item of a list(or value of an object), integers index lists.
+    """
+
+    __slots__ = ('path', '_keys')
+
+    def __init__(self, path):
+        self.path = path
+        self._keys = tuple(
+            int(key) if key.lstrip('-').isdigit() else key
+            for key in path.split('.') if key)
+
+    def __call__(self, data):
+        values = [data]
+        for key in self._keys:
+            matched = []
+            for value in values:
+                if not isinstance(value, (dict, list)):
+                    continue
+                if key == '*':
+                    matched.extend(
+                        value.values() if isinstance(value, dict) else value)
+                    continue
+                try:
+                    matched.append(value[key])
+                except (KeyError, IndexError, TypeError):
+                    pass
+            values = matched
+        return values
+
+    def __repr__(self):
+        return "JsonPath({!r})".format(self.path)
@@ -0,0 +1,191 @@
+import asyncio
+import multiprocessing
+import pickle
+import queue
+import zlib
+from aiocrawler.request import Request
+from aiocrawler.scheduler import HostScheduler
+from aiocrawler.constants import QUEUE_BLOCK_SLEEP_INTERVAL, \
+    SHARD_INBOX_BATCH
+
+
+def shard_of(host, shards):
+    # crc32 is stable across processes, unlike the salted hash().
+    return zlib.crc32(host.encode()) % shards
+
+
+class _OwnedAsyncUrls(object):
+    """Async iterator over the urls of a seed source owned by a shard."""
+
+    def __init__(self, urls, owned):
+        self._urls = urls.__aiter__()
+        self._owned = owned
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while True:
+            url = await self._urls.__anext__()
+            if self._owned(url):
+                return url
+
+
+class ShardedScheduler(HostScheduler):
+    """HostScheduler of one crawler process out of shards.
+
+    Hosts are sharded by hash. Every process runs on_start and keeps only
+    the seeds of its own hosts, follow-up requests for other hosts are
+    forwarded to the inbox of their owner. pending, a shared counter of
+    the queued, running and in transit requests of all shards(plus one per
+    shard still seeding), tells when the whole crawl is done.
+    """
+
+    def __init__(self, shard, shards, inboxes, pending, parsers, **kwargs):
+        super(ShardedScheduler, self).__init__(**kwargs)
+        self._shard = shard
+        self._shards = shards
+        self._inboxes = inboxes
+        self._pending = pending
+        self._parsers = parsers
+        self._seeding = True
+
+    def _add_pending(self, count):
+        with self._pending.get_lock():
+            self._pending.value += count
+
+    def _owned(self, url):
+        if isinstance(url, Request):
+            url = url.url
+        return shard_of(self._host_key(url), self._shards) == self._shard
+
+    def add_source(self, urls, template):
+        if self._seeding:
+            if hasattr(urls, '__aiter__'):
+                urls = _OwnedAsyncUrls(urls, self._owned)
+            else:
+                urls = (url for url in urls if self._owned(url))
+        super(ShardedScheduler, self).add_source(urls, template)
+
+    def put_nowait(self, request):
+        owner = shard_of(self._host_key(request.url), self._shards)
+        if owner == self._shard:
+            return super(ShardedScheduler, self).put_nowait(request)
+        # the owner generates the same seeds by itself.
+        if self._seeding:
+            return False
+        # pickled here, the feeder thread of the inbox would drop an
+        # unpicklable request after it was counted pending.
+        data = pickle.dumps(request.to_dict(), pickle.HIGHEST_PROTOCOL)
+        self._add_pending(1)
+        self._inboxes[owner].put(data)
+        return True
+
+    def seeded(self):
+        self._seeding = False
+        self._add_pending(-1)
+        self._maybe_finished()
+
+    def _put(self, request):
+        self._add_pending(1)
+        super(ShardedScheduler, self)._put(request)
+
+    def put_later(self, request, delay):
+        self._add_pending(1)
+        super(ShardedScheduler, self).put_later(request, delay)
+
+    def _finish_one(self):
+        self._add_pending(-1)
+        super(ShardedScheduler, self)._finish_one()
+
+    async def _fill(self):
+        await super(ShardedScheduler, self)._fill()
+        inbox = self._inboxes[self._shard]
+        for _ in range(SHARD_INBOX_BATCH):
+            try:
+                data = inbox.get_nowait()
+            except queue.Empty:
+                break
+            HostScheduler.put_nowait(
+                self, Request.from_dict(pickle.loads(data), self._parsers))
+            # the forwarded request has been queued(or dropped) here.
+            self._add_pending(-1)
+
+    def _next_wakeup(self):
+        # poll the inbox for requests forwarded by the other shards.
+        wakeup = super(ShardedScheduler, self)._next_wakeup()
+        if self._saturated():
+            return None
+        if wakeup is None:
+            return QUEUE_BLOCK_SLEEP_INTERVAL
+        return min(wakeup, QUEUE_BLOCK_SLEEP_INTERVAL)
+
+    async def join(self):
+        while True:
+            await super(ShardedScheduler, self).join()
+            if self._pending.value == 0:
+                return
+            await asyncio.sleep(QUEUE_BLOCK_SLEEP_INTERVAL)
+
+
+def _run_shard(crawler_cls, kwargs, shard, shards, inboxes, pending,
+               results, run_kwargs):
+    if inboxes is not None:
+        kwargs = dict(kwargs, _shard=(shard, shards, inboxes, pending))
+    crawler = crawler_cls(**kwargs)
+    try:
+        crawler.run(**run_kwargs)
+    finally:
+        results.put({
+            'shard': shard,
+            'success': crawler._success_count,
+            'failed': list(crawler._failed_urls),
+            'stats': crawler._stats,
+        })
+
+
+def run_processes(crawler, processes, **run_kwargs):
+    """Run the crawler in processes worker processes, each one with its own
+    event loop and session, and aggregate their results: success counts,
+    failed urls and CrawlStats.
+
+    Without a shared redis frontier the hosts are sharded between them.
+    run_kwargs(resume...) are passed to the run() of every worker.
+    """
+    if crawler.redis is None:
+        inboxes = [multiprocessing.Queue() for _ in range(processes)]
+        # one unit per shard until its on_start returns.
+        pending = multiprocessing.Value('q', processes)
+    else:
+        inboxes = pending = None
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(
+            target=_run_shard, name="{}-{}".format(crawler.name, shard),
+            args=(crawler.__class__, crawler._init_kwargs, shard, processes,
+                  inboxes, pending, results, run_kwargs)
+        )
+        for shard in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+
+    shard_results = []
+    while len(shard_results) < processes:
+        try:
+            shard_results.append(
+                results.get(timeout=QUEUE_BLOCK_SLEEP_INTERVAL))
+        except queue.Empty:
+            pass
+        crashed = [worker for worker in workers if worker.exitcode]
+        if crashed:
+            # the crawl can not finish without the crashed shards.
+            crawler.logger.error(
+                "%s crashed, stopping the crawl",
+                ", ".join(worker.name for worker in crashed))
+            for worker in workers:
+                worker.terminate()
+            break
+    for worker in workers:
+        worker.join()
+    return shard_results
@@ -0,0 +1,222 @@
+import asyncio
+import re
+import zlib
+from collections import deque
+from datetime import datetime, timedelta
+from urllib import parse as urlparse
+import aiohttp
+import async_timeout
+from lxml import etree
+from aiocrawler.responses.stream import XmlRecords
+from aiocrawler.robots import RobotsRules
+from aiocrawler.constants import DEFAULT_MAX_TRIES, STREAM_CHUNK_SIZE
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+# W3C datetime: YYYY[-MM[-DD[Thh:mm[:ss[.s]][TZD]]]]
+_W3C_DATETIME = re.compile(
+    r'(\d{4})(?:-(\d{2})(?:-(\d{2})(?:[T ](\d{2}):(\d{2})'
+    r'(?::(\d{2})(?:\.\d+)?)?\s*(Z|[+-]\d{2}:?\d{2})?)?)?)?$')
+
+
+def parse_lastmod(text):
+    """Naive UTC datetime of a W3C datetime, None if it is not one."""
+    match = _W3C_DATETIME.match((text or "").strip())
+    if match is None:
+        return None
+    year, month, day, hour, minute, second, zone = match.groups()
+    try:
+        moment = datetime(int(year), int(month or 1), int(day or 1),
+                          int(hour or 0), int(minute or 0), int(second or 0))
+    except ValueError:
+        return None
+    if zone and zone != 'Z':
+        zone = zone.replace(':', '')
+        offset = timedelta(hours=int(zone[1:3]), minutes=int(zone[3:5]))
+        moment = moment - offset if zone[0] == '+' else moment + offset
+    return moment
+
+
+def _utc(moment):
+    if moment is None:
+        return None
+    if not isinstance(moment, datetime):
+        return datetime(moment.year, moment.month, moment.day)
+    if moment.utcoffset() is not None:
+        moment = (moment - moment.utcoffset()).replace(tzinfo=None)
+    return moment
+
+
+def _local_name(tag):
+    return tag.rpartition('}')[2]
+
+
+class _GunzipReader(object):
+    """Body stream decompressed on the fly if it is gzipped(.xml.gz files,
+    not Content-Encoding which aiohttp decodes already). Every read times
+    out after timeout seconds.
+    """
+
+    def __init__(self, content, timeout=None):
+        self._content = content
+        self._timeout = timeout
+        self._decompressor = None
+        self._started = False
+
+    async def read(self, size):
+        while True:
+            with async_timeout.timeout(self._timeout):
+                chunk = await self._content.read(size)
+            if not self._started:
+                self._started = True
+                if chunk.startswith(GZIP_MAGIC):
+                    self._decompressor = zlib.decompressobj(
+                        16 + zlib.MAX_WBITS)
+            if self._decompressor is None:
+                return chunk
+            if not chunk:
+                return self._decompressor.flush()
+            data = self._decompressor.decompress(chunk)
+            if data:
+                return data
+
+
+class SitemapUrls(object):
+    """Async iterator of the page urls listed by sitemaps.
+
+    Sitemap indexes are followed recursively, gzipped sitemaps are
+    decompressed on the fly, robots.txt urls stand for the sitemaps they
+    list. Bodies are parsed incrementally, and only read as fast as urls
+    are taken, so that memory stays constant whatever their size.
+
+    fetch is a coroutine function of a url returning its response(the
+    body is not read). Urls(and sitemaps of an index) whose lastmod is
+    before since, or after until, are skipped; entries without lastmod are
+    kept. A sitemap cut in the middle(or stalled timeout seconds) is
+    fetched again, up to max_tries times, and resumed after its last entry
+    read.
+    """
+
+    def __init__(self, fetch, urls, since=None, until=None,
+                 max_tries=DEFAULT_MAX_TRIES, timeout=None, logger=None):
+        self._fetch = fetch
+        if isinstance(urls, str):
+            urls = (urls,)
+        self._sitemaps = deque(urls)
+        # indexes may list each other.
+        self._visited = set()
+        self.since = _utc(since)
+        self.until = _utc(until)
+        self.max_tries = max_tries
+        self.timeout = timeout
+        self.logger = logger
+        self._url = None
+        self._response = None
+        self._records = None
+        # entries of the current sitemap read so far, and to skip again.
+        self._position = 0
+        self._skip = 0
+        self._tries = 0
+        self.sitemaps = 0
+        self.urls = 0
+
+    def __aiter__(self):
+        return self
+
+    def _log_error(self, message):
+        if self.logger is not None:
+            self.logger.error("[SITEMAP] %s [%s]", self._url, message,
+                              extra={'event': 'sitemap', 'url': self._url})
+
+    def _close(self):
+        if self._response is not None:
+            self._response.release()
+        self._response = self._records = None
+
+    async def _open(self, url, skip=0, tries=0):
+        self._url, self._position, self._skip = url, 0, skip
+        self._tries = tries + 1
+        try:
+            response = await self._fetch(url)
+            if response.status != 200:
+                response.release()
+                return self._log_error(response.status)
+            if urlparse.urlsplit(url).path == '/robots.txt':
+                try:
+                    text = await response.text()
+                finally:
+                    response.release()
+                self._sitemaps.extend(RobotsRules(text).sitemaps)
+                return
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return self._retry(e)
+        self.sitemaps += 1
+        self._response = response
+        self._records = XmlRecords(
+            _GunzipReader(response.content, self.timeout),
+            tag=('{*}url', '{*}sitemap'), chunk_size=STREAM_CHUNK_SIZE)
+
+    def _retry(self, error):
+        self._close()
+        if self._tries < self.max_tries:
+            # resumed by __anext__, after the entries read already.
+            self._sitemaps.appendleft((
+                self._url, max(self._position, self._skip), self._tries))
+        else:
+            self._log_error(error.__class__.__name__)
+
+    def _entry(self, element):
+        loc = lastmod = None
+        for child in element:
+            if not isinstance(child.tag, str):
+                continue
+            name = _local_name(child.tag)
+            if name == 'loc':
+                loc = (child.text or "").strip()
+            elif name == 'lastmod':
+                lastmod = parse_lastmod(child.text)
+        if not loc:
+            return None
+        if lastmod is not None and self.since is not None and \
+                lastmod < self.since:
+            return None
+        if _local_name(element.tag) == 'sitemap':
+            # a sitemap changed after until may still list older urls.
+            self._sitemaps.append(loc)
+            return None
+        if lastmod is not None and self.until is not None and \
+                lastmod > self.until:
+            return None
+        return loc
+
+    async def __anext__(self):
+        while True:
+            if self._records is None:
+                if not self._sitemaps:
+                    raise StopAsyncIteration
+                sitemap = self._sitemaps.popleft()
+                if isinstance(sitemap, tuple):
+                    await self._open(*sitemap)
+                elif sitemap not in self._visited:
+                    self._visited.add(sitemap)
+                    await self._open(sitemap)
+                continue
+            try:
+                element = await self._records.__anext__()
+            except StopAsyncIteration:
+                self._close()
+                continue
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self._retry(e)
+                continue
+            except (etree.XMLSyntaxError, zlib.error) as e:
+                self._close()
+                self._log_error(e)
+                continue
+            self._position += 1
+            if self._position <= self._skip:
+                continue
+            url = self._entry(element)
+            if url is not None:
+                self.urls += 1
+                return url
@@ -0,0 +1,379 @@
+import asyncio
+import time
+from collections import Counter
+from aiocrawler.constants import HISTOGRAM_SUB_BUCKET_BITS, STATS_QUANTILES
+
+try:
+    from aiohttp import TraceConfig
+except ImportError:  # aiohttp < 3.0
+    TraceConfig = None
+
+
+PHASE_DNS = 'dns'
+# connection setup, TLS handshake included.
+PHASE_CONNECT = 'connect'
+PHASE_TTFB = 'ttfb'
+PHASE_TRANSFER = 'transfer'
+PHASE_PARSE = 'parse'
+PHASE_TOTAL = 'total'
+PHASES = (PHASE_DNS, PHASE_CONNECT, PHASE_TTFB, PHASE_TRANSFER,
+          PHASE_PARSE, PHASE_TOTAL)
+
+_SUB_BUCKETS = 1 << HISTOGRAM_SUB_BUCKET_BITS
+
+
+class Histogram(object):
+    """HDR-style histogram of non negative integers.
+
+    Values are counted in log-linear buckets: exact below 2 * 2**bits,
+    within 1/2**bits relative error above, with O(1) record and a few
+    hundred buckets at most whatever the number of values.
+    """
+    __slots__ = ('counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.counts = Counter()
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    @staticmethod
+    def _index(value):
+        if value < 2 * _SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - HISTOGRAM_SUB_BUCKET_BITS - 1
+        return shift * _SUB_BUCKETS + (value >> shift)
+
+    @staticmethod
+    def _value(index):
+        """Middle value of the bucket."""
+        if index < 2 * _SUB_BUCKETS:
+            return index
+        shift = index // _SUB_BUCKETS - 1
+        return ((index - shift * _SUB_BUCKETS) << shift) + (1 << shift) // 2
+
+    def record(self, value):
+        value = int(value)
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """Add the values counted by other."""
+        if not other.count:
+            return
+        self.counts.update(other.counts)
+        self.count += other.count
+        self.total += other.total
+        self.min = other.min if self.min is None else \
+            min(self.min, other.min)
+        self.max = other.max if self.max is None else \
+            max(self.max, other.max)
+
+    def percentile(self, p):
+        if not self.count:
+            return None
+        rank = p * self.count
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(max(self._value(index), self.min), self.max)
+        return self.max
+
+
+class _HostStats(object):
+    __slots__ = ('phases', 'statuses', 'bytes', 'retries', 'failures',
+                 'connections', 'reused')
+
+    def __init__(self):
+        # phase -> Histogram of microseconds.
+        self.phases = {}
+        self.statuses = Counter()
+        self.bytes = 0
+        self.retries = 0
+        self.failures = 0
+        # new connections opened and pooled connections reused.
+        self.connections = 0
+        self.reused = 0
+
+    def record(self, phase, seconds):
+        histogram = self.phases.get(phase)
+        if histogram is None:
+            histogram = self.phases[phase] = Histogram()
+        histogram.record(seconds * 1000000)
+
+    def merge(self, other):
+        for phase, other_histogram in other.phases.items():
+            histogram = self.phases.get(phase)
+            if histogram is None:
+                histogram = self.phases[phase] = Histogram()
+            histogram.merge(other_histogram)
+        self.statuses.update(other.statuses)
+        self.bytes += other.bytes
+        self.retries += other.retries
+        self.failures += other.failures
+        self.connections += other.connections
+        self.reused += other.reused
+
+
+class _TraceContext(object):
+    """Timings of one session request, filled by the trace callbacks."""
+    __slots__ = ('host', 'start', 'dns_start', 'connect_start')
+
+    def __init__(self, host):
+        self.host = host
+        self.start = self.dns_start = self.connect_start = None
+
+
+class CrawlStats(object):
+    """Per-host timings and counters of a crawl.
+
+    Request phases are timed by the aiohttp TraceConfig of the crawler's
+    session(dns, connect, ttfb), transfer and parse by the crawler, all
+    into histograms. snapshot() returns everything as a dict, with the
+    queue, worker and connection pool gauges, prometheus() as Prometheus
+    text exposition.
+    """
+
+    def __init__(self):
+        self._hosts = {}
+        self._started_at = time.time()
+        self._crawler = None
+
+    def bind(self, crawler):
+        self._crawler = crawler
+
+    def __getstate__(self):
+        # the bound crawler stays in its process.
+        state = self.__dict__.copy()
+        state['_crawler'] = None
+        return state
+
+    def merge(self, other):
+        """Add the hosts of other, the stats of another process."""
+        for name, other_host in other._hosts.items():
+            self.host(name).merge(other_host)
+
+    def host(self, host):
+        stats = self._hosts.get(host)
+        if stats is None:
+            stats = self._hosts[host] = _HostStats()
+        return stats
+
+    def record(self, host, phase, seconds):
+        self.host(host).record(phase, seconds)
+
+    def retry(self, host):
+        self.host(host).retries += 1
+
+    def failure(self, host):
+        self.host(host).failures += 1
+
+    def received(self, host, size):
+        """Count size body bytes read from the content stream, which the
+        traces only see for bodies read whole.
+        """
+        self.host(host).bytes += size
+
+    def trace_config(self):
+        """TraceConfig recording into these stats, pass the request host
+        as trace_request_ctx.
+        """
+        if TraceConfig is None:
+            return None
+        trace_config = TraceConfig(trace_config_ctx_factory=self._trace_ctx)
+        trace_config.on_request_start.append(self._on_request_start)
+        trace_config.on_dns_resolvehost_start.append(self._on_dns_start)
+        trace_config.on_dns_resolvehost_end.append(self._on_dns_end)
+        trace_config.on_connection_create_start.append(
+            self._on_connect_start)
+        trace_config.on_connection_create_end.append(self._on_connect_end)
+        trace_config.on_connection_reuseconn.append(self._on_reuse)
+        trace_config.on_request_end.append(self._on_request_end)
+        trace_config.on_response_chunk_received.append(self._on_chunk)
+        return trace_config
+
+    @staticmethod
+    def _trace_ctx(trace_request_ctx=None):
+        return _TraceContext(trace_request_ctx)
+
+    @staticmethod
+    def _now():
+        return time.monotonic()
+
+    async def _on_request_start(self, session, ctx, params):
+        ctx.start = self._now()
+
+    async def _on_dns_start(self, session, ctx, params):
+        ctx.dns_start = self._now()
+
+    async def _on_dns_end(self, session, ctx, params):
+        self.record(ctx.host, PHASE_DNS, self._now() - ctx.dns_start)
+
+    async def _on_connect_start(self, session, ctx, params):
+        ctx.connect_start = self._now()
+
+    async def _on_connect_end(self, session, ctx, params):
+        host = self.host(ctx.host)
+        host.record(PHASE_CONNECT, self._now() - ctx.connect_start)
+        host.connections += 1
+
+    async def _on_reuse(self, session, ctx, params):
+        self.host(ctx.host).reused += 1
+
+    async def _on_request_end(self, session, ctx, params):
+        # the response headers have been received.
+        host = self.host(ctx.host)
+        host.record(PHASE_TTFB, self._now() - ctx.start)
+        host.statuses[params.response.status] += 1
+
+    async def _on_chunk(self, session, ctx, params):
+        self.host(ctx.host).bytes += len(params.chunk)
+
+    def gauges(self):
+        crawler = self._crawler
+        if crawler is None:
+            return {}
+        scheduler = crawler._tasks_que
+        gauges = {
+            'queue_size': scheduler.qsize(),
+            'delayed_requests': scheduler.delayed_size(),
+            'requests_in_flight': scheduler.in_flight(),
+        }
+        connector = getattr(crawler.ac_session, 'connector', None)
+        if connector is not None:
+            gauges['connections_in_use'] = len(
+                getattr(connector, '_acquired', ()))
+            gauges['connections_limit'] = getattr(connector, 'limit', 0)
+        resolver = getattr(crawler, '_resolver', None)
+        if resolver is not None:
+            gauges.update(resolver.stats())
+        return gauges
+
+    @staticmethod
+    def _summary(histogram):
+        summary = {
+            'count': histogram.count,
+            'mean': histogram.total / histogram.count / 1000000,
+        }
+        for quantile in STATS_QUANTILES:
+            summary['p{:g}'.format(quantile * 100)] = \
+                histogram.percentile(quantile) / 1000000
+        return summary
+
+    def snapshot(self):
+        """Current stats as a json-serializable dict, in seconds."""
+        elapsed = time.time() - self._started_at
+        hosts = {}
+        totals = Counter()
+        for name, host in self._hosts.items():
+            responses = sum(host.statuses.values())
+            totals.update(responses=responses, bytes=host.bytes,
+                          retries=host.retries, failures=host.failures,
+                          connections=host.connections, reused=host.reused)
+            hosts[name] = {
+                'responses': responses,
+                'statuses': dict(host.statuses),
+                'bytes': host.bytes,
+                'retries': host.retries,
+                'failures': host.failures,
+                'connections': host.connections,
+                'reused': host.reused,
+                'phases': {phase: self._summary(histogram)
+                           for phase, histogram in host.phases.items()},
+            }
+        snapshot = dict(totals, elapsed=elapsed, hosts=hosts,
+                        gauges=self.gauges())
+        snapshot['responses_per_second'] = \
+            totals['responses'] / elapsed if elapsed else 0
+        return snapshot
+
+    @staticmethod
+    def _labels(labels):
+        return ",".join('{}="{}"'.format(
+            key, str(label).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+            for key, label in labels)
+
+    def prometheus(self):
+        """Prometheus text exposition format of the stats."""
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append("# HELP aiocrawler_{} {}".format(name, help_text))
+            lines.append("# TYPE aiocrawler_{} {}".format(name, kind))
+            for labels, value in samples:
+                labels = self._labels(labels)
+                lines.append("aiocrawler_{}{} {}".format(
+                    name, "{" + labels + "}" if labels else "", value))
+
+        # requests traced without a host are filed under None.
+        hosts = sorted(self._hosts.items(), key=lambda item: str(item[0]))
+        metric('responses_total', 'counter', "Responses by status.", [
+            ((('host', name), ('status', status)), count)
+            for name, host in hosts
+            for status, count in sorted(host.statuses.items())])
+        metric('response_bytes_total', 'counter', "Body bytes received.", [
+            ((('host', name),), host.bytes) for name, host in hosts])
+        metric('retries_total', 'counter', "Requests retried.", [
+            ((('host', name),), host.retries) for name, host in hosts])
+        metric('failures_total', 'counter', "Requests given up.", [
+            ((('host', name),), host.failures) for name, host in hosts])
+        metric('connections_total', 'counter', "Connections opened or "
+               "reused from the pool.", [
+                   ((('host', name), ('reused', reused)), count)
+                   for name, host in hosts
+                   for reused, count in (('false', host.connections),
+                                         ('true', host.reused))])
+        samples = []
+        for name, host in hosts:
+            for phase in PHASES:
+                histogram = host.phases.get(phase)
+                if histogram is None:
+                    continue
+                labels = (('host', name), ('phase', phase))
+                for quantile in STATS_QUANTILES:
+                    samples.append((labels + (('quantile', quantile),),
+                                    histogram.percentile(quantile) / 1e6))
+        metric('phase_seconds', 'summary', "Request phase durations.",
+               samples)
+        # summary _sum and _count samples, without quantile label.
+        for name, host in hosts:
+            for phase in PHASES:
+                histogram = host.phases.get(phase)
+                if histogram is None:
+                    continue
+                labels = self._labels((('host', name), ('phase', phase)))
+                lines.append("aiocrawler_phase_seconds_sum{{{}}} {}".format(
+                    labels, histogram.total / 1e6))
+                lines.append(
+                    "aiocrawler_phase_seconds_count{{{}}} {}".format(
+                        labels, histogram.count))
+        for name, value in sorted(self.gauges().items()):
+            metric(name, 'gauge', name.replace('_', ' ').capitalize() + ".",
+                   [((), value)])
+        return "\n".join(lines) + "\n"
+
+    async def serve(self, host, port):
+        """Serve prometheus() over http on host:port."""
+        async def handle(reader, writer):
+            try:
+                await reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                writer.close()
+                return
+            body = self.prometheus().encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: text/plain; version=0.0.4\r\n"
+                b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+                b"Connection: close\r\n\r\n" + body)
+            await writer.drain()
+            writer.close()
+        return await asyncio.start_server(handle, host, port)
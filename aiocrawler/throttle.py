@@ -0,0 +1,172 @@
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from aiocrawler.constants import AIMD_LATENCY_WINDOW, AIMD_MIN_SAMPLES, \
+    AIMD_COOLDOWN, AIMD_HOST_IDLE, MAX_RETRY_AFTER, THROTTLE_STATUS_CODES
+
+
+def parse_retry_after(value, now=None):
+    """Seconds to wait from a Retry-After header(delta seconds or http
+    date), None if it is missing or invalid.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    try:
+        retry_at = parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at - (now or time.time()), 0)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+class _Limit(object):
+    """AIMD state of one concurrency limit."""
+    __slots__ = ('value', 'low', 'high', 'samples', 'baseline',
+                 'last_decrease', 'last_seen')
+
+    def __init__(self, value, low, high):
+        self.low = low
+        self.high = high
+        self.value = float(min(max(value, low), high))
+        # latencies of the recent requests, None for the failed ones.
+        self.samples = deque(maxlen=AIMD_LATENCY_WINDOW)
+        # lowest median latency seen, what the host does when not loaded.
+        self.baseline = None
+        self.last_decrease = 0
+        self.last_seen = 0
+
+
+class AimdController(object):
+    """Adapts the global and the per-host concurrency of a crawler at
+    runtime, by additive-increase/multiplicative-decrease.
+
+    Every successful request adds increase/limit to its limits(about
+    increase per round trip). A throttling status(429/503), a failure rate
+    above max_failure_rate or a latency percentile grown latency_tolerance
+    times above its baseline(or above latency_target) multiplies them by
+    decrease, at most once per cooldown seconds. Throttling only backs off
+    its host, which is also paused for Retry-After seconds.
+
+    Host limits stay below the crawler's concurrency_per_host(and
+    max_per_host), hosts not requested for host_idle seconds get it back.
+    """
+
+    def __init__(self, min_concurrency=1, max_concurrency=100,
+                 min_per_host=1, max_per_host=None, increase=1.0,
+                 decrease=0.5, latency_percentile=0.9, latency_target=None,
+                 latency_tolerance=3.0, max_failure_rate=0.2,
+                 cooldown=AIMD_COOLDOWN, host_idle=AIMD_HOST_IDLE):
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.min_per_host = min_per_host
+        self.max_per_host = max_per_host
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_percentile = latency_percentile
+        self.latency_target = latency_target
+        self.latency_tolerance = latency_tolerance
+        self.max_failure_rate = max_failure_rate
+        self.cooldown = cooldown
+        self.host_idle = host_idle
+        self._scheduler = None
+        self._global = None
+        self._hosts = {}
+        self._per_host = None
+        self._max_per_host = None
+        self._swept_at = time.monotonic()
+
+    def bind(self, scheduler, concurrency, concurrency_per_host):
+        """Control scheduler, starting from the configured limits."""
+        self._scheduler = scheduler
+        self._per_host = concurrency_per_host
+        self._max_per_host = min(self.max_per_host or concurrency_per_host,
+                                 concurrency_per_host)
+        self._global = _Limit(
+            concurrency, self.min_concurrency, self.max_concurrency)
+        scheduler.set_concurrency(int(self._global.value))
+
+    @property
+    def concurrency(self):
+        return int(self._global.value)
+
+    def host_concurrency(self, host):
+        limit = self._hosts.get(host)
+        return int(limit.value) if limit is not None else self._per_host
+
+    def _host_limit(self, host):
+        limit = self._hosts.get(host)
+        if limit is None:
+            limit = self._hosts[host] = _Limit(
+                self._per_host, self.min_per_host, self._max_per_host)
+        return limit
+
+    def _sweep(self, now):
+        """Forget the limits of the hosts idle for host_idle seconds."""
+        self._swept_at = now
+        idle = [host for host, limit in self._hosts.items()
+                if now - limit.last_seen > self.host_idle]
+        for host in idle:
+            del self._hosts[host]
+            self._scheduler.set_host_concurrency(host, None)
+
+    def _congested(self, limit):
+        samples = limit.samples
+        if len(samples) < AIMD_MIN_SAMPLES:
+            return False
+        latencies = [latency for latency in samples if latency is not None]
+        if len(samples) - len(latencies) > \
+                self.max_failure_rate * len(samples):
+            return True
+        if len(latencies) < AIMD_MIN_SAMPLES:
+            return False
+        median = percentile(latencies, 0.5)
+        if limit.baseline is None or median < limit.baseline:
+            limit.baseline = median
+        target = self.latency_target or \
+            limit.baseline * self.latency_tolerance
+        return percentile(latencies, self.latency_percentile) > target
+
+    def _update(self, limit, latency, throttled, now):
+        """Return whether the integer limit changed."""
+        old = int(limit.value)
+        limit.samples.append(latency)
+        if throttled or self._congested(limit):
+            if now - limit.last_decrease < self.cooldown:
+                return False
+            limit.value = max(limit.value * self.decrease, limit.low)
+            limit.last_decrease = now
+            # judge the new limit on fresh samples.
+            limit.samples.clear()
+        elif latency is not None:
+            limit.value = min(limit.value + self.increase / limit.value,
+                              limit.high)
+        return int(limit.value) != old
+
+    def observe(self, host, latency=None, status=None, retry_after=None):
+        """Record the outcome of a request to host: its latency(None if it
+        failed), the response status and Retry-After header.
+        """
+        now = time.monotonic()
+        throttled = status in THROTTLE_STATUS_CODES
+        scheduler = self._scheduler
+        global_limit = self._global
+        # throttling is the host's business, not a sign of a global load.
+        if not throttled and self._update(global_limit, latency, False, now):
+            scheduler.set_concurrency(int(global_limit.value))
+        host_limit = self._host_limit(host)
+        host_limit.last_seen = now
+        if self._update(host_limit, latency, throttled, now):
+            scheduler.set_host_concurrency(host, int(host_limit.value))
+        if throttled:
+            delay = parse_retry_after(retry_after)
+            if delay:
+                scheduler.pause_host(host, min(delay, MAX_RETRY_AFTER))
+        if now - self._swept_at > self.host_idle:
+            self._sweep(now)
@@ -0,0 +1,3 @@
+"""Offline benchmarks of AioCrawler against a local stand-in server, run
+them with `aiocrawler bench` from a source checkout.
+"""
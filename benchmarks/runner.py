@@ -0,0 +1,222 @@
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from aiocrawler import AioCrawler, CrawlStats
+from aiocrawler.responses.stream import STREAM_JSON
+from aiocrawler.stats import PHASE_TOTAL, PHASE_TTFB
+from benchmarks.server import BenchServer
+
+
+MODE_GET = 'get'
+MODE_DOWNLOAD = 'download'
+MODES = (MODE_GET, MODE_DOWNLOAD)
+# 'stream' parses the json pages as a StreamResponse.
+PARSERS = ('html', 'json', 'xml', 'stream')
+BACKEND_MEMORY = 'memory'
+BACKEND_REDIS = 'redis'
+BACKENDS = (BACKEND_MEMORY, BACKEND_REDIS)
+
+# ru_maxrss is in kilobytes on linux, bytes on macOS.
+_RSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+
+class BenchCrawler(AioCrawler):
+    logger = logging.getLogger('BenchCrawler')
+    stats = CrawlStats
+    retry_backoff = 0.01
+    retry_backoff_max = 0.1
+
+    # set per scenario by run_scenario.
+    base_url = None
+    scenario = None
+    save_dir = None
+
+    def on_start(self):
+        scenario = self.scenario
+        count = scenario['requests']
+        if scenario['mode'] == MODE_DOWNLOAD:
+            url = "{}/file/{}".format(self.base_url, scenario['file_size'])
+            for index in range(count):
+                # distinct urls, the frontier would dedup them otherwise.
+                self.download("{}?n={}".format(url, index),
+                              save_dir=self.save_dir, filename=str(index))
+            return
+        parser = scenario['parser']
+        kind = 'json' if parser == 'stream' else parser
+        urls = ("{}/{}/{}".format(self.base_url, kind, index)
+                for index in range(count))
+        if parser == 'stream':
+            self.get(urls, parser=self.parse_stream, stream=STREAM_JSON)
+        else:
+            self.get(urls, parser=getattr(self, 'parse_' + parser))
+
+    def parse_html(self, response):
+        return len(response.xpath('//div[@class="item"]/a/@href'))
+
+    def parse_xml(self, response):
+        return len(response.xpath('//item/link/text()'))
+
+    def parse_json(self, response):
+        return len(response.json)
+
+    async def parse_stream(self, response):
+        count = 0
+        async for _ in response:
+            count += 1
+        return count
+
+
+def _latencies(snapshot):
+    phases = {}
+    for host in snapshot['hosts'].values():
+        phases = host['phases']
+    # downloads are only timed up to the first byte.
+    latency = phases.get(PHASE_TOTAL) or phases.get(PHASE_TTFB) or {}
+    return latency.get('p50'), latency.get('p99')
+
+
+def run_scenario(base_url, scenario, results):
+    """Worker process entry point: one scenario, one fresh process, so that
+    peak RSS and CPU time are its own.
+    """
+    BenchCrawler.logger.setLevel(logging.WARNING)
+    save_dir = tempfile.mkdtemp(prefix='aiocrawler-bench-')
+    kwargs = dict(base_url=base_url, scenario=scenario, save_dir=save_dir,
+                  concurrency=scenario['concurrency'],
+                  concurrency_per_host=scenario['concurrency'],
+                  name='bench-{}'.format(uuid.uuid4().hex))
+    if scenario['backend'] == BACKEND_REDIS:
+        kwargs['redis'] = scenario['redis']
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    start_at = time.time()
+    try:
+        crawler = BenchCrawler(**kwargs)
+        crawler.run()
+    finally:
+        shutil.rmtree(save_dir, ignore_errors=True)
+    elapsed = time.time() - start_at
+    end_usage = resource.getrusage(resource.RUSAGE_SELF)
+    snapshot = crawler._stats.snapshot()
+    requests = snapshot.get('responses', 0)
+    cpu = (end_usage.ru_utime - usage.ru_utime) + \
+        (end_usage.ru_stime - usage.ru_stime)
+    p50, p99 = _latencies(snapshot)
+    results.put(dict(
+        scenario,
+        requests=requests,
+        failed=len(crawler._failed_urls),
+        retries=snapshot.get('retries', 0),
+        bytes=snapshot.get('bytes', 0),
+        seconds=elapsed,
+        requests_per_second=requests / elapsed if elapsed else 0,
+        latency_p50=p50,
+        latency_p99=p99,
+        peak_rss_mb=end_usage.ru_maxrss * _RSS_UNIT / (1 << 20),
+        cpu_ms_per_request=cpu * 1000 / requests if requests else None,
+    ))
+
+
+def scenarios(concurrency, modes, parsers, backends, requests, file_size,
+              redis=None):
+    for level, mode, backend in itertools.product(
+            concurrency, modes, backends):
+        # the parser does not matter to downloads.
+        for parser in (parsers if mode == MODE_GET else (None,)):
+            yield {
+                'concurrency': level,
+                'mode': mode,
+                'parser': parser,
+                'backend': backend,
+                'requests': requests,
+                'file_size': file_size,
+                'redis': redis,
+            }
+
+
+def scenario_key(result):
+    # downloads have no parser.
+    if result['parser'] is None:
+        return "{backend}/{mode}/c{concurrency}".format(**result)
+    return "{backend}/{mode}/{parser}/c{concurrency}".format(**result)
+
+
+def run(scenario_list, latency=0, size=10240, error_rate=0, echo=print):
+    server = BenchServer(latency=latency, size=size,
+                         error_rate=error_rate).start()
+    results = []
+    try:
+        for scenario in scenario_list:
+            queue = multiprocessing.Queue()
+            worker = multiprocessing.Process(
+                target=run_scenario, args=(server.url, scenario, queue))
+            worker.start()
+            worker.join()
+            if worker.exitcode:
+                echo("{} crashed".format(scenario_key(scenario)))
+                continue
+            result = queue.get()
+            results.append(result)
+            echo(format_result(result))
+    finally:
+        server.stop()
+    return {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'latency': latency,
+            'size': size,
+            'error_rate': error_rate,
+        },
+        'results': results,
+    }
+
+
+def _ms(seconds):
+    return "{:.1f}ms".format(seconds * 1000) if seconds is not None else "-"
+
+
+def format_result(result):
+    return ("{:<32} {:>9.1f} req/s  p50 {:>8}  p99 {:>8}  "
+            "rss {:>6.1f}MB  cpu {:>6}/req".format(
+                scenario_key(result), result['requests_per_second'],
+                _ms(result['latency_p50']), _ms(result['latency_p99']),
+                result['peak_rss_mb'],
+                _ms(result['cpu_ms_per_request'] and
+                    result['cpu_ms_per_request'] / 1000)))
+
+
+def compare(report, baseline):
+    """Lines comparing the requests/s of report with a baseline report."""
+    previous = {scenario_key(result): result
+                for result in baseline['results']}
+    for result in report['results']:
+        key = scenario_key(result)
+        old = previous.get(key)
+        if old is None or not old['requests_per_second']:
+            continue
+        change = result['requests_per_second'] / \
+            old['requests_per_second'] - 1
+        yield "{:<32} {:>9.1f} -> {:>9.1f} req/s ({:+.1%})".format(
+            key, old['requests_per_second'],
+            result['requests_per_second'], change)
+
+
+def save(report, path):
+    with open(path, 'w') as fd:
+        json.dump(report, fd, indent=2, sort_keys=True)
+
+
+def load(path):
+    with open(path) as fd:
+        return json.load(fd)
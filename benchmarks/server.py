@@ -0,0 +1,212 @@
+import asyncio
+import random
+import threading
+from aiohttp import web, ClientSession
+
+
+CONTENT_TYPES = {
+    'html': 'text/html',
+    'json': 'application/json',
+    'xml': 'application/xml',
+}
+
+FILE_CHUNK_SIZE = 65536
+
+# not forwarded by the proxy, the body is sent again whole.
+HOP_HEADERS = ('host', 'connection', 'keep-alive', 'proxy-connection',
+               'proxy-authorization', 'transfer-encoding', 'content-length')
+
+
+def make_body(kind, size):
+    """A realistic page of about size bytes: items with a link each."""
+    items = []
+    length = 0
+    while length < size:
+        index = len(items)
+        if kind == 'html':
+            item = ('<div class="item"><a href="/html/{0}">Item {0}</a>'
+                    '<p>Lorem ipsum dolor sit amet, consectetur.</p>'
+                    '</div>').format(index)
+        elif kind == 'json':
+            item = ('{{"id": {0}, "url": "/json/{0}", "title": "Item {0}",'
+                    ' "tags": ["lorem", "ipsum"]}}').format(index)
+        else:
+            item = ('<item id="{0}"><link>/xml/{0}</link>'
+                    '<title>Item {0}</title></item>').format(index)
+        items.append(item)
+        length += len(item)
+    if kind == 'html':
+        return ('<html><head><title>Bench</title></head><body>{}'
+                '</body></html>').format("".join(items)).encode()
+    if kind == 'json':
+        return "[{}]".format(", ".join(items)).encode()
+    return '<?xml version="1.0"?><items>{}</items>'.format(
+        "".join(items)).encode()
+
+
+class _BackgroundServer(object):
+    """aiohttp app served from a background thread, with its own loop."""
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return "http://{}:{}".format(self.host, self.port)
+
+    def _app(self):
+        raise NotImplementedError
+
+    async def _start(self):
+        self._runner = web.AppRunner(self._app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def _cleanup(self):
+        await self._runner.cleanup()
+
+    def start(self):
+        """Serve from a background thread, with its own loop."""
+        started = threading.Event()
+
+        def serve():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self._start())
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self._cleanup())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=serve, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+class BenchServer(_BackgroundServer):
+    """Local stand-in http server for the benchmarks.
+
+    /{html,json,xml}/{id} serve pages of size bytes after latency seconds,
+    failing with 503 at error_rate. /file/{size} serves a large file with
+    ETag and Range support. Query parameters override latency, size and
+    error_rate per request.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0, size=10240,
+                 error_rate=0):
+        super(BenchServer, self).__init__(host, port)
+        self.latency = latency
+        self.size = size
+        self.error_rate = error_rate
+        self._bodies = {}
+
+    def _body(self, kind, size):
+        body = self._bodies.get((kind, size))
+        if body is None:
+            body = self._bodies[(kind, size)] = make_body(kind, size)
+        return body
+
+    async def page(self, request):
+        query = request.query
+        latency = float(query.get('latency', self.latency))
+        if latency:
+            await asyncio.sleep(latency)
+        if random.random() < float(query.get('error_rate', self.error_rate)):
+            return web.Response(status=503)
+        kind = request.match_info['kind']
+        return web.Response(
+            body=self._body(kind, int(query.get('size', self.size))),
+            content_type=CONTENT_TYPES[kind])
+
+    async def file(self, request):
+        size = int(request.match_info['size'])
+        start, end, status = 0, size - 1, 200
+        ranges = request.headers.get('Range')
+        if ranges and ranges.startswith('bytes='):
+            first, _, last = ranges[6:].partition('-')
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+            status = 206
+        if start >= size:
+            return web.Response(status=416)
+        response = web.StreamResponse(status=status, headers={
+            'Accept-Ranges': 'bytes',
+            'Content-Type': 'application/octet-stream',
+            'Content-Length': str(end + 1 - start),
+            'ETag': '"{}"'.format(size),
+        })
+        if status == 206:
+            response.headers['Content-Range'] = 'bytes {}-{}/{}'.format(
+                start, end, size)
+        await response.prepare(request)
+        chunk = bytes(range(256)) * (FILE_CHUNK_SIZE // 256)
+        position = start
+        while position <= end:
+            length = min(FILE_CHUNK_SIZE, end + 1 - position)
+            await response.write(chunk[:length])
+            position += length
+        return response
+
+    def _app(self):
+        app = web.Application()
+        app.router.add_get('/{kind:html|json|xml}/{id}', self.page)
+        app.router.add_get('/file/{size:\\d+}', self.file)
+        return app
+
+
+class BenchProxy(_BackgroundServer):
+    """Local stand-in http proxy, for ProxyPool runs.
+
+    Forwards plain http requests(sent in absolute form, as aiohttp does
+    through a proxy) after latency seconds, answering 502 instead at
+    error_rate, or always while dead is set.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0, error_rate=0):
+        super(BenchProxy, self).__init__(host, port)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.dead = False
+        self.requests = 0
+        self._session = None
+
+    async def forward(self, request):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.dead or random.random() < self.error_rate:
+            return web.Response(status=502)
+        headers = {name: value for name, value in request.headers.items()
+                   if name.lower() not in HOP_HEADERS}
+        async with self._session.request(
+                request.method, str(request.url), headers=headers,
+                data=await request.read(), allow_redirects=False) as response:
+            body = await response.read()
+            headers = {name: value for name, value in response.headers.items()
+                       if name.lower() not in HOP_HEADERS}
+            return web.Response(status=response.status, body=body,
+                                headers=headers)
+
+    def _app(self):
+        app = web.Application()
+        app.router.add_route('*', '/{path:.*}', self.forward)
+        return app
+
+    async def _start(self):
+        self._session = ClientSession(auto_decompress=False)
+        await super(BenchProxy, self)._start()
+
+    async def _cleanup(self):
+        await super(BenchProxy, self)._cleanup()
+        await self._session.close()
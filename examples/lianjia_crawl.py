@@ -1,5 +1,14 @@
-from aiocrawler import AioCrawler
-from aiocrawler.request import random_navigator_headers
+from aiocrawler import AioCrawler, Schema, Field, Css, ItemPipeline, \
+    JsonLinesSink, HeaderProfilePool
+
+
+# compiled once, evaluated on every list page.
+HOUSES = Schema({
+    'title': Field('div[2]/h2/a/text()', process=str.strip),
+    'url': Field('div[2]/h2/a/@href'),
+    'price': Field(Css('.price .num::text')),
+    'tags': Field(Css('.view-label span::text'), many=True),
+}, items='//*[@id="house-lst"]/li')
 
 
 class LianjiaCrawler(AioCrawler):
@@ -9,28 +18,17 @@ class LianjiaCrawler(AioCrawler):
         for count in range(1, 100)
     )
     timeout = 30
-    headers = random_navigator_headers
+    # 20 browser profiles, one per host, generated once.
+    headers = HeaderProfilePool(size=20, sticky='host')
+    item_pipeline = ItemPipeline(sinks=[JsonLinesSink("houses.jsonl")])
 
     def on_start(self):
         self.get(self.urls, parser=self.parse, sleep=0.2)
 
     @staticmethod
     def parse(response):
-        """
-        json:
-        'content_type', 'charset', 'method', 'request_info', 'url',
-        'status', 'cookies', 'headers', 'raw_headers', 'json', 'type'
-        html:
-        'content_type', 'charset', 'method', 'request_info', 'url', 'status',
-        'cookies', 'headers', 'raw_headers', 'text', 'e_doc', 'p_doc', 'type',
-        xpath(), selector()
-        """
-        print(response.request_info)
-        houses = response.xpath('//*[@id="house-lst"]/li')
-        for index, house in enumerate(houses):
-            title = house.xpath(
-                '//li[{}]/div[2]/h2/a/text()'.format(index+1))[0]
-            print("URL:{}, Title:{}".format(response.url, title))
+        # one dict per house, written to houses.jsonl.
+        return HOUSES.extract(response)
 
 
 if __name__ == "__main__":
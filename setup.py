@@ -12,18 +12,25 @@ with open(os.path.join(os.path.dirname(
 install_requires = [
     'aiohttp',
     'aiofiles',
-    'async_timeout',
+    'async_timeout<4',
     'httptools',
     "lxml",
     "pyquery",
+    "cssselect",
     'uvloop',
     'click',
     'ujson',
     'user_agent',
-    'aioredis==1.0.0b2',
+    'aioredis>=1.0,<2',
     'umsgpack'
 ]
 
+# pip install -e .[test], redislite brings a redis-server for the tests.
+tests_require = [
+    'pytest',
+    'redislite',
+]
+
 if sys.platform.startswith("win"):
     install_requires.remove("uvloop")
 
@@ -50,7 +57,12 @@ setup(
     ],
     keywords='scrapy crawler asyncio uvloop',
     install_requires=install_requires,
+    extras_require={'test': tests_require},
     license='MIT',
-    packages=find_packages(exclude=['docs', 'examples', 'tests']),
+    packages=find_packages(
+        exclude=['docs', 'examples', 'tests', 'benchmarks', 'benchmarks.*']),
     include_package_data=True,
+    entry_points={
+        'console_scripts': ['aiocrawler=aiocrawler.cmdline:main'],
+    },
 )
@@ -0,0 +1,59 @@
+import codecs
+import threading
+from aiocrawler.responses import HtmlResponse, JsonResponse
+from aiocrawler.responses import charset as charsets
+from aiocrawler.responses.responses import _html_parser
+
+
+class RawResponse(object):
+    content_type = 'text/html'
+
+    def __init__(self, url, charset=None):
+        self.url = url
+        self.charset = charset
+
+
+def html(url, body, charset=None):
+    return HtmlResponse(RawResponse(url, charset), body)
+
+
+def test_declared_charsets():
+    body = 'caf\xe9'.encode('latin-1')
+    response = html('http://a.test/', body, 'ISO-8859-1')
+    assert response.charset == 'iso8859-1'
+    assert response.text == 'caf\xe9'
+    assert html('http://b.test/', codecs.BOM_UTF8 + b'x').charset == \
+        'utf-8'
+    meta = b'<meta charset="koi8-r"><p>\xc1</p>'
+    response = html('http://c.test/', meta)
+    assert response.charset == 'koi8-r'
+    assert response.text.endswith('а</p>')
+
+
+def test_host_charset_is_learned_from_non_ascii_pages():
+    # an ascii page tells nothing of its host.
+    html('http://learn.test/1', b'<p>ascii</p>').charset
+    assert charsets.learned('http://learn.test/') is None
+    html('http://learn.test/2', '<p>ж</p>'.encode('cp1251'),
+         'windows-1251').charset
+    assert html('http://learn.test/3', '<p>ж</p>'.encode('cp1251')) \
+        .charset == 'cp1251'
+
+
+def test_json_ignores_the_host_charset():
+    charsets.learn('http://json.test/', 'cp1251')
+    body = '{"name": "ж"}'.encode('utf-8')
+    response = JsonResponse(RawResponse('http://json.test/api'), body)
+    assert response.charset == 'utf-8'
+    assert response.json == {'name': 'ж'}
+    assert charsets.learned('http://json.test/') == 'cp1251'
+
+
+def test_parsers_are_per_thread():
+    parsers = []
+    thread = threading.Thread(
+        target=lambda: parsers.append(_html_parser('utf-8')))
+    thread.start()
+    thread.join()
+    assert _html_parser('utf-8') is _html_parser('utf-8')
+    assert parsers[0] is not _html_parser('utf-8')
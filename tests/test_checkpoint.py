@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import threading
+import pytest
+from aiocrawler.checkpoint import Checkpoint, LOG_FILE
+from aiocrawler.exceptions import CheckpointError
+from aiocrawler.request import Request
+
+
+def request(url, **kwargs):
+    request = Request('GET', url, parser='parse', **kwargs)
+    request.host = 'example.com'
+    return request
+
+
+def test_state_survives_reopening(tmp_path):
+    checkpoint = Checkpoint(tmp_path, compact_records=100)
+    checkpoint.open(resume=False)
+    first, second, third = (request('http://example.com/{}'.format(index))
+                            for index in range(3))
+    for each in (first, second, third):
+        checkpoint.queued(each)
+    checkpoint.done(first)
+    checkpoint.failed(third)
+    checkpoint.done(third)
+    checkpoint.flush()
+
+    state = Checkpoint(tmp_path).open()
+    assert [data['url'] for data in state.pending.values()] == \
+        ['http://example.com/1']
+    assert [data['url'] for data in state.failed.values()] == \
+        ['http://example.com/2']
+    assert set(state.seen) == {each.fingerprint()
+                               for each in (first, second, third)}
+    assert state.hosts == {'example.com': 3}
+
+
+def test_torn_record_is_ignored(tmp_path):
+    checkpoint = Checkpoint(tmp_path)
+    checkpoint.open(resume=False)
+    checkpoint.queued(request('http://example.com/a'))
+    checkpoint.flush()
+    with open(str(tmp_path / LOG_FILE), 'ab') as fd:
+        fd.write(b'\x80\x04torn')
+    state = Checkpoint(tmp_path).open()
+    assert len(state.pending) == 1
+
+
+def test_unpicklable_requests_are_left_out(tmp_path):
+    checkpoint = Checkpoint(tmp_path, compact_records=2)
+    checkpoint.open(resume=False)
+    checkpoint.queued(request('http://example.com/ok'))
+    checkpoint.queued(request('http://example.com/lock',
+                              kwargs={'data': threading.Lock()}))
+    loop = asyncio.new_event_loop()
+    try:
+        with pytest.raises(CheckpointError):
+            loop.run_until_complete(checkpoint.save(loop))
+        # and they do not break the snapshots.
+        checkpoint.queued(request('http://example.com/more'))
+        checkpoint.queued(request('http://example.com/again'))
+        loop.run_until_complete(checkpoint.save(loop))
+    finally:
+        loop.close()
+    checkpoint.close()
+    state = Checkpoint(tmp_path).open()
+    assert sorted(data['url'] for data in state.pending.values()) == [
+        'http://example.com/again', 'http://example.com/more',
+        'http://example.com/ok']
+
+
+def test_crawl_resumes_pending_requests(tmp_path):
+    pytest.importorskip('aiohttp')
+    from aiocrawler import AioCrawler
+    from benchmarks.server import BenchServer
+
+    server = BenchServer(size=256).start()
+    urls = ["{}/html/{}".format(server.url, index) for index in range(4)]
+
+    class ResumedCrawler(AioCrawler):
+        logger = logging.getLogger('ResumedCrawler')
+        checkpoint = str(tmp_path)
+        pages = None
+
+        def on_start(self):
+            self.get(urls, parser=self.parse)
+
+        def parse(self, response):
+            self.pages.append(str(response.url))
+
+    try:
+        # a crawl interrupted with two pages fetched.
+        checkpoint = Checkpoint(tmp_path)
+        checkpoint.open(resume=False)
+        for index, url in enumerate(urls):
+            queued = Request('GET', url, parser='parse')
+            queued.host = '127.0.0.1'
+            checkpoint.queued(queued)
+            if index < 2:
+                checkpoint.done(queued)
+        checkpoint.close()
+
+        crawler = ResumedCrawler(pages=[])
+        crawler.run(resume=True)
+        assert sorted(crawler.pages) == urls[2:]
+        crawler = ResumedCrawler(pages=[])
+        crawler.run(resume=True)
+        assert crawler.pages == []
+    finally:
+        server.stop()
+
+
+def test_unrestorable_parser_is_reported(tmp_path, caplog):
+    pytest.importorskip('aiohttp')
+    from aiocrawler import AioCrawler
+
+    class PlainCrawler(AioCrawler):
+        logger = logging.getLogger('PlainCrawler')
+        checkpoint = str(tmp_path)
+
+        def on_start(self):
+            pass
+
+    crawler = PlainCrawler()
+    crawler._checkpoint.open(resume=False)
+
+    def parser(response):
+        pass
+
+    with caplog.at_level(logging.WARNING, logger='PlainCrawler'):
+        for index in range(2):
+            crawler._checkpoint_queued(request(
+                'http://example.com/{}'.format(index)))
+            plain_request = request('http://example.com/l{}'.format(index))
+            plain_request.parser = parser
+            crawler._checkpoint_queued(plain_request)
+    warnings = [record for record in caplog.records
+                if 'can not be resumed' in record.getMessage()]
+    # once per parser.
+    assert len(warnings) == 1
+    crawler._close()
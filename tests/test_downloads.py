@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import os
+import pytest
+
+pytest.importorskip('aiohttp')
+
+import aiohttp  # noqa: E402
+from aiohttp import web  # noqa: E402
+from aiocrawler import AioCrawler  # noqa: E402
+from aiocrawler import downloads  # noqa: E402
+from aiocrawler.downloads import FileDownload, \
+    parse_content_range  # noqa: E402
+from benchmarks.server import _BackgroundServer  # noqa: E402
+
+BODY = os.urandom(300000)
+
+
+class FileServer(_BackgroundServer):
+    """Serves BODY at /file with Range support. shift sends every range
+    from the start of the file, cut drops the first response halfway.
+    """
+
+    def __init__(self):
+        super(FileServer, self).__init__('127.0.0.1', 0)
+        self.shift = False
+        self.cut = False
+        self.ranges = []
+
+    async def file(self, request):
+        start, end, status = 0, len(BODY) - 1, 200
+        ranges = request.headers.get('Range')
+        self.ranges.append(ranges)
+        if ranges:
+            first, _, last = ranges[6:].partition('-')
+            start, status = int(first), 206
+            if last:
+                end = int(last)
+        if self.shift:
+            start = 0
+        headers = {'Accept-Ranges': 'bytes', 'ETag': '"body"'}
+        if status == 206:
+            headers['Content-Range'] = 'bytes {}-{}/{}'.format(
+                start, end, len(BODY))
+        if request.method == 'HEAD':
+            headers['Content-Length'] = str(len(BODY))
+            return web.Response(status=status, headers=headers)
+        response = web.StreamResponse(status=status, headers=headers)
+        response.content_length = end + 1 - start
+        await response.prepare(request)
+        if self.cut:
+            self.cut = False
+            await response.write(BODY[start:start + (end + 1 - start) // 2])
+            # let the client read it first.
+            await asyncio.sleep(0.2)
+            request.transport.close()
+            return response
+        await response.write(BODY[start:end + 1])
+        return response
+
+    def _app(self):
+        app = web.Application()
+        app.router.add_route('*', '/file', self.file)
+        return app
+
+
+@pytest.fixture
+def server():
+    server = FileServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    loop.close()
+    asyncio.set_event_loop(None)
+
+
+def download(loop, server, file, **kwargs):
+    async def go():
+        async with aiohttp.ClientSession() as session:
+            return await FileDownload(
+                session, server.url + '/file', file, {}, timeout=5,
+                loop=loop, **kwargs).run()
+    return loop.run_until_complete(go())
+
+
+def test_content_range():
+    assert parse_content_range('bytes 0-99/1000') == (0, 99, 1000)
+    assert parse_content_range('bytes 10-19/*') == (10, 19, None)
+    assert parse_content_range('bytes */1000') is None
+    assert parse_content_range(None) is None
+
+
+def test_download_and_resume(loop, server, tmpdir):
+    file = str(tmpdir.join('file'))
+    assert download(loop, server, file)
+    with open(file, 'rb') as fd:
+        assert fd.read() == BODY
+    assert not os.path.exists(file + downloads.STATE_SUFFIX)
+    assert not download(loop, server, file, size=len(BODY))
+
+    # interrupted halfway, then resumed from there.
+    os.remove(file)
+    server.ranges.clear()
+    server.cut = True
+    with pytest.raises(aiohttp.ClientError):
+        download(loop, server, file)
+    part = os.path.getsize(file + downloads.PART_SUFFIX)
+    assert 0 < part < len(BODY)
+    assert download(loop, server, file)
+    assert server.ranges == [None, 'bytes={}-'.format(part)]
+    with open(file, 'rb') as fd:
+        assert fd.read() == BODY
+
+
+def test_segments(loop, server, tmpdir, monkeypatch):
+    monkeypatch.setattr(downloads, 'DOWNLOAD_MIN_SEGMENT_SIZE', 50000)
+    file = str(tmpdir.join('file'))
+    assert download(loop, server, file, segments=3)
+    assert len([each for each in server.ranges if each]) == 3
+    with open(file, 'rb') as fd:
+        assert fd.read() == BODY
+
+
+def test_shifted_range_falls_back_to_full_download(loop, server, tmpdir,
+                                                   monkeypatch):
+    monkeypatch.setattr(downloads, 'DOWNLOAD_MIN_SEGMENT_SIZE', 50000)
+    server.shift = True
+    file = str(tmpdir.join('file'))
+    assert download(loop, server, file, segments=3)
+    assert server.ranges[-1] is None
+    with open(file, 'rb') as fd:
+        assert fd.read() == BODY
+
+
+def test_crawler_retries_a_cut_download(server, tmpdir):
+    class DownloadCrawler(AioCrawler):
+        logger = logging.getLogger('DownloadCrawler')
+        retry_backoff = 0.01
+        timeout = 5
+
+        def on_start(self):
+            self.download(server.url + '/file', save_dir=str(tmpdir),
+                          filename='file')
+
+    server.cut = True
+    crawler = DownloadCrawler()
+    crawler.run()
+    assert not crawler._failed_urls
+    assert server.ranges[0] is None and server.ranges[-1].startswith(
+        'bytes=')
+    with open(str(tmpdir.join('file')), 'rb') as fd:
+        assert fd.read() == BODY
@@ -0,0 +1,74 @@
+import io
+import random
+from aiocrawler.dupefilter import canonicalize_url, request_fingerprint, \
+    MemorySeenStore, BloomSeenStore
+from aiocrawler.request import Request
+
+
+def test_canonical_urls_compare_equal():
+    assert canonicalize_url('HTTP://Example.COM:80/a?b=2&a=1#top') == \
+        canonicalize_url('http://example.com/a?a=1&b=2')
+    assert canonicalize_url('http://example.com') == 'http://example.com/'
+    assert canonicalize_url('http://example.com:8080/') == \
+        'http://example.com:8080/'
+    assert canonicalize_url('http://example.com/?a=1', {'b': 2}) == \
+        'http://example.com/?a=1&b=2'
+
+
+def test_malformed_url_is_kept():
+    assert canonicalize_url('http://example.com:80a/x') == \
+        'http://example.com:80a/x'
+    assert canonicalize_url('http://[::1/x') == 'http://[::1/x'
+    request_fingerprint('GET', 'http://example.com:80a/x')
+
+
+def test_form_bodies():
+    url = 'http://example.com/form'
+    pairs = request_fingerprint('POST', url, body=[('b', '2'), ('a', '1')])
+    assert pairs == request_fingerprint(
+        'POST', url, body={'a': '1', 'b': '2'})
+    assert pairs == request_fingerprint('POST', url, body='a=1&b=2')
+    assert pairs != request_fingerprint('POST', url, body={'a': '2'})
+    assert request_fingerprint('POST', url, body=b'raw') == \
+        request_fingerprint('POST', url, body='raw')
+
+
+def test_unreadable_bodies_are_left_out():
+    url = 'http://example.com/upload'
+    bare = request_fingerprint('POST', url)
+    assert request_fingerprint('POST', url, body=io.BytesIO(b'x')) == bare
+    assert request_fingerprint('POST', url, body=iter([b'x'])) == bare
+    assert request_fingerprint('POST', url, body=['not', 'pairs']) == bare
+
+
+def test_download_target_is_part_of_the_fingerprint():
+    url = 'http://example.com/file'
+    first = Request('GET', url, file='/tmp/a')
+    second = Request('GET', url, file='/tmp/b')
+    assert first.fingerprint() != second.fingerprint()
+    assert first.fingerprint() == Request('GET', url, file='/tmp/a') \
+        .fingerprint()
+    assert Request('GET', url).fingerprint() != first.fingerprint()
+
+
+def test_memory_seen_store():
+    store = MemorySeenStore(capacity=4)
+    fingerprints = [random.getrandbits(64) or 1 for _ in range(1000)]
+    for fingerprint in fingerprints:
+        assert store.add(fingerprint)
+    for fingerprint in fingerprints:
+        assert fingerprint in store
+        assert not store.add(fingerprint)
+    assert len(store) == len(set(fingerprints))
+
+
+def test_bloom_seen_store_stays_under_its_error_rate():
+    # seeded: the measured rate is close to the bound.
+    rand = random.Random(0)
+    store = BloomSeenStore(capacity=500, error_rate=0.01)
+    for _ in range(4000):
+        store.add(rand.getrandbits(64))
+    assert len(store._filters) > 1
+    false_positives = sum(rand.getrandbits(64) in store
+                          for _ in range(20000))
+    assert false_positives / 20000 < 0.01
@@ -0,0 +1,91 @@
+import asyncio
+import os
+import pytest
+from multidict import CIMultiDict
+from yarl import URL
+from aiocrawler.httpcache import HttpCache
+
+
+class RawResponse(object):
+    method = 'GET'
+    status = 200
+    reason = 'OK'
+
+    def __init__(self, url, headers):
+        self.url = URL(url)
+        self.headers = CIMultiDict(headers)
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    loop.close()
+    asyncio.set_event_loop(None)
+
+
+def test_store_and_get(loop, tmpdir):
+    cache = HttpCache(str(tmpdir))
+    body = b'<html>' + b'x' * 1000 + b'</html>'
+    response = RawResponse('http://example.com/', [
+        ('Content-Type', 'text/html; charset=utf-8'),
+        ('Content-Encoding', 'gzip'), ('Content-Length', '42'),
+        ('ETag', '"v1"')])
+
+    async def go():
+        await cache.store(1, response, body)
+        entry = await cache.get(1)
+        assert entry.body == body
+        assert entry.validators() == {'If-None-Match': '"v1"'}
+        cached = entry.response()
+        # the stored body is decoded already.
+        assert 'Content-Encoding' not in cached.headers
+        assert cached.headers['Content-Length'] == str(len(body))
+        assert cached.charset == 'utf-8'
+        assert await cached.read() == body
+        assert await cache.get(2) is None
+
+    loop.run_until_complete(go())
+    # reloaded from disk.
+    assert list(HttpCache(str(tmpdir))._index) == [1]
+
+
+def test_concurrent_stores_of_an_entry(loop, tmpdir):
+    cache = HttpCache(str(tmpdir))
+    response = RawResponse('http://example.com/', [])
+    bodies = [os.urandom(1 << 16) for _ in range(8)]
+
+    async def go():
+        await asyncio.gather(*[
+            cache.store(1, response, body) for body in bodies])
+        assert (await cache.get(1)).body in bodies
+
+    loop.run_until_complete(go())
+    files = [each.basename for each in tmpdir.visit() if each.isfile()]
+    assert files == ['0000000000000001']
+
+
+def test_eviction_and_broken_entries(loop, tmpdir):
+    cache = HttpCache(str(tmpdir), max_size=3000)
+    response = RawResponse('http://example.com/', [])
+
+    async def go():
+        for fingerprint in range(1, 6):
+            await cache.store(fingerprint, response, os.urandom(1000))
+        # the oldest entries went first.
+        assert 1 not in cache._index and 5 in cache._index
+        assert cache._size <= 3000
+        with open(str(cache._entry_path(5)), 'wb') as fd:
+            fd.write(b'broken')
+        assert await cache.get(5) is None
+        assert 5 not in cache._index
+
+    loop.run_until_complete(go())
+
+
+def test_leftover_tmp_files_are_removed(tmpdir):
+    tmpdir.mkdir('00').join('tmpabc.tmp').write(b'partial')
+    cache = HttpCache(str(tmpdir))
+    assert not cache._index
+    assert not tmpdir.join('00', 'tmpabc.tmp').exists()
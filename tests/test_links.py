@@ -0,0 +1,57 @@
+from aiocrawler.links import LinkExtractor
+from aiocrawler.responses import HtmlResponse
+
+
+class RawResponse(object):
+    charset = 'utf-8'
+    content_type = 'text/html'
+
+    def __init__(self, url):
+        self.url = url
+
+
+def page(html, url='http://example.com/dir/page.html'):
+    return HtmlResponse(RawResponse(url), html.encode())
+
+
+def test_links_are_absolute_canonical_and_unique():
+    response = page(
+        '<a href="b.html?y=2&x=1#top">b</a>'
+        '<a href="/c">c</a>'
+        '<a href="b.html?x=1&y=2">again</a>'
+        '<a href="#frag">same page</a>'
+        '<a href="mailto:someone@example.com">mail</a>'
+        '<a href="http://other.com/logo.png">image</a>')
+    assert response.links() == [
+        'http://example.com/dir/b.html?x=1&y=2',
+        'http://example.com/c',
+    ]
+
+
+def test_base_href_and_filters():
+    response = page(
+        '<base href="http://cdn.example.com/root/">'
+        '<a href="a">a</a>'
+        '<a href="http://www.example.com/b">b</a>'
+        '<a href="http://other.com/c">c</a>'
+        '<a href="http://example.com/private/d">d</a>')
+    assert response.links(domains='example.com', deny='/private/') == [
+        'http://cdn.example.com/root/a',
+        'http://www.example.com/b',
+    ]
+
+
+def test_restrict_xpaths():
+    response = page('<div id="nav"><a href="/nav">n</a></div>'
+                    '<div id="body"><a href="/body">b</a></div>')
+    extractor = LinkExtractor(restrict_xpaths='//div[@id="body"]')
+    assert response.links(extractor) == ['http://example.com/body']
+
+
+def test_invalid_hrefs_are_skipped():
+    response = page(
+        '<base href="http://[::1">'
+        '<a href="http://example.com:80a/x">bad port</a>'
+        '<a href="http://[::1/y">bad host</a>'
+        '<a href="/ok">ok</a>')
+    assert response.links() == ['http://example.com/ok']
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import time
+import pytest
+
+pytest.importorskip('aiohttp')
+
+from aiocrawler import AioCrawler, ProxyPool  # noqa: E402
+from benchmarks.server import BenchServer, BenchProxy  # noqa: E402
+
+
+class ProxyCrawler(AioCrawler):
+    logger = logging.getLogger('ProxyCrawler')
+    retry_backoff = 0.01
+    retry_backoff_max = 0.05
+    max_tries = 5
+    timeout = 5
+
+    # set per test.
+    urls = ()
+    pages = None
+
+    def on_start(self):
+        self.get(self.urls, parser=self.parse)
+
+    def parse(self, response):
+        self.pages.append(str(response.url))
+
+
+@pytest.fixture(scope='module')
+def server():
+    server = BenchServer(size=256).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def proxies():
+    started = [BenchProxy().start() for _ in range(3)]
+    yield started
+    for proxy in started:
+        proxy.stop()
+
+
+def crawl(server, pool, count):
+    crawler = ProxyCrawler(
+        proxies=pool, pages=[],
+        urls=["{}/html/{}".format(server.url, index)
+              for index in range(count)])
+    crawler.run()
+    return crawler
+
+
+def test_dead_proxy_is_quarantined_and_requests_retried(server, proxies):
+    good, dead, flaky = proxies
+    dead.dead = True
+    flaky.error_rate = 1
+    pool = ProxyPool([good.url, dead.url, flaky.url], max_failures=2,
+                     quarantine=60)
+    crawler = crawl(server, pool, 30)
+
+    # every failed try went through another proxy, and succeeded there.
+    assert len(crawler.pages) == 30
+    assert not crawler._failed_urls
+    assert good.requests >= 30
+    by_url = {proxy.url: proxy for proxy in pool.proxies}
+    for bad in (dead, flaky):
+        assert by_url[bad.url].quarantined_until > time.monotonic()
+        # quarantined after a few failures, not used for the whole crawl.
+        assert bad.requests < 30
+    assert [proxy.url for proxy in pool.healthy] == [good.url]
+
+
+def test_quarantine_ends_and_proxy_comes_back(server, proxies):
+    good, dead, _ = proxies
+    dead.dead = True
+    pool = ProxyPool([good.url, dead.url], max_failures=1,
+                     quarantine=0.05)
+    crawl(server, pool, 10)
+    dead.dead = False
+    time.sleep(max(pool.proxies[1].quarantined_until - time.monotonic(), 0))
+    served = dead.requests
+    crawl(server, pool, 20)
+    assert dead.requests > served
+
+
+def test_concurrency_cap(server, proxies):
+    proxy = proxies[0]
+    proxy.latency = 0.05
+    pool = ProxyPool([proxy.url], concurrency=2)
+    peak = []
+
+    def track(original=pool.acquire_nowait):
+        def acquire_nowait(exclude=None):
+            got = original(exclude)
+            peak.append(pool.proxies[0].active)
+            return got
+        return acquire_nowait
+
+    pool.acquire_nowait = track()
+    crawler = crawl(server, pool, 12)
+    assert len(crawler.pages) == 12
+    assert max(peak) <= 2
+
+
+def test_rate_cap():
+    pool = ProxyPool(['http://proxy'], rate=20)
+
+    async def acquire_all():
+        started = time.monotonic()
+        for _ in range(5):
+            pool.release(await pool.acquire())
+        return time.monotonic() - started
+
+    loop = asyncio.new_event_loop()
+    try:
+        elapsed = loop.run_until_complete(acquire_all())
+    finally:
+        loop.close()
+    # 5 requests at 20/s: the last one starts 0.2s after the first.
+    assert elapsed >= 0.19
+
+
+def test_failed_proxy_is_avoided():
+    pool = ProxyPool(['http://a', 'http://b'])
+    for _ in range(20):
+        proxy = pool.acquire_nowait(exclude='http://a')
+        assert proxy.url == 'http://b'
+        pool.release(proxy)
+    # unless the others are down.
+    pool.proxies[1].quarantined_until = time.monotonic() + 60
+    assert pool.acquire_nowait(exclude='http://a').url == 'http://a'
+
+
+def test_site_errors_are_not_blamed_on_the_proxy(server, proxies):
+    proxy = proxies[0]
+    pool = ProxyPool([proxy.url], max_failures=1)
+    crawler = ProxyCrawler(
+        proxies=pool, pages=[], max_tries=2,
+        urls=["{}/html/0?error_rate=1".format(server.url)])
+    crawler.run()
+    assert crawler._failed_urls
+    assert proxy.requests == 2
+    assert pool.proxies[0].errors == 0
+    assert pool.proxies[0].quarantined_until <= time.monotonic()
+
+
+def test_download_reports_to_the_pool(server, proxies, tmpdir):
+    good, dead, _ = proxies
+    dead.dead = True
+    pool = ProxyPool([dead.url, good.url], max_failures=1, quarantine=60)
+
+    class DownloadCrawler(ProxyCrawler):
+        def on_start(self):
+            self.download(server.url + '/file/100000',
+                          save_dir=str(tmpdir), filename='file')
+
+    crawler = DownloadCrawler(proxies=pool)
+    crawler.run()
+    assert not crawler._failed_urls
+    assert tmpdir.join('file').size() == 100000
+    by_url = {proxy.url: proxy for proxy in pool.proxies}
+    if dead.requests:
+        assert by_url[dead.url].errors == 1
+    assert by_url[good.url].errors == 0
+    assert by_url[good.url].latency > 0
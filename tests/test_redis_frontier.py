@@ -0,0 +1,260 @@
+import asyncio
+import logging
+import shutil
+import socket
+import subprocess
+import time
+import pytest
+
+pytest.importorskip('aioredis')
+
+
+def redis_server_path():
+    # the redislite package(pip install .[test]) ships a redis-server.
+    path = shutil.which('redis-server')
+    if path is None:
+        try:
+            import redislite
+        except ImportError:
+            return None
+        path = redislite.__redis_executable__
+    return path
+
+
+REDIS_SERVER = redis_server_path()
+if REDIS_SERVER is None:
+    pytest.skip("redis-server is not installed", allow_module_level=True)
+
+from aiocrawler import AioCrawler  # noqa: E402
+from aiocrawler.request import Request  # noqa: E402
+from aiocrawler.queues import AioRedisQueue, RedisScheduler  # noqa: E402
+
+
+class Parsers(object):
+    def parse(self, response):
+        pass
+
+
+PARSERS = Parsers()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope='module')
+def redis_port():
+    port = free_port()
+    server = subprocess.Popen(
+        [REDIS_SERVER, '--port', str(port), '--bind', '127.0.0.1',
+         '--save', '', '--appendonly', 'no'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 5
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.1).close()
+            break
+        except OSError:
+            if time.time() > deadline:
+                server.kill()
+                raise
+            time.sleep(0.05)
+    yield port
+    server.terminate()
+    server.wait()
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    loop.close()
+    asyncio.set_event_loop(None)
+
+
+@pytest.fixture
+def node(redis_port, loop):
+    """Makes RedisSchedulers sharing one frontier, like crawler nodes."""
+    schedulers = []
+
+    def make(**kwargs):
+        queue = AioRedisQueue('test', port=redis_port, loop=loop)
+        scheduler = RedisScheduler(queue, parsers=PARSERS, delay=0,
+                                   loop=loop, **kwargs)
+        schedulers.append(scheduler)
+        return scheduler
+
+    loop.run_until_complete(make()._queue.execute("FLUSHDB"))
+    yield make
+    for scheduler in schedulers:
+        loop.run_until_complete(scheduler.close())
+
+
+def request(index):
+    return Request('GET', 'http://host{}.test/'.format(index),
+                   parser=PARSERS.parse)
+
+
+async def flushed(scheduler):
+    if scheduler._flusher is not None:
+        await scheduler._flusher
+
+
+async def settle():
+    # acks and lease extensions run in the background.
+    await asyncio.sleep(0.05)
+
+
+def test_lease_and_ack(node, loop):
+    scheduler = node()
+    queue = scheduler._queue
+
+    async def go():
+        for index in range(3):
+            assert scheduler.put_nowait(request(index))
+        await flushed(scheduler)
+        assert await queue.qsize() == 3
+
+        leased = await scheduler.get()
+        assert leased.parser == PARSERS.parse
+        assert await queue.qsize() == 0
+        assert await queue.execute("ZCARD", scheduler._leases_key) == 3
+
+        scheduler.task_done(leased)
+        await settle()
+        assert await queue.execute(
+            "ZSCORE", scheduler._leases_key, leased.lease) is None
+        assert await queue.execute("ZCARD", scheduler._leases_key) == 2
+
+    loop.run_until_complete(go())
+
+
+def test_expired_lease_is_requeued(node, loop):
+    crashed = node(lease_timeout=0.1)
+    survivor = node()
+
+    async def go():
+        assert crashed.put_nowait(request(0))
+        await flushed(crashed)
+        lost = await crashed.get()
+        # neither renewed nor acked, as if its node had died.
+        crashed._renewer.cancel()
+        await asyncio.sleep(0.2)
+        again = await asyncio.wait_for(survivor.get(), 5)
+        assert again.url == lost.url
+        survivor.task_done(again)
+        await settle()
+        assert await survivor._remote_idle()
+
+    loop.run_until_complete(go())
+
+
+def test_dedup_push_across_nodes(node, loop):
+    first, second = node(), node()
+    queue = first._queue
+
+    async def go():
+        assert first.put_nowait(request(0))
+        assert second.put_nowait(request(0))
+        assert second.put_nowait(request(1))
+        await flushed(first)
+        await flushed(second)
+        assert await queue.qsize() == 2
+        assert await first._shared_seen.size() == 2
+        # pushed batches count as finished on the pushing node.
+        assert first._unfinished == second._unfinished == 0
+
+    loop.run_until_complete(go())
+
+
+def test_retry_keeps_its_lease(node, loop):
+    scheduler = node(lease_timeout=0.3)
+    queue = scheduler._queue
+
+    async def go():
+        assert scheduler.put_nowait(request(0))
+        await flushed(scheduler)
+        leased = await scheduler.get()
+        # retried after its lease would have expired.
+        scheduler.put_later(leased, 0.6)
+        scheduler.task_done(leased)
+        await asyncio.sleep(0.5)
+        await scheduler._requeue_expired()
+        assert await queue.qsize() == 0
+        assert await queue.execute(
+            "ZSCORE", scheduler._leases_key, leased.lease) is not None
+
+        retried = await asyncio.wait_for(scheduler.get(), 5)
+        assert retried is leased
+        # the last try acks it.
+        scheduler.task_done(retried)
+        await settle()
+        assert await queue.execute(
+            "ZSCORE", scheduler._leases_key, leased.lease) is None
+
+    loop.run_until_complete(go())
+
+
+def test_running_request_keeps_its_lease(node, loop):
+    running = node(lease_timeout=0.3)
+    other = node()
+
+    async def go():
+        assert running.put_nowait(request(0))
+        await flushed(running)
+        leased = await running.get()
+        # a long download, renewed past lease_timeout.
+        await asyncio.sleep(0.8)
+        await other._requeue_expired()
+        assert await other._queue.qsize() == 0
+        running.task_done(leased)
+        await settle()
+        assert await other._remote_idle()
+
+    loop.run_until_complete(go())
+
+
+def test_reset(node, loop):
+    scheduler = node()
+    queue = scheduler._queue
+
+    async def go():
+        assert scheduler.put_nowait(request(0))
+        await flushed(scheduler)
+        await scheduler.get()
+        await scheduler.reset()
+        assert await queue.qsize() == 0
+        assert await scheduler._shared_seen.size() == 0
+        assert await queue.execute("ZCARD", scheduler._leases_key) == 0
+
+    loop.run_until_complete(go())
+
+
+def test_crawl_runs_again(redis_port):
+    pytest.importorskip('aiohttp')
+    from benchmarks.server import BenchServer
+
+    class RedisCrawler(AioCrawler):
+        logger = logging.getLogger('RedisCrawler')
+        name = 'test-runs-again'
+        redis = {'port': redis_port}
+
+        def on_start(self):
+            self.get(["{}/html/{}".format(self.base_url, index)
+                      for index in range(5)], parser=self.parse)
+
+        def parse(self, response):
+            self.pages.append(str(response.url))
+
+    server = BenchServer(size=256).start()
+    try:
+        for _ in range(2):
+            crawler = RedisCrawler(base_url=server.url, pages=[])
+            crawler.run()
+            # not all dropped as seen by the last run.
+            assert len(crawler.pages) == 5
+    finally:
+        server.stop()
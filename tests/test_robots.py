@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import pytest
+from aiocrawler.robots import RobotsRules, RobotsCache, ALLOW_ALL
+
+ROBOTS = """
+User-agent: *
+Disallow: /private
+Allow: /private/open
+Disallow: /*.pdf$
+Crawl-delay: 2
+
+User-agent: MyBot
+Disallow: /
+Allow: /mybot
+Crawl-delay: 1000
+
+Sitemap: http://example.com/sitemap.xml
+"""
+
+
+def test_rules():
+    rules = RobotsRules(ROBOTS)
+    assert rules.allowed('http://example.com/')
+    assert not rules.allowed('http://example.com/private/x')
+    assert rules.allowed('http://example.com/private/open/x')
+    assert not rules.allowed('http://example.com/a/b.pdf')
+    assert rules.allowed('http://example.com/a/b.pdf?page=2')
+    assert rules.crawl_delay == 2
+    assert rules.sitemaps == ['http://example.com/sitemap.xml']
+
+
+def test_rules_of_an_agent():
+    rules = RobotsRules(ROBOTS, 'MyBot/2.1')
+    assert not rules.allowed('http://example.com/private/open')
+    assert rules.allowed('http://example.com/mybot/page')
+    assert rules.allowed('http://example.com/robots.txt')
+    # capped.
+    assert rules.crawl_delay == 60
+
+
+def test_cache_shares_fetches_and_allows_on_errors():
+    loop = asyncio.new_event_loop()
+    answers = {'http://a.test/robots.txt': (200, ROBOTS),
+               'http://b.test/robots.txt': (404, ""),
+               'http://c.test/robots.txt': (None, "")}
+    fetched = []
+
+    async def fetch(url):
+        fetched.append(url)
+        await asyncio.sleep(0.01)
+        return answers[url]
+
+    cache = RobotsCache(fetch, loop=loop)
+
+    async def go():
+        first, second = await asyncio.gather(
+            cache.rules('http://a.test/x'), cache.rules('http://a.test/y'))
+        assert first is second
+        assert not first.allowed('http://a.test/private')
+        assert await cache.rules('http://b.test/private') is ALLOW_ALL
+        assert await cache.rules('http://c.test/private') is ALLOW_ALL
+
+    try:
+        loop.run_until_complete(go())
+    finally:
+        loop.close()
+    assert fetched == list(answers)
+    assert cache.cached('http://a.test/z') is not None
+
+
+def test_robots_go_through_proxies_and_profiles():
+    pytest.importorskip('aiohttp')
+    from aiohttp import web
+    from aiocrawler import AioCrawler, ProxyPool
+    from aiocrawler.profiles import HeaderProfilePool
+    from benchmarks.server import BenchProxy, _BackgroundServer
+
+    class Site(_BackgroundServer):
+        agents = []
+
+        async def robots(self, request):
+            self.agents.append(request.headers.get('User-Agent'))
+            return web.Response(text="User-agent: *\nDisallow: /private\n")
+
+        async def page(self, request):
+            return web.Response(text="<html></html>",
+                                content_type='text/html')
+
+        def _app(self):
+            app = web.Application()
+            app.router.add_get('/robots.txt', self.robots)
+            app.router.add_get('/{path:.*}', self.page)
+            return app
+
+    class RobotsCrawler(AioCrawler):
+        logger = logging.getLogger('RobotsCrawler')
+        robots = True
+
+        def on_start(self):
+            self.get([self.base + '/public', self.base + '/private'],
+                     parser=self.parse)
+
+        def parse(self, response):
+            self.pages.append(response.url.path)
+
+    site = Site('127.0.0.1', 0).start()
+    proxy = BenchProxy().start()
+    try:
+        crawler = RobotsCrawler(
+            base=site.url, pages=[], proxies=ProxyPool([proxy.url]),
+            headers=HeaderProfilePool([{'User-Agent': 'Profile/1.0'}]))
+        crawler.run()
+    finally:
+        proxy.stop()
+        site.stop()
+    assert crawler.pages == ['/public']
+    assert Site.agents == ['Profile/1.0']
+    # robots.txt and the public page.
+    assert proxy.requests == 2
@@ -0,0 +1,167 @@
+import asyncio
+import pytest
+from aiocrawler.dupefilter import MemorySeenStore
+from aiocrawler.request import Request
+from aiocrawler.scheduler import HostScheduler, ORDER_BFS, ORDER_BEST
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    loop.close()
+    asyncio.set_event_loop(None)
+
+
+def request(url, **options):
+    return Request('GET', url, **options)
+
+
+def test_hosts_are_served_round_robin(loop):
+    scheduler = HostScheduler(concurrency_per_host=10, loop=loop)
+    for index in range(3):
+        scheduler.put_nowait(request('http://a.test/{}'.format(index)))
+    scheduler.put_nowait(request('http://b.test/0'))
+    scheduler.put_nowait(request('http://c.test/0'))
+
+    async def go():
+        return [(await scheduler.get()).host for _ in range(5)]
+
+    assert loop.run_until_complete(go()) == \
+        ['a.test', 'b.test', 'c.test', 'a.test', 'a.test']
+    assert scheduler.in_flight() == 5
+
+
+def test_host_concurrency_and_delay(loop):
+    scheduler = HostScheduler(concurrency_per_host=1, delay=0.1, loop=loop)
+    for index in range(2):
+        scheduler.put_nowait(request('http://a.test/{}'.format(index)))
+    scheduler.put_nowait(request('http://b.test/0'))
+
+    async def go():
+        first = await scheduler.get()
+        assert (await scheduler.get()).host == 'b.test'
+        # the slot of a.test is held, nothing else is ready.
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(scheduler.get(), 0.2)
+        started = loop.time()
+        scheduler.task_done(first)
+        second = await scheduler.get()
+        assert second.host == 'a.test'
+        return loop.time() - started
+
+    # released after the delay was over already.
+    assert loop.run_until_complete(go()) < 0.05
+
+
+def test_delay_between_starts(loop):
+    scheduler = HostScheduler(concurrency_per_host=2, delay=0.1, loop=loop)
+    for index in range(2):
+        scheduler.put_nowait(request('http://a.test/{}'.format(index)))
+
+    async def go():
+        await scheduler.get()
+        started = loop.time()
+        await scheduler.get()
+        return loop.time() - started
+
+    assert loop.run_until_complete(go()) >= 0.09
+
+
+def test_dedup_depth_and_budget(loop):
+    scheduler = HostScheduler(seen=MemorySeenStore(), max_depth=1,
+                              host_budget=2, loop=loop)
+    assert scheduler.put_nowait(request('http://a.test/0'))
+    assert not scheduler.put_nowait(request('http://a.test/0'))
+    assert not scheduler.put_nowait(request('http://a.test/1', depth=2))
+    assert scheduler.put_nowait(request('http://a.test/1', depth=1))
+    assert not scheduler.put_nowait(request('http://a.test/2'))
+    assert scheduler.put_nowait(request('http://b.test/0'))
+    assert scheduler.qsize() == 3
+
+
+@pytest.mark.parametrize('order, expected', [
+    (None, ['2', '1', '0']),
+    (ORDER_BFS, ['0', '1', '2']),
+    (ORDER_BEST, ['1', '0', '2']),
+])
+def test_orders(loop, order, expected):
+    kwargs = {'order': order} if order else {}
+    scheduler = HostScheduler(concurrency_per_host=10, loop=loop, **kwargs)
+    for index, priority in enumerate((1, 5, 0)):
+        scheduler.put_nowait(request('http://a.test/{}'.format(index),
+                                     priority=priority))
+
+    async def go():
+        return [(await scheduler.get()).url[-1] for _ in range(3)]
+
+    assert loop.run_until_complete(go()) == expected
+
+
+def test_unknown_order(loop):
+    with pytest.raises(ValueError):
+        HostScheduler(order='random', loop=loop)
+
+
+def test_retry_waits_out_of_the_slots(loop):
+    scheduler = HostScheduler(concurrency_per_host=1, loop=loop)
+    scheduler.put_nowait(request('http://a.test/0'))
+    scheduler.put_nowait(request('http://a.test/1'))
+
+    async def go():
+        failed = await scheduler.get()
+        scheduler.put_later(failed, 0.1)
+        scheduler.task_done(failed)
+        # the other request does not wait for the retry.
+        other = await asyncio.wait_for(scheduler.get(), 0.05)
+        scheduler.task_done(other)
+        assert scheduler.delayed_size() == 1
+        again = await scheduler.get()
+        assert again is failed
+        scheduler.task_done(again)
+        await asyncio.wait_for(scheduler.join(), 1)
+
+    loop.run_until_complete(go())
+
+
+def test_sources_are_pulled_lazily(loop):
+    scheduler = HostScheduler(concurrency_per_host=100, max_size=10,
+                              loop=loop)
+    pulled = []
+
+    def urls():
+        for index in range(1000):
+            pulled.append(index)
+            yield 'http://a.test/{}'.format(index)
+
+    async def more_urls():
+        for index in range(5):
+            yield request('http://b.test/{}'.format(index), depth=3)
+
+    template = request(None, priority=7)
+    scheduler.add_source(urls(), template)
+    scheduler.add_source(more_urls(), template)
+
+    async def go():
+        first = await scheduler.get()
+        assert first.priority == 7
+        # filled up to max_size, not the whole generator.
+        assert len(pulled) <= 10
+        scheduler.task_done(first)
+        done = 1
+        hosts = set()
+        while True:
+            try:
+                each = await asyncio.wait_for(scheduler.get(), 0.1)
+            except asyncio.TimeoutError:
+                break
+            hosts.add(each.host)
+            if each.host == 'b.test':
+                assert each.depth == 3 and each.priority == 0
+            scheduler.task_done(each)
+            done += 1
+        await asyncio.wait_for(scheduler.join(), 1)
+        return done, hosts
+
+    assert loop.run_until_complete(go()) == (1005, {'a.test', 'b.test'})
@@ -0,0 +1,181 @@
+import asyncio
+import gzip
+import logging
+from datetime import date, datetime
+import pytest
+
+pytest.importorskip('aiohttp')
+
+import aiohttp  # noqa: E402
+from aiocrawler.sitemaps import SitemapUrls, parse_lastmod  # noqa: E402
+
+INDEX = b"""<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <sitemap><loc>http://site.test/old.xml</loc>
+    <lastmod>2001-01-01</lastmod></sitemap>
+  <sitemap><loc>http://site.test/pages.xml.gz</loc></sitemap>
+  <sitemap><loc>http://site.test/index.xml</loc></sitemap>
+</sitemapindex>
+"""
+
+
+def urlset(*entries):
+    urls = "".join(
+        "<url><loc>http://site.test/{}</loc>{}</url>".format(
+            path, "<lastmod>{}</lastmod>".format(lastmod) if lastmod
+            else "")
+        for path, lastmod in entries)
+    return ('<?xml version="1.0" encoding="UTF-8"?><urlset xmlns='
+            '"http://www.sitemaps.org/schemas/sitemap/0.9">{}'
+            '</urlset>').format(urls).encode()
+
+
+class Content(object):
+    """Body stream which fails once cut bytes are read."""
+
+    def __init__(self, body, cut=None):
+        self._body = body
+        self._cut = cut
+
+    async def read(self, size):
+        if self._cut is not None and not self._cut:
+            raise aiohttp.ClientPayloadError("cut")
+        if self._cut is not None:
+            size = min(size, self._cut)
+            self._cut -= size
+        chunk, self._body = self._body[:size], self._body[size:]
+        return chunk
+
+
+class Response(object):
+    def __init__(self, body, status=200, cut=None):
+        self.status = status
+        self.content = Content(body, cut)
+        self._body = body
+
+    async def text(self):
+        return self._body.decode()
+
+    def release(self):
+        pass
+
+
+def collect(sitemaps, **kwargs):
+    loop = asyncio.new_event_loop()
+    fetched = []
+
+    async def fetch(url):
+        fetched.append(url)
+        answer = sitemaps[url]
+        if isinstance(answer, list):
+            answer = answer.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    async def go():
+        urls = []
+        async for url in SitemapUrls(
+                fetch, 'http://site.test/robots.txt', **kwargs):
+            urls.append(url)
+        return urls
+
+    try:
+        return loop.run_until_complete(go()), fetched
+    finally:
+        loop.close()
+
+
+def test_parse_lastmod():
+    assert parse_lastmod('2020-05-01') == datetime(2020, 5, 1)
+    assert parse_lastmod('2020-05-01T10:00:00+02:00') == \
+        datetime(2020, 5, 1, 8)
+    assert parse_lastmod('2020-05-01T10:00Z') == datetime(2020, 5, 1, 10)
+    assert parse_lastmod('yesterday') is None
+    assert parse_lastmod('2020-13-01') is None
+
+
+def test_index_robots_and_gzip():
+    pages = urlset(('a', '2020-01-01'), ('b', '2000-01-01'), ('c', None))
+    urls, fetched = collect({
+        'http://site.test/robots.txt': Response(
+            b"Sitemap: http://site.test/index.xml\n"),
+        'http://site.test/index.xml': Response(INDEX),
+        'http://site.test/pages.xml.gz': Response(gzip.compress(pages)),
+    }, since=date(2010, 1, 1))
+    assert urls == ['http://site.test/a', 'http://site.test/c']
+    # the old sitemap is skipped, the index is not read twice.
+    assert fetched == ['http://site.test/robots.txt',
+                       'http://site.test/index.xml',
+                       'http://site.test/pages.xml.gz']
+
+
+def test_cut_sitemap_is_resumed():
+    pages = urlset(*[(str(index), None) for index in range(200)])
+    urls, fetched = collect({
+        'http://site.test/robots.txt': Response(
+            b"Sitemap: http://site.test/pages.xml\n"),
+        'http://site.test/pages.xml': [
+            aiohttp.ClientError(), Response(pages, cut=len(pages) // 2),
+            Response(pages)],
+    }, max_tries=3)
+    assert urls == ['http://site.test/{}'.format(index)
+                    for index in range(200)]
+    assert fetched.count('http://site.test/pages.xml') == 3
+
+
+def test_failed_sitemap_gives_up(caplog):
+    with caplog.at_level(logging.ERROR):
+        urls, fetched = collect({
+            'http://site.test/robots.txt': Response(
+                b"Sitemap: http://site.test/pages.xml\n"
+                b"Sitemap: http://site.test/missing.xml\n"),
+            'http://site.test/pages.xml': [asyncio.TimeoutError()] * 2,
+            'http://site.test/missing.xml': Response(b"", status=404),
+        }, max_tries=2, logger=logging.getLogger('sitemaps'))
+    assert urls == []
+    assert len(caplog.records) == 2
+
+
+def test_sitemaps_go_through_proxies():
+    from aiohttp import web
+    from aiocrawler import AioCrawler, ProxyPool
+    from benchmarks.server import BenchProxy, _BackgroundServer
+
+    class Site(_BackgroundServer):
+        async def sitemap(self, request):
+            return web.Response(body=urlset(('page', None)).replace(
+                b'http://site.test', self.url.encode()),
+                content_type='application/xml')
+
+        async def page(self, request):
+            return web.Response(text="<html></html>",
+                                content_type='text/html')
+
+        def _app(self):
+            app = web.Application()
+            app.router.add_get('/sitemap.xml', self.sitemap)
+            app.router.add_get('/page', self.page)
+            return app
+
+    class SitemapCrawler(AioCrawler):
+        logger = logging.getLogger('SitemapCrawler')
+
+        def on_start(self):
+            self.sitemap(self.base + '/sitemap.xml', parser=self.parse)
+
+        def parse(self, response):
+            self.pages.append(response.url.path)
+
+    site = Site('127.0.0.1', 0).start()
+    proxy = BenchProxy().start()
+    try:
+        crawler = SitemapCrawler(base=site.url, pages=[],
+                                 proxies=ProxyPool([proxy.url]))
+        crawler.run()
+    finally:
+        proxy.stop()
+        site.stop()
+    assert crawler.pages == ['/page']
+    # the sitemap and the page.
+    assert proxy.requests == 2
@@ -0,0 +1,71 @@
+import logging
+import random
+import pytest
+from aiocrawler.stats import CrawlStats, Histogram, PHASE_TTFB
+
+
+def test_histogram_percentiles():
+    histogram = Histogram()
+    values = list(range(1, 100001))
+    random.shuffle(values)
+    for value in values:
+        histogram.record(value)
+    assert histogram.count == 100000
+    assert histogram.min == 1 and histogram.max == 100000
+    for p in (0.5, 0.9, 0.99):
+        assert abs(histogram.percentile(p) - p * 100000) < 0.01 * 100000
+
+    merged = Histogram()
+    merged.merge(histogram)
+    merged.merge(Histogram())
+    assert merged.percentile(0.5) == histogram.percentile(0.5)
+    assert Histogram().percentile(0.5) is None
+
+
+def test_prometheus_escapes_labels():
+    stats = CrawlStats()
+    host = 'we"ird\\host\n'
+    stats.record(host, PHASE_TTFB, 0.25)
+    stats.received(host, 10)
+    text = stats.prometheus()
+    escaped = 'host="we\\"ird\\\\host\\n"'
+    for line in text.splitlines():
+        if line.startswith('aiocrawler_phase_seconds') or \
+                line.startswith('aiocrawler_response_bytes_total'):
+            assert escaped in line, line
+    assert 'aiocrawler_phase_seconds_count{{{},phase="ttfb"}} 1'.format(
+        escaped) in text
+    assert 'aiocrawler_response_bytes_total{{{}}} 10'.format(
+        escaped) in text
+
+
+def test_streams_and_downloads_count_their_bytes(tmpdir):
+    pytest.importorskip('aiohttp')
+    from aiocrawler import AioCrawler
+    from aiocrawler.responses.stream import STREAM_JSON
+    from benchmarks.server import BenchServer
+
+    class StatsCrawler(AioCrawler):
+        logger = logging.getLogger('StatsCrawler')
+        stats = CrawlStats
+
+        def on_start(self):
+            self.get(self.base_url + '/json/0', parser=self.parse_stream,
+                     stream=STREAM_JSON)
+            self.download(self.base_url + '/file/100000',
+                          save_dir=str(tmpdir), filename='file')
+
+        async def parse_stream(self, response):
+            async for _ in response:
+                self.items += 1
+
+    server = BenchServer(size=10000).start()
+    try:
+        crawler = StatsCrawler(base_url=server.url, items=0)
+        crawler.run()
+    finally:
+        server.stop()
+    assert crawler.items > 0
+    snapshot = crawler._stats.snapshot()
+    # the json page and the file, read from the content stream.
+    assert snapshot['bytes'] >= 10000 + 100000
@@ -0,0 +1,65 @@
+import asyncio
+import pytest
+from aiocrawler.scheduler import HostScheduler
+from aiocrawler.throttle import AimdController, parse_retry_after
+
+
+@pytest.fixture
+def scheduler():
+    loop = asyncio.new_event_loop()
+    yield HostScheduler(concurrency_per_host=4, loop=loop)
+    loop.close()
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('120') == 120
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT',
+                             now=1445412470) == 10
+    assert parse_retry_after('soon') is None
+    assert parse_retry_after(None) is None
+
+
+def test_host_limit_stays_under_concurrency_per_host(scheduler):
+    controller = AimdController(max_concurrency=100)
+    controller.bind(scheduler, 10, 4)
+    for _ in range(1000):
+        controller.observe('host', 0.01)
+    assert controller.host_concurrency('host') == 4
+    assert controller.concurrency > 10
+
+    controller = AimdController(max_per_host=2)
+    controller.bind(scheduler, 10, 4)
+    for _ in range(1000):
+        controller.observe('host', 0.01)
+    assert controller.host_concurrency('host') == 2
+
+    controller = AimdController(max_per_host=8)
+    controller.bind(scheduler, 10, 4)
+    for _ in range(1000):
+        controller.observe('host', 0.01)
+    assert controller.host_concurrency('host') == 4
+
+
+def test_throttled_host_backs_off(scheduler):
+    controller = AimdController(cooldown=0)
+    controller.bind(scheduler, 10, 4)
+    controller.observe('host', 0.01, status=429)
+    assert controller.host_concurrency('host') == 2
+    assert scheduler._host_concurrency['host'] == 2
+    assert controller.concurrency == 10
+
+
+def test_idle_hosts_are_forgotten(scheduler, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('aiocrawler.throttle.time.monotonic',
+                        lambda: now[0])
+    controller = AimdController(cooldown=0, host_idle=60)
+    controller.bind(scheduler, 10, 4)
+    controller.observe('idle', 0.01, status=429)
+    assert scheduler._host_concurrency['idle'] == 2
+    now[0] += 61
+    controller.observe('busy', 0.01)
+    assert 'idle' not in controller._hosts
+    assert 'idle' not in scheduler._host_concurrency
+    assert controller.host_concurrency('idle') == 4
+    assert 'busy' in controller._hosts